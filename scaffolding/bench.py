@@ -0,0 +1,322 @@
+"""
+Spec-driven load generation.
+
+Requests are built from each operation's parameter and body schemas: ``default``, then ``example``,
+then the first ``enum`` value, then a placeholder for the declared type.  Auth headers come from the
+operation's first security scheme and the credentials passed to :class:`RequestFactory`.
+
+    >>> spec = Specification.from_file("v1.yaml")
+    >>> factory = RequestFactory(spec, token="tok.abc")
+    >>> report = run(factory, HttpTarget("http://localhost:8080"), duration=30, concurrency=16)
+    >>> print(format_report(report))
+"""
+import base64
+import http.client
+import itertools
+import json
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import falcon.testing
+
+from .openapi import Operation, Specification
+from .openapi.parsing import walk_path
+
+
+__all__ = [
+    "BenchRequest", "RequestFactory", "HttpTarget", "AppTarget",
+    "run", "format_report", "sample_value",
+]
+
+PLACEHOLDERS = {
+    "boolean": True,
+    "integer": 1,
+    "number": 1.0,
+    "string": "bench",
+}
+
+
+def sample_value(schema: dict, default=None):
+    """A valid value for ``schema``; ``default`` is a parameter-level default, which takes precedence"""
+    if default is not None:
+        return default
+    for key in ("default", "example"):
+        if key in schema:
+            return schema[key]
+    if schema.get("enum"):
+        return schema["enum"][0]
+    t = schema.get("type", "string")
+    if t in ("integer", "number") and "minimum" in schema:
+        return schema["minimum"]
+    if t == "string" and schema.get("minLength"):
+        return "b" * schema["minLength"]
+    if t == "array":
+        return [sample_value(schema.get("items", {}))]
+    if t == "object":
+        required = schema.get("required", [])
+        return {
+            name: sample_value(prop)
+            for name, prop in schema.get("properties", {}).items()
+            if name in required or "default" in prop or "example" in prop
+        }
+    return PLACEHOLDERS.get(t, "bench")
+
+
+class BenchRequest:
+    __slots__ = ("operation_id", "method", "path", "query", "headers", "body")
+
+    def __init__(
+            self, operation_id: str, method: str, path: str,
+            query: Dict[str, str], headers: Dict[str, str], body: Optional[bytes]) -> None:
+        self.operation_id = operation_id
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+    @property
+    def target(self) -> str:
+        if not self.query:
+            return self.path
+        return f"{self.path}?{urllib.parse.urlencode(self.query)}"
+
+
+def _to_wire(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+class RequestFactory:
+    def __init__(
+            self, spec: Specification, *,
+            username: Optional[str]=None, password: Optional[str]=None,
+            token: Optional[str]=None) -> None:
+        self.spec = spec
+        self.username = username
+        self.password = password
+        self.token = token
+
+    def build(self, operation: Operation) -> BenchRequest:
+        path = operation.path
+        query, headers, cookies = {}, {}, {}
+        for param in operation.raw["parameters"]:
+            schema = param.get("schema", {})
+            has_value = any(k in schema for k in ("default", "example", "enum")) or "default" in param
+            # OpenAPI defaults required to false, except for path parameters
+            required = param["in"] == "path" or param.get("required", False)
+            if not required and not has_value:
+                continue
+            value = _to_wire(sample_value(schema, param.get("default")))
+            loc, name = param["in"], param["name"]
+            if loc == "path":
+                path = path.replace(f"{{{name}}}", urllib.parse.quote(value, safe=""))
+            elif loc == "query":
+                query[name] = value
+            elif loc == "header":
+                headers[name] = value
+            elif loc == "cookie":
+                cookies[name] = value
+
+        body = None
+        body_schema = walk_path(operation.raw, "requestBody", "content", "application/json", "schema", default=None)
+        if body_schema is not None:
+            body = json.dumps(sample_value(body_schema)).encode()
+            headers["Content-Type"] = "application/json"
+
+        schemas = operation.security_schemas
+        if schemas and schemas[0]:
+            self._authenticate(schemas[0], query, headers, cookies)
+        if cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in cookies.items())
+        return BenchRequest(operation.id, operation.verb.upper(), path, query, headers, body)
+
+    def _authenticate(self, schema: dict, query: dict, headers: dict, cookies: dict) -> None:
+        t = schema["type"]
+        if t == "http" and schema["scheme"] == "basic":
+            raw = f"{self.username or 'bench'}:{self.password or 'bench'}".encode()
+            headers["Authorization"] = "Basic " + base64.b64encode(raw).decode()
+        elif t == "http" and schema["scheme"] == "bearer":
+            headers["Authorization"] = f"Bearer {self.token or 'bench'}"
+        elif t == "apiKey":
+            name, loc = schema["name"], schema.get("in", schema.get("loc"))
+            {"header": headers, "query": query, "cookie": cookies}[loc][name] = self.token or "bench"
+
+    def build_all(self, operation_ids: Iterable[str]=()) -> List[BenchRequest]:
+        operation_ids = set(operation_ids)
+        operations = sorted(self.spec.operations, key=lambda o: o.id)
+        return [
+            self.build(o) for o in operations
+            if not operation_ids or o.id in operation_ids
+        ]
+
+
+class HttpTarget:
+    """Sends requests to a running server over one keep-alive connection per thread"""
+    def __init__(self, base_url: str, timeout: float=30.0) -> None:
+        url = urllib.parse.urlsplit(base_url)
+        self.https = url.scheme == "https"
+        self.netloc = url.netloc
+        self.prefix = url.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = self._local.conn = cls(self.netloc, timeout=self.timeout)
+        return conn
+
+    def send(self, request: BenchRequest) -> int:
+        conn = self._connection()
+        try:
+            conn.request(request.method, self.prefix + request.target, body=request.body, headers=request.headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+
+
+class AppTarget:
+    """Calls a WSGI app in-process, without a socket.  ``environ`` is added to each request's WSGI environ."""
+    def __init__(self, app, environ: Optional[dict]=None) -> None:
+        self.app = app
+        self.environ = environ or {}
+
+    def send(self, request: BenchRequest) -> int:
+        environ = falcon.testing.create_environ(
+            path=request.path,
+            query_string=urllib.parse.urlencode(request.query),
+            method=request.method,
+            headers=request.headers,
+            body=request.body or b"")
+        environ.update(self.environ)
+        status = []
+
+        def start_response(line, headers, exc_info=None):
+            status.append(line)
+        for _ in self.app(environ, start_response):
+            pass
+        return int(status[0][:3])
+
+
+def _percentile(ordered: List[float], p: float) -> float:
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run(
+        factory: RequestFactory, target, *,
+        duration: float=10.0,
+        concurrency: int=8,
+        rate: Optional[float]=None,
+        operation_ids: Iterable[str]=()) -> dict:
+    """Round-robins the spec's operations from ``concurrency`` threads for ``duration`` seconds.
+
+    With ``rate``, requests are paced to that many per second across all threads.
+    """
+    requests = factory.build_all(operation_ids)
+    if not requests:
+        raise RuntimeError("no operations to benchmark")
+    cycle = itertools.cycle(requests)
+    lock = threading.Lock()
+    latencies = {r.operation_id: [] for r in requests}  # type: Dict[str, List[float]]
+    statuses = {r.operation_id: Counter() for r in requests}  # type: Dict[str, Counter]
+    interval = 1.0 / rate if rate else 0.0
+    start = time.perf_counter()
+    deadline = start + duration
+    next_slot = [start]
+
+    def work() -> None:
+        # recorded per thread and merged at the end, so the counters aren't shared while running
+        local_latencies = {r.operation_id: [] for r in requests}  # type: Dict[str, List[float]]
+        local_statuses = {r.operation_id: Counter() for r in requests}  # type: Dict[str, Counter]
+        try:
+            send_until(local_latencies, local_statuses)
+        finally:
+            with lock:
+                for operation_id, samples in local_latencies.items():
+                    latencies[operation_id].extend(samples)
+                    statuses[operation_id].update(local_statuses[operation_id])
+
+    def send_until(latencies: Dict[str, List[float]], statuses: Dict[str, Counter]) -> None:
+        while True:
+            with lock:
+                request = next(cycle)
+                if interval:
+                    slot = max(next_slot[0], time.perf_counter())
+                    next_slot[0] = slot + interval
+            if interval:
+                delay = slot - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            sent = time.perf_counter()
+            if sent >= deadline:
+                return
+            try:
+                status = str(target.send(request))
+            except Exception as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - sent
+            latencies[request.operation_id].append(elapsed)
+            statuses[request.operation_id][status] += 1
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    operations = {}
+    for operation_id, samples in latencies.items():
+        samples.sort()
+        operations[operation_id] = {
+            "requests": len(samples),
+            "throughput": len(samples) / elapsed,
+            "statuses": dict(statuses[operation_id]),
+            "latency": {
+                "mean": sum(samples) / len(samples) if samples else 0.0,
+                "p50": _percentile(samples, 50),
+                "p90": _percentile(samples, 90),
+                "p99": _percentile(samples, 99),
+                "max": samples[-1] if samples else 0.0,
+            },
+        }
+    total = sum(o["requests"] for o in operations.values())
+    return {
+        "duration": elapsed,
+        "concurrency": concurrency,
+        "rate": rate,
+        "requests": total,
+        "throughput": total / elapsed,
+        "operations": operations,
+    }
+
+
+def format_report(report: dict) -> str:
+    header = ("operation", "reqs", "req/s", "p50 ms", "p90 ms", "p99 ms", "max ms", "statuses")
+    rows = []  # type: List[Tuple[str, ...]]
+    for operation_id, o in sorted(report["operations"].items()):
+        latency = o["latency"]
+        rows.append((
+            operation_id, str(o["requests"]), f"{o['throughput']:.1f}",
+            *(f"{latency[k] * 1000:.2f}" for k in ("p50", "p90", "p99", "max")),
+            " ".join(f"{k}:{v}" for k, v in sorted(o["statuses"].items())),
+        ))
+    widths = [max(len(row[i]) for row in [header, *rows]) for i in range(len(header))]
+    lines = ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in [header, *rows]]
+    lines.append(
+        f"\n{report['requests']} requests in {report['duration']:.1f}s "
+        f"({report['throughput']:.1f} req/s, concurrency {report['concurrency']})")
+    return "\n".join(lines)
@@ -1,7 +1,10 @@
+import importlib
+import json
+
 import click
 
 from .openapi import Specification
-from .openapi.codegen import generate_resources
+from .openapi.codegen import ModelBackend, generate_aot, generate_models, generate_package, generate_resources
 
 
 @click.group()
@@ -12,6 +15,61 @@ def cli():
 @cli.command("generate-stubs")
 @click.option("--spec", type=click.Path(exists=True, dir_okay=False))
 @click.option("--out", type=click.Path(dir_okay=False))
-def generate_stubs(spec, out):
+@click.option("--out-dir", type=click.Path(file_okay=False), help="write one module per tag, skipping unchanged tags")
+@click.option("--workers", type=int, help="processes used to render --out-dir modules [default: cpu count]")
+@click.option("--force", is_flag=True, help="regenerate every --out-dir module")
+@click.option("--aot", is_flag=True, help="compile routing, validation and auth into a standalone module")
+def generate_stubs(spec, out, out_dir, workers, force, aot):
+    if bool(out) == bool(out_dir):
+        raise click.UsageError("provide exactly one of --out or --out-dir")
+    if out_dir and aot:
+        raise click.UsageError("--aot writes a single module; use --out")
+    spec = Specification.from_file(spec)
+    if out_dir:
+        written = generate_package(spec, out_dir, workers=workers, force=force)
+        click.echo(f"wrote {len(written)} files")
+    elif aot:
+        generate_aot(spec, out)
+    else:
+        generate_resources(spec, out)
+
+
+@cli.command("generate-models")
+@click.option("--spec", type=click.Path(exists=True, dir_okay=False))
+@click.option("--out", type=click.Path(dir_okay=False))
+@click.option("--backend", type=click.Choice(ModelBackend.backends()), default="dto", show_default=True)
+def generate_models_(spec, out, backend):
+    spec = Specification.from_file(spec)
+    generate_models(spec, backend, out)
+
+
+@cli.command("bench")
+@click.option("--spec", type=click.Path(exists=True, dir_okay=False), required=True)
+@click.option("--url", help="base url of a running service, eg. http://localhost:8080")
+@click.option("--app", help="module:attribute of a WSGI app to call in-process")
+@click.option("--duration", type=float, default=10.0, show_default=True)
+@click.option("--concurrency", type=int, default=8, show_default=True)
+@click.option("--rate", type=float, help="target requests per second across all threads")
+@click.option("--operation", "operations", multiple=True, help="only these operationIds (repeatable)")
+@click.option("--username")
+@click.option("--password")
+@click.option("--token", help="bearer token or api key")
+@click.option("--json", "json_out", type=click.Path(dir_okay=False), help="also write the report as json")
+def bench(spec, url, app, duration, concurrency, rate, operations, username, password, token, json_out):
+    from . import bench as _bench
+    if bool(url) == bool(app):
+        raise click.UsageError("provide exactly one of --url or --app")
     spec = Specification.from_file(spec)
-    generate_resources(spec, out)
+    if url:
+        target = _bench.HttpTarget(url)
+    else:
+        module, _, attr = app.partition(":")
+        target = _bench.AppTarget(getattr(importlib.import_module(module), attr or "api"))
+    factory = _bench.RequestFactory(spec, username=username, password=password, token=token)
+    report = _bench.run(
+        factory, target,
+        duration=duration, concurrency=concurrency, rate=rate, operation_ids=operations)
+    click.echo(_bench.format_report(report))
+    if json_out:
+        with open(json_out, "wt") as out:
+            json.dump(report, out, indent=2, sort_keys=True)
@@ -1,9 +1,13 @@
 import enum
+import json
 import logging
-from typing import Any
+import math
+from typing import Any, Callable, Dict, Optional
 
 import falcon
 
+from . import hooks
+
 
 __all__ = ["Exceptions", "install_handler"]
 logger = logging.getLogger(__name__)
@@ -14,6 +18,8 @@ class _ErrorCode(enum.Enum):
     NotAuthenticated = (401, falcon.status.HTTP_401, "NotAuthenticated")
     InvalidParameter = (400, falcon.status.HTTP_400, "InvalidParameter")
     MissingParameter = (400, falcon.status.HTTP_400, "MissingParameter")
+    Conflict = (409, falcon.status.HTTP_409, "Conflict")
+    TooManyRequests = (429, falcon.status.HTTP_429, "TooManyRequests")
     InternalError = (500, falcon.status.HTTP_500, "InternalError")
 
     def __init__(self, http_status_code: int, http_status_line: str, id: str) -> None:
@@ -21,24 +27,64 @@ class _ErrorCode(enum.Enum):
         self.http_status_line = http_status_line
         self.id = id
 
-    def new(self, message: str) -> "_StructuredError":
-        return _StructuredError(self, message)
+    def new(self, message: str, headers: Optional[Dict[str, str]]=None) -> "_StructuredError":
+        return _StructuredError(self, message, headers=headers)
+
+    def fixed(self, message: str) -> Callable[[], "_StructuredError"]:
+        """Returns a factory for an error whose body is serialized once, up front"""
+        body = _serialize(self, message)
+
+        def new() -> _StructuredError:
+            return _StructuredError(self, message, body)
+        return new
+
+
+def _serialize(code: _ErrorCode, message: str) -> bytes:
+    return json.dumps({"code": code.id, "message": message}).encode()
 
 
 class _StructuredError(Exception):
-    def __init__(self, code: _ErrorCode, message: str):
+    """Raise a new instance each time; a shared instance would collect the traceback of every raise.
+
+    The body is only serialized when the error is handled, or once up front for errors from ``_ErrorCode.fixed``.
+    """
+    def __init__(
+            self, code: _ErrorCode, message: str,
+            body: Optional[bytes]=None, headers: Optional[Dict[str, str]]=None) -> None:
         self.code = code
         self.message = message
+        self._body = body
+        self.headers = headers
+
+    @property
+    def body(self) -> bytes:
+        if self._body is None:
+            self._body = _serialize(self.code, self.message)
+        return self._body
 
     @staticmethod
     def handle(ex: "_StructuredError", req: falcon.Request, resp: falcon.Response, *_, **__) -> None:
-        log = logger.error if ex.code.http_status_code == 500 else logger.info
-        log(f"{ex.code.http_status_code} {ex.code.id} during {req.method} {req.path}")
-        resp.status = ex.code.http_status_line
-        resp.media = {
-            "code": ex.code.id,
-            "message": ex.message
-        }
+        code = ex.code
+        log = logger.error if code.http_status_code == 500 else logger.info
+        log("%d %s during %s %s", code.http_status_code, code.id, req.method, req.path)
+        if hooks.error_raised.enabled:
+            hooks.error_raised.emit(req, ex)
+        resp.status = code.http_status_line
+        resp.content_type = falcon.MEDIA_JSON
+        resp.data = ex.body
+        if ex.headers:
+            resp.set_headers(ex.headers)
+        # the response is built; release the frames this raise captured
+        ex.__traceback__ = ex.__context__ = ex.__cause__ = None
+
+
+_INVALID_LOGIN = _ErrorCode.NotAuthenticated.fixed("username or password are invalid")
+_INVALID_TOKEN = _ErrorCode.NotAuthenticated.fixed("api token is invalid")
+_MALFORMED_AUTHENTICATION = _ErrorCode.NotAuthenticated.fixed("authentication mechanism is malformed")
+_MISSING_AUTHENTICATION = _ErrorCode.NotAuthenticated.fixed("authentication is missing")
+_REQUEST_IN_PROGRESS = _ErrorCode.Conflict.fixed("a request with this Idempotency-Key is still in progress")
+_NOT_FOUND = _ErrorCode.NotFound.fixed("endpoint or method not recognized")
+_INTERNAL_ERROR = _ErrorCode.InternalError.fixed("An internal error occurred")
 
 
 class Exceptions:
@@ -66,33 +112,37 @@ class Exceptions:
 
     @staticmethod
     def invalid_login() -> Exception:
-        message = "username or password are invalid"
-        return _ErrorCode.NotAuthenticated.new(message)
+        return _INVALID_LOGIN()
 
     @staticmethod
     def invalid_token() -> Exception:
-        message = "api token is invalid"
-        return _ErrorCode.NotAuthenticated.new(message)
+        return _INVALID_TOKEN()
 
     @staticmethod
     def malformed_authentication() -> Exception:
-        message = "authentication mechanism is malformed"
-        return _ErrorCode.NotAuthenticated.new(message)
+        return _MALFORMED_AUTHENTICATION()
 
     @staticmethod
     def missing_authentication() -> Exception:
-        message = "authentication is missing"
-        return _ErrorCode.NotAuthenticated.new(message)
+        return _MISSING_AUTHENTICATION()
+
+    @staticmethod
+    def too_many_requests(retry_after: float) -> Exception:
+        seconds = max(1, math.ceil(retry_after))
+        message = f"rate limit exceeded, retry in {seconds} seconds"
+        return _ErrorCode.TooManyRequests.new(message, headers={"Retry-After": str(seconds)})
+
+    @staticmethod
+    def request_in_progress() -> Exception:
+        return _REQUEST_IN_PROGRESS()
 
     @staticmethod
     def not_found() -> Exception:
-        message = "endpoint or method not recognized"
-        return _ErrorCode.NotFound.new(message)
+        return _NOT_FOUND()
 
     @staticmethod
     def internal_error() -> Exception:
-        message = "An internal error occurred"
-        return _ErrorCode.InternalError.new(message)
+        return _INTERNAL_ERROR()
 
 
 def install_handler(api: falcon.API) -> None:
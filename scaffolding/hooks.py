@@ -0,0 +1,113 @@
+"""
+Named instrumentation points on the request path.
+
+Call sites check ``hook.enabled`` before measuring or building a payload, so a hook
+without subscribers costs one attribute lookup::
+
+    >>> from scaffolding import hooks
+    >>> def trace(req, operation, elapsed):
+    ...     tracer.record(operation.id, elapsed)
+    >>> hooks.subscribe("validation_done", trace)
+
+Hook points and their arguments:
+
+    operation_resolved  (req, operation)
+    auth_done           (req, principal, elapsed)
+    validation_done     (req, operation, elapsed)
+    commit_done         (req, elapsed)
+    error_raised        (req, error)
+"""
+import logging
+from typing import Callable, Dict
+
+
+__all__ = [
+    "Hook", "subscribe", "unsubscribe", "get_hook", "enable_debug_logging",
+    "operation_resolved", "auth_done", "validation_done", "commit_done", "error_raised",
+]
+logger = logging.getLogger(__name__)
+
+
+class Hook:
+    __slots__ = ("name", "subscribers", "enabled")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.subscribers = ()
+        self.enabled = False
+
+    def subscribe(self, fn: Callable) -> None:
+        if fn not in self.subscribers:
+            self.subscribers += (fn,)
+        self.enabled = True
+
+    def unsubscribe(self, fn: Callable) -> None:
+        self.subscribers = tuple(s for s in self.subscribers if s != fn)
+        self.enabled = bool(self.subscribers)
+
+    def emit(self, *args, **kwargs) -> None:
+        for fn in self.subscribers:
+            # noinspection PyBroadException
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                logger.exception("subscriber %r failed for hook %s", fn, self.name)
+
+    def __repr__(self):
+        return f"<Hook[{self.name}] subscribers={len(self.subscribers)}>"
+
+
+operation_resolved = Hook("operation_resolved")
+auth_done = Hook("auth_done")
+validation_done = Hook("validation_done")
+commit_done = Hook("commit_done")
+error_raised = Hook("error_raised")
+
+_hooks = {
+    hook.name: hook
+    for hook in (operation_resolved, auth_done, validation_done, commit_done, error_raised)
+}  # type: Dict[str, Hook]
+
+
+def get_hook(name: str) -> Hook:
+    return _hooks[name]
+
+
+def subscribe(name: str, fn: Callable) -> None:
+    get_hook(name).subscribe(fn)
+
+
+def unsubscribe(name: str, fn: Callable) -> None:
+    get_hook(name).unsubscribe(fn)
+
+
+def _log_operation_resolved(req, operation) -> None:
+    logger.debug("%s resolved for %s %s", operation.id, req.method, req.path)
+
+
+def _log_auth_done(req, principal, elapsed) -> None:
+    logger.debug("authenticated %s principal in %.3fms", principal["type"], elapsed * 1000)
+
+
+def _log_validation_done(req, operation, elapsed) -> None:
+    logger.debug(
+        "%s validated in %.3fms (params: %s, body: %s)",
+        operation.id, elapsed * 1000, operation.has_params, operation.has_body)
+
+
+def _log_commit_done(req, elapsed) -> None:
+    logger.debug("session for %s %s finished in %.3fms", req.method, req.path, elapsed * 1000)
+
+
+def _log_error_raised(req, error) -> None:
+    logger.debug("%s raised during %s %s: %s", error.code.id, req.method, req.path, error.message)
+
+
+def enable_debug_logging() -> None:
+    """Log every hook point at DEBUG through the ``scaffolding.hooks`` logger"""
+    logger.setLevel(logging.DEBUG)
+    operation_resolved.subscribe(_log_operation_resolved)
+    auth_done.subscribe(_log_auth_done)
+    validation_done.subscribe(_log_validation_done)
+    commit_done.subscribe(_log_commit_done)
+    error_raised.subscribe(_log_error_raised)
@@ -0,0 +1,222 @@
+"""
+Structured access and error logs that never block a request thread on I/O.
+
+Request threads append records to a bounded in-memory buffer; a background thread writes them out in batches
+as JSON lines.  When the buffer is full, records are dropped and counted instead of waiting, and the count is
+written as a ``log_dropped`` record once there's room.
+
+    >>> log = BufferedLog(sys.stderr)
+    >>> api = falcon.API(middleware=[AccessLog(log), db.create_middleware(spec), MyAuthentication(spec), ...])
+    >>> serve(api, spec, resources, production=True, log=log)
+
+``serve(..., log=log)`` routes the standard ``logging`` calls (the error handler's and every middleware's)
+through :class:`BufferedHandler` and flushes the buffer when a worker exits.  The writer starts with the first
+record in each process, so a log can be created before forking.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from typing import IO, Optional, Union
+
+import falcon
+
+from . import hooks
+from .misc import after_fork_in_child
+from .resources import in_spec
+
+
+__all__ = ["AccessLog", "BufferedHandler", "BufferedLog"]
+logger = logging.getLogger(__name__)
+
+Record = Union[str, dict]
+
+
+class BufferedLog:
+    def __init__(
+            self, stream: IO[str], *,
+            capacity: int=8192,
+            batch_size: int=512,
+            flush_interval: float=0.5) -> None:
+        self.stream = stream
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._closed = False
+        self._reset()
+        after_fork_in_child(self, "_reset")
+
+    def append(self, record: Record) -> bool:
+        """Queue a dict (written as JSON) or a preformatted line; False if it was dropped"""
+        if self._pid != os.getpid():
+            # only without os.register_at_fork
+            self._reset()
+        buffer = self._buffer
+        # deques are safe to append to from any thread; the length check can race, so capacity is approximate
+        if len(buffer) >= self.capacity or self._closed:
+            self._dropped += 1
+            return False
+        buffer.append(record)
+        if self._writer is None:
+            self._start()
+        elif len(buffer) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def flush(self) -> None:
+        """Write everything buffered so far, on the calling thread"""
+        with self._lock:
+            self._write()
+
+    def close(self) -> None:
+        """Stop the writer and flush what's left; later records are dropped"""
+        self._closed = True
+        writer = self._writer
+        if writer is not None and self._pid == os.getpid():
+            self._wake.set()
+            writer.join()
+        self.flush()
+
+    def stats(self) -> dict:
+        return {"buffered": len(self._buffer), "dropped": self._dropped, "written": self._written}
+
+    def handler(self, level: int=logging.NOTSET, structured: bool=True) -> "BufferedHandler":
+        return BufferedHandler(self, level, structured)
+
+    # writer ==========================================================================================================
+
+    def _reset(self) -> None:
+        # never acquire the old lock here: the parent's writer may have held it, mid-write, when this process forked
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        # the parent's writer and buffered records stay with the parent
+        self._buffer = deque()  # type: deque
+        self._wake = threading.Event()
+        self._writer = None  # type: Optional[threading.Thread]
+        self._dropped = 0
+        self._reported = 0
+        self._written = 0
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                return
+            self._writer = threading.Thread(target=self._write_forever, name="scaffolding-log", daemon=True)
+            self._writer.start()
+
+    def _write_forever(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            # noinspection PyBroadException
+            try:
+                with self._lock:
+                    self._write()
+            except Exception:
+                # not through logging, which may be routed back here
+                traceback.print_exc()
+
+    def _write(self) -> None:
+        buffer = self._buffer
+        lines = []
+        while buffer:
+            record = buffer.popleft()
+            lines.append(record if isinstance(record, str) else json.dumps(record, default=str))
+        dropped = self._dropped
+        if dropped != self._reported:
+            lines.append(json.dumps({"event": "log_dropped", "count": dropped - self._reported, "time": time.time()}))
+            self._reported = dropped
+        if not lines:
+            return
+        lines.append("")
+        self.stream.write("\n".join(lines))
+        self.stream.flush()
+        self._written += len(lines) - 1
+
+
+class BufferedHandler(logging.Handler):
+    """A logging handler that renders records as dicts on the calling thread and leaves the I/O to a
+    :class:`BufferedLog`.  With ``structured=False`` records are rendered by the formatter as plain lines."""
+    def __init__(self, log: BufferedLog, level: int=logging.NOTSET, structured: bool=True) -> None:
+        super().__init__(level)
+        self.log = log
+        self.structured = structured
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # noinspection PyBroadException
+        try:
+            if not self.structured:
+                self.log.append(self.format(record))
+                return
+            entry = {
+                "time": record.created,
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+            }
+            if record.exc_info:
+                entry["exc"] = "".join(traceback.format_exception(*record.exc_info))
+            self.log.append(entry)
+        except Exception:
+            self.handleError(record)
+
+
+class AccessLog:
+    """Appends one record per request to a :class:`BufferedLog`.
+
+    Records have the operation id, method, path, status, principal type, the error code if a scaffolding
+    error was raised, and durations in milliseconds: ``total`` and, when they ran, ``auth`` and ``validation``.
+    Put this first in the middleware list so ``total`` covers every other middleware.
+    """
+    def __init__(self, log: BufferedLog) -> None:
+        self.log = log
+        hooks.auth_done.subscribe(self._on_auth_done)
+        hooks.validation_done.subscribe(self._on_validation_done)
+        hooks.error_raised.subscribe(self._on_error_raised)
+
+    def close(self) -> None:
+        hooks.auth_done.unsubscribe(self._on_auth_done)
+        hooks.validation_done.unsubscribe(self._on_validation_done)
+        hooks.error_raised.unsubscribe(self._on_error_raised)
+
+    def process_request(self, req: falcon.Request, resp: falcon.Response) -> None:
+        req.context["access_log"] = {"start": time.perf_counter()}
+
+    def process_response(self, req, resp, resource, req_succeeded: bool, **__) -> None:
+        ctx = req.context.pop("access_log", None)
+        if ctx is None or (resource is not None and not in_spec(resource)):
+            return
+        total = time.perf_counter() - ctx.pop("start")
+        operation = req.context.get("operation")
+        principal = req.context.get("principal")
+        record = {
+            "time": time.time(),
+            "operation": operation.id if operation else None,
+            "method": req.method,
+            "path": req.path,
+            "status": int(resp.status[:3]),
+            "principal": principal["type"] if principal else None,
+            "total": round(total * 1000, 3),
+        }
+        record.update(ctx)
+        self.log.append(record)
+
+    # noinspection PyUnusedLocal
+    def _on_auth_done(self, req, principal, elapsed) -> None:
+        ctx = req.context.get("access_log")
+        if ctx is not None:
+            ctx["auth"] = round(elapsed * 1000, 3)
+
+    # noinspection PyUnusedLocal
+    def _on_validation_done(self, req, operation, elapsed) -> None:
+        ctx = req.context.get("access_log")
+        if ctx is not None:
+            ctx["validation"] = round(elapsed * 1000, 3)
+
+    def _on_error_raised(self, req, error) -> None:
+        ctx = req.context.get("access_log")
+        if ctx is not None:
+            ctx["error"] = error.code.id
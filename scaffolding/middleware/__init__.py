@@ -1,13 +1,34 @@
 import logging
 
 from .authentication import AuthenticationMiddleware, OpenApiAuthentication
+from .batch import BatchResource
+from .cache import MemoryCache, ResponseCache
+from .coalesce import Coalescing
+from .compression import Compression
+from .cors import Cors
 from .database import Database
+from .dynamo import DynamoDatabase
+from .fields import SparseFieldsets, load_only
+from .idempotency import Idempotency, SqlIdempotencyStore
+from .loader import BatchLoader, Loaders
+from .metrics import Metrics
+from .ratelimit import RateLimiter
+from .serialization import SchemaSerialization
+from .timing import ServerTiming
 from .validation import OpenApiRequestValidation
 
 
 logger = logging.getLogger(__name__)
 __all__ = [
     "AuthenticationMiddleware", "OpenApiAuthentication",
-    "Database",
+    "BatchLoader", "BatchResource", "Coalescing", "Compression", "Cors", "Database", "Loaders",
+    "MemoryCache", "ResponseCache",
+    "DynamoDatabase",
+    "SparseFieldsets", "load_only",
+    "Idempotency", "SqlIdempotencyStore",
+    "Metrics",
     "OpenApiRequestValidation",
+    "RateLimiter",
+    "SchemaSerialization",
+    "ServerTiming",
 ]
@@ -1,16 +1,17 @@
 import base64
 import logging
+import time
 from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import falcon
 
+from .. import hooks
 from ..exc import Exceptions
-from ..openapi import Specification
+from ..openapi import Operation, Specification
+from ..resources import in_spec
 
 
 logger = logging.getLogger(__name__)
-MISSING = Exceptions.missing_authentication()
-MALFORMED = Exceptions.malformed_authentication()
 
 
 __all__ = [
@@ -84,12 +85,20 @@ class AuthenticationMiddleware:
     def process_resource(self, req: falcon.Request, resp: falcon.Response, resource, params: dict) -> None:
         mechanisms = self.get_auth_mechanisms_for_route(req)
         if not mechanisms:
-            logger.warning(f"no auth mechanism for request {req.method} {req.path} {req.uri_template}")
+            logger.warning("no auth mechanism for request %s %s %s", req.method, req.path, req.uri_template)
             return
+        self.authenticate(req, mechanisms)
 
+    def authenticate(self, req: falcon.Request, mechanisms: List[Tuple[str, callable]]) -> str:
+        """Sets ``req.context["principal"]`` from the first mechanism with credentials on the request.
+
+        Returns the type of the mechanism that matched.
+        """
+        start = time.perf_counter() if hooks.auth_done.enabled else 0
+        # a factory rather than an instance, so each failed request raises a fresh error
         last_exc = None
-        for type, parser in mechanisms:
-            handler = self.handlers[type]
+        for mechanism, parser in mechanisms:
+            handler = self.handlers[mechanism]
             material = tuple()
             # mechanisms may not parse requests
             if parser:
@@ -97,22 +106,24 @@ class AuthenticationMiddleware:
                 try:
                     material = parser(req)
                 except Exception:
-                    last_exc = MALFORMED
+                    last_exc = Exceptions.malformed_authentication
                     continue
                 else:
                     if material is None:
-                        last_exc = MISSING
+                        last_exc = Exceptions.missing_authentication
                         continue
             # Handlers may raise Exceptions.invalid_login, Exceptions.invalid_token
             # We let that bubble up, don't fall back through invalid credentials
             type, value = handler(req, *material)
-            req.context["principal"] = {
+            principal = req.context["principal"] = {
                 "type": type,
                 "value": value
             }
-            return
+            if hooks.auth_done.enabled:
+                hooks.auth_done.emit(req, principal, time.perf_counter() - start)
+            return mechanism
         if last_exc:
-            raise last_exc
+            raise last_exc()
         raise RuntimeError("Failed to configure credentials and failed to raise")
 
 
@@ -127,8 +138,17 @@ class OpenApiAuthentication(AuthenticationMiddleware):
         self.spec = spec
         self.mechanism_cache = {}  # type: Dict[str, List[Tuple[str, callable]]]
 
+    def process_resource(self, req: falcon.Request, resp: falcon.Response, resource, params: dict) -> None:
+        if in_spec(resource):
+            super().process_resource(req, resp, resource, params)
+
     def get_auth_mechanisms_for_route(self, req: falcon.Request) -> List[Tuple[str, callable]]:
-        operation = self.spec.operations.by_req(req)
+        return self.get_auth_mechanisms(self.spec.operations.resolve(req))
+
+    def warm_up(self, operation: Operation, resource) -> None:
+        self.get_auth_mechanisms(operation)
+
+    def get_auth_mechanisms(self, operation: Operation) -> List[Tuple[str, callable]]:
         try:
             return self.mechanism_cache[operation.id]
         except KeyError:
@@ -169,9 +189,10 @@ def basic_auth() -> Tuple[str, Callable[[falcon.Request], Optional[tuple]]]:
         try:
             decoded = base64.b64decode(payload.encode()).decode()
         except Exception:
-            raise MALFORMED
-        if ":" not in decoded:
-            raise MALFORMED
+            decoded = None
+        # raise outside the except block so the decode error isn't chained onto the 401
+        if decoded is None or ":" not in decoded:
+            raise Exceptions.malformed_authentication()
         username, password = decoded.split(":", 1)
         return username, password
     return "basic", parse
@@ -187,7 +208,7 @@ def bearer_auth() -> Tuple[str, Callable[[falcon.Request], Optional[tuple]]]:
             return None
         token = header[7:]
         if not token:
-            raise MALFORMED
+            raise Exceptions.malformed_authentication()
         return token,
     return "token", parse
 
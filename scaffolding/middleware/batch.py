@@ -0,0 +1,355 @@
+import concurrent.futures
+import io
+import json
+import logging
+import threading
+import urllib.parse
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import falcon
+
+from ..exc import Exceptions
+from ..openapi import Operation, Specification
+from ..openapi.serialization import dumps
+from ..resources import tag
+from .authentication import AuthenticationMiddleware
+from .cache import ResponseCache
+from .coalesce import Coalescing
+from .database import DatabaseMiddleware
+from .dynamo import DynamoMiddleware
+from .fields import SparseFieldsets
+from .idempotency import Idempotency
+from .ratelimit import RateLimiter
+from .serialization import SchemaSerialization
+from .validation import OpenApiRequestValidation
+
+
+__all__ = ["BatchResource"]
+logger = logging.getLogger(__name__)
+
+READ_ONLY = frozenset(("GET", "HEAD"))
+# the app's middleware that applies to each entry as if it were a request of its own
+PER_ENTRY = (RateLimiter, SparseFieldsets, ResponseCache, Coalescing, Idempotency)
+# middleware that gives a request its own sessions; pooled entries run it on their thread
+SESSIONS = (DatabaseMiddleware, DynamoMiddleware)
+
+
+def _wire(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+@tag(openapi=False)
+class BatchResource:
+    """Runs several spec operations in one request.
+
+    The body is a list of ``{"operationId": ..., "params": {...}, "body": ...}`` entries, and the response is a list
+    of ``{"operationId": ..., "status": ..., "body": ...}`` in the same order.  Each entry is dispatched to its
+    operation's autowired ``handler`` with a request of its own, built from the batch request's headers plus the
+    entry's params and body.  Errors are reported per entry, with the same body a single request would get.
+
+    Credentials are checked once for the whole batch, then each entry's operation must accept the mechanism that
+    matched.  Entries are validated like single requests.  Consecutive read-only entries (GET, HEAD) run together
+    on a pool of ``workers`` threads; other entries run in order on the request's thread, so a read after a write
+    sees it.  An entry may also carry ``"headers"``, such as its own ``Idempotency-Key``; the batch request's
+    Idempotency-Key isn't passed on.
+
+    .. code-block:: python
+
+        >>> authentication = MyAuthentication(spec)
+        >>> middleware = [db.create_middleware(spec), authentication, OpenApiRequestValidation(spec),
+        ...               RateLimiter(spec), ResponseCache(spec)]
+        >>> api = falcon.API(middleware=middleware)
+        >>> serve(api, spec, resources)  # autowires each Operation.handler
+        >>> BatchResource(spec, authentication).install(api, middleware, "/batch")
+
+    ``install`` picks the app's rate limiting, sparse fieldsets, caching, coalescing and idempotency middleware
+    and runs it around every entry, so a batch can't be used to get around them; pass ``middleware`` instead to
+    choose it yourself.  Entries on the request's thread share its sessions and loaders, each in a savepoint
+    (``begin_nested``) that's rolled back if the entry fails, so a failed write doesn't reach the batch's commit.
+    Pooled entries get their own, from the app's :class:`DatabaseMiddleware` and ``DynamoMiddleware`` run on the
+    pool thread (or ``session_middleware``); pass ``teardown`` to release any other per-thread state after each
+    pooled entry.  Pass the app's :class:`SchemaSerialization` to render entry bodies with their operations'
+    compiled serializers.
+    """
+    def __init__(
+            self, spec: Specification, authentication: AuthenticationMiddleware, *,
+            validation: Optional[OpenApiRequestValidation]=None,
+            serialization: Optional[SchemaSerialization]=None,
+            max_items: int=25,
+            workers: int=4,
+            middleware: Optional[Iterable]=None,
+            session_middleware: Optional[Iterable]=None,
+            teardown: Optional[Callable[[], None]]=None) -> None:
+        self.spec = spec
+        self.authentication = authentication
+        self.validation = validation or OpenApiRequestValidation(spec)
+        self.serialization = serialization
+        self.max_items = max_items
+        self.workers = workers
+        # None until install() finds them, or they're passed in
+        self.middleware = list(middleware) if middleware is not None else None
+        self.session_middleware = list(session_middleware) if session_middleware is not None else None
+        self.teardown = teardown
+        self._pool = None  # type: Optional[concurrent.futures.ThreadPoolExecutor]
+        self._pool_lock = threading.Lock()
+
+    @property
+    def pool(self) -> concurrent.futures.ThreadPoolExecutor:
+        # created on first use, so pre-forked workers each get their own threads
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="scaffolding-batch")
+        return self._pool
+
+    def install(self, api: falcon.API, middleware: Iterable, route: str="/batch") -> None:
+        """Adds the route; ``middleware`` is the list ``api`` was created with"""
+        middleware = list(middleware)
+        if self.middleware is None:
+            self.middleware = [m for m in middleware if isinstance(m, PER_ENTRY)]
+        if self.session_middleware is None:
+            self.session_middleware = [m for m in middleware if isinstance(m, SESSIONS)]
+        api.add_route(route, self)
+
+    def on_post(self, req: falcon.Request, resp: falcon.Response) -> None:
+        if self.middleware is None:
+            # running entries without the app's rate limits, cache or idempotency would bypass them
+            raise RuntimeError("BatchResource needs install(api, middleware) or an explicit middleware list")
+        entries = req.media
+        if not isinstance(entries, list):
+            raise Exceptions.invalid_parameter("body", entries, type="list")
+        if len(entries) > self.max_items:
+            raise Exceptions.invalid_parameter("body", len(entries), constraint=f"have at most {self.max_items} items")
+        operations = [self._operation(i, entry) for i, entry in enumerate(entries)]
+
+        # every mechanism the batch's operations accept, credentialed ones first so "none" doesn't win by default
+        mechanisms, seen = [], set()
+        for operation in operations:
+            for mechanism in self.authentication.get_auth_mechanisms(operation):
+                if mechanism[0] not in seen:
+                    seen.add(mechanism[0])
+                    mechanisms.append(mechanism)
+        mechanisms.sort(key=lambda m: m[0] == "none")
+        matched = self.authentication.authenticate(req, mechanisms) if mechanisms else None
+
+        results = [None] * len(entries)  # type: List[Optional[str]]
+        reads = []  # type: List[Tuple[int, Operation, dict]]
+        for i, (operation, entry) in enumerate(zip(operations, entries)):
+            if self.workers > 1 and operation.verb.upper() in READ_ONLY:
+                reads.append((i, operation, entry))
+                continue
+            self._run_reads(req, matched, reads, results)
+            reads = []
+            results[i] = self._run(req, matched, operation, entry)
+        self._run_reads(req, matched, reads, results)
+        resp.content_type = falcon.MEDIA_JSON
+        resp.data = f"[{','.join(results)}]".encode()
+
+    def _operation(self, index: int, entry) -> Operation:
+        if not isinstance(entry, dict) or not isinstance(entry.get("operationId"), str):
+            raise Exceptions.invalid_parameter(f"[{index}].operationId", entry, type="string")
+        try:
+            return self.spec.operations.by_id(entry["operationId"])
+        except KeyError:
+            pass
+        raise Exceptions.invalid_parameter(f"[{index}].operationId", entry["operationId"], constraint="be in the spec")
+
+    def _run_reads(self, req: falcon.Request, matched, reads: list, results: list) -> None:
+        if len(reads) == 1:
+            i, operation, entry = reads[0]
+            results[i] = self._run(req, matched, operation, entry)
+        elif reads:
+            futures = [
+                (i, self.pool.submit(self._run_pooled, req, matched, operation, entry))
+                for i, operation, entry in reads
+            ]
+            for i, future in futures:
+                results[i] = future.result()
+
+    def _run_pooled(self, req: falcon.Request, matched, operation: Operation, entry: dict) -> str:
+        try:
+            return self._run(req, matched, operation, entry, pooled=True)
+        finally:
+            if self.teardown:
+                self.teardown()
+
+    def _run(
+            self, req: falcon.Request, matched: Optional[str], operation: Operation, entry: dict,
+            pooled: bool=False) -> str:
+        sub_req, params = self._request(req, operation, entry, pooled)
+        sub_resp = falcon.Response()
+        # the loaders, sessions and unit of work in the batch's context belong to the request's thread
+        stack = [*(self.session_middleware or ()), *self.middleware] if pooled else self.middleware
+        # entries on the request's thread share its sessions; each gets a savepoint so a failed one is undone alone
+        savepoints = [] if pooled else self._savepoints(sub_req)
+        resource = getattr(operation.handler, "__self__", None)
+        succeeded = False
+        try:
+            for middleware in stack:
+                process_request = getattr(middleware, "process_request", None)
+                if process_request:
+                    process_request(sub_req, sub_resp)
+            accepted = {m[0] for m in self.authentication.get_auth_mechanisms(operation)}
+            if matched not in accepted and "none" not in accepted:
+                raise Exceptions.missing_authentication()
+            if operation.handler is None:
+                raise Exceptions.not_found()
+            self.validation.validate(operation, sub_req, params)
+            for middleware in stack:
+                process_resource = getattr(middleware, "process_resource", None)
+                if process_resource:
+                    process_resource(sub_req, sub_resp, resource, params)
+                    if sub_resp.complete:
+                        break
+            if not sub_resp.complete:
+                operation.handler(sub_req, sub_resp, **params)
+            succeeded = True
+        except Exception as ex:
+            self._handle(ex, operation, sub_req, sub_resp)
+        # like falcon, every middleware's process_response runs, in reverse
+        for middleware in reversed(stack):
+            process_response = getattr(middleware, "process_response", None)
+            if process_response:
+                try:
+                    process_response(sub_req, sub_resp, resource, succeeded)
+                except Exception as ex:
+                    self._handle(ex, operation, sub_req, sub_resp)
+                    succeeded = False
+        if not pooled:
+            succeeded = self._release(savepoints, succeeded, operation, sub_req, sub_resp)
+            self._settle(req, sub_req, succeeded)
+        status = int(sub_resp.status[:3])
+        body = self._body(operation, status, sub_req, sub_resp)
+        return f'{{"operationId":{dumps(operation.id)},"status":{status},"body":{body}}}'
+
+    def _savepoints(self, req: falcon.Request) -> list:
+        savepoints = []
+        for middleware in self.session_middleware or ():
+            if isinstance(middleware, DatabaseMiddleware):
+                savepoints.append(middleware.db.session.begin_nested())
+            elif isinstance(middleware, DynamoMiddleware) and req.context.get("dynamo") is not None:
+                savepoints.append(req.context["dynamo"].begin_nested())
+        return savepoints
+
+    def _release(
+            self, savepoints: list, succeeded: bool, operation: Operation,
+            req: falcon.Request, resp: falcon.Response) -> bool:
+        """Keeps the entry's writes if it succeeded, otherwise rolls them back.  Returns whether they were kept."""
+        pending = list(savepoints)
+        if succeeded:
+            try:
+                # flushes the entry's writes, so a constraint they break fails the entry rather than the batch
+                while pending:
+                    pending[0].commit()
+                    pending.pop(0)
+                return True
+            except Exception as ex:
+                self._handle(ex, operation, req, resp)
+        for savepoint in reversed(pending):
+            savepoint.rollback()
+        return False
+
+    @staticmethod
+    def _settle(req: falcon.Request, sub_req: falcon.Request, kept: bool) -> None:
+        on_commit = sub_req.context.pop("on_commit", None)
+        if on_commit is None:
+            return
+        if kept:
+            # run once the batch commits
+            req.context["on_commit"].extend(on_commit)
+            return
+        loaders = req.context.get("loaders")
+        if loaders is not None:
+            # rows loaded since the savepoint may be gone
+            loaders.clear()
+        for fn in on_commit:
+            # noinspection PyBroadException
+            try:
+                fn(False)
+            except Exception:
+                logger.exception("on_commit callback %r failed", fn)
+
+    @staticmethod
+    def _handle(ex: Exception, operation: Operation, req: falcon.Request, resp: falcon.Response) -> None:
+        if not isinstance(ex, Exceptions.cls):
+            logger.exception("batch entry %s failed", operation.id, exc_info=ex)
+            ex = Exceptions.internal_error()
+        Exceptions.cls.handle(ex, req, resp)
+
+    def _request(
+            self, req: falcon.Request, operation: Operation, entry: dict,
+            pooled: bool=False) -> Tuple[falcon.Request, dict]:
+        values = entry.get("params") or {}
+        path, query, params = operation.path, [], {}
+        env = dict(req.env)
+        # the batch's key identifies the batch, not each entry
+        env.pop("HTTP_IDEMPOTENCY_KEY", None)
+        headers = entry.get("headers") or {}
+        if not isinstance(headers, dict):
+            raise Exceptions.invalid_parameter("headers", headers, type="object")
+        for name, value in headers.items():
+            if name.lower() == "authorization":
+                # credentials were checked for the batch as a whole
+                raise Exceptions.invalid_parameter("headers", name, constraint="not include credentials")
+            env["HTTP_" + name.upper().replace("-", "_")] = _wire(value)
+        cookies = []
+        for param in operation.raw["parameters"]:
+            name, loc = param["name"], param["in"]
+            if name not in values:
+                continue
+            value = values[name]
+            if loc == "path":
+                path = path.replace(f"{{{name}}}", urllib.parse.quote(_wire(value), safe=""))
+                params[name] = _wire(value)
+            elif loc == "query":
+                query.append((name, _wire(value)))
+            elif loc == "header":
+                env["HTTP_" + name.upper().replace("-", "_")] = _wire(value)
+            elif loc == "cookie":
+                cookies.append(f"{name}={_wire(value)}")
+        if cookies:
+            env["HTTP_COOKIE"] = "; ".join(cookies)
+        body = b""
+        if "body" in entry:
+            body = json.dumps(entry["body"]).encode()
+            env["CONTENT_TYPE"] = falcon.MEDIA_JSON
+        env.update({
+            "REQUEST_METHOD": operation.verb.upper(),
+            "PATH_INFO": path,
+            "QUERY_STRING": urllib.parse.urlencode(query),
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.input": io.BytesIO(body),
+        })
+        sub_req = falcon.Request(env, options=req.options)
+        sub_req.uri_template = operation.path
+        # entries on the request's thread share the batch's principal, loaders and sessions; pooled entries only
+        # its principal.  The operation is resolved for each entry
+        if pooled:
+            if "principal" in req.context:
+                sub_req.context["principal"] = req.context["principal"]
+        else:
+            sub_req.context.update(req.context)
+            sub_req.context.pop("operation", None)
+            sub_req.context.pop("fields", None)
+            if "on_commit" in req.context:
+                sub_req.context["on_commit"] = []
+        self.spec.operations.resolve(sub_req)
+        return sub_req, params
+
+    def _body(self, operation: Operation, status: int, req: falcon.Request, resp: falcon.Response) -> str:
+        """The entry's body as JSON text; JSON bodies that are already serialized are used as-is"""
+        if resp.media is not None:
+            if self.serialization:
+                return self.serialization.serializer(operation.id, status, req.context.get("fields"))(resp.media)
+            return dumps(resp.media)
+        data = resp.body if resp.body is not None else resp.data
+        if not data:
+            return "null"
+        if isinstance(data, bytes):
+            data = data.decode()
+        if resp.content_type and resp.content_type.startswith(falcon.MEDIA_JSON):
+            return data
+        return dumps(data)
@@ -0,0 +1,304 @@
+import collections
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+import falcon
+
+from ..openapi import Operation, Specification
+from ..resources import get_tag, in_spec
+from ..warmup import is_warmup
+
+
+__all__ = ["CacheBackend", "CachePolicy", "MemoryCache", "ResponseCache", "ResponseSnapshot"]
+logger = logging.getLogger(__name__)
+
+
+class ResponseSnapshot:
+    """The parts of a finished response needed to replay it.  ``data`` is the serialized body."""
+    __slots__ = ("status", "content_type", "data", "headers", "etag")
+
+    def __init__(
+            self, status: str, content_type: Optional[str], data: bytes,
+            headers: Optional[Dict[str, str]]=None, etag: Optional[str]=None) -> None:
+        self.status = status
+        self.content_type = content_type
+        self.data = data
+        self.headers = headers or {}
+        self.etag = etag
+
+    @classmethod
+    def capture(cls, resp: falcon.Response, headers: Iterable[str]=()) -> Optional["ResponseSnapshot"]:
+        """None for streamed responses, which can't be replayed"""
+        if resp.stream is not None:
+            return None
+        # falcon prefers body over data; data serializes media on first access and keeps the bytes
+        data = resp.body.encode() if resp.body is not None else resp.data
+        kept = {}
+        for name in headers:
+            value = resp.get_header(name)
+            if value is not None:
+                kept[name] = value
+        return cls(resp.status, resp.content_type, data or b"", kept, resp.etag)
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    def apply(self, resp: falcon.Response) -> None:
+        resp.status = self.status
+        if self.content_type:
+            resp.content_type = self.content_type
+        resp.data = self.data
+        if self.headers:
+            resp.set_headers(self.headers)
+        if self.etag:
+            resp.etag = self.etag
+
+
+def strong_etag(data: bytes) -> str:
+    return '"' + hashlib.blake2b(data, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses the weak comparison, so ``W/"x"`` matches ``"x"``"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class CachePolicy:
+    """How one handler's responses are cached.  Built from the value of ``@tag(cache=...)``:
+
+    * a number is the ttl in seconds
+    * a dict holds the arguments below, eg. ``{"ttl": 30, "principal": True}``
+
+    With ``principal`` each principal gets its own entry; use it whenever the body depends on who is asking.
+    ``cache_control`` is sent as the Cache-Control header of every response this handler returns.
+    """
+    __slots__ = ("ttl", "principal", "cache_control")
+
+    def __init__(self, ttl: float=60.0, principal: bool=False, cache_control: Optional[str]=None) -> None:
+        self.ttl = ttl
+        self.principal = principal
+        self.cache_control = cache_control
+
+    @classmethod
+    def from_tag(cls, value) -> Optional["CachePolicy"]:
+        if value is None or value is False:
+            return None
+        if isinstance(value, CachePolicy):
+            return value
+        if value is True:
+            return cls()
+        if isinstance(value, (int, float)):
+            return cls(ttl=value)
+        if isinstance(value, dict):
+            return cls(**value)
+        raise RuntimeError(f"unexpected cache tag {value!r}")
+
+
+class CacheBackend:
+    """Stores snapshots by key.  Implementations must be safe to call from multiple threads."""
+    def get(self, key: Hashable) -> Optional[ResponseSnapshot]:
+        raise NotImplementedError
+
+    def set(self, key: Hashable, snapshot: ResponseSnapshot, ttl: float) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: Hashable) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """A per-process LRU bounded by entry count and by the total size of the cached bodies"""
+    def __init__(
+            self,
+            max_entries: int=1024,
+            max_bytes: int=64 * 1024 * 1024,
+            max_entry_bytes: int=1024 * 1024) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.bytes = 0
+        self._entries = collections.OrderedDict()  # type: Dict[Hashable, Tuple[float, ResponseSnapshot]]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[ResponseSnapshot]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, snapshot = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return snapshot
+
+    def set(self, key: Hashable, snapshot: ResponseSnapshot, ttl: float) -> None:
+        if snapshot.size > self.max_entry_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = time.monotonic() + ttl, snapshot
+            self.bytes += snapshot.size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[1].size
+
+
+def _stable_id(value) -> Hashable:
+    """Something that identifies a principal's value across requests, where each request loads a new one"""
+    if hasattr(value, "id"):
+        # models: an account id rather than the row object
+        return value.id
+    if value is not None and type(value).__hash__ is object.__hash__:
+        # hashed, and repr'd, by its address: no two requests would ever match
+        raise RuntimeError(f"can't key requests by {type(value).__name__} principals; pass principal_key")
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def _principal_key(principal: dict) -> Hashable:
+    return principal["type"], _stable_id(principal["value"])
+
+
+class ResponseCache:
+    """Caches the responses of GET handlers tagged with ``@tag(cache=...)``.
+
+    Put this after authentication and validation so entries are keyed by the operation id, the validated
+    params and (when the policy asks for it) the principal.  A hit is answered before the handler runs, and
+    every cached response carries a strong ETag so a matching ``If-None-Match`` gets a 304 with no body.
+
+    .. code-block:: python
+
+        >>> class WidgetResource:
+        ...     @tag(cache={"ttl": 30, "principal": True})
+        ...     def on_get(self, req, resp, **params): ...
+        >>> cache = ResponseCache(spec, MemoryCache(max_bytes=256 * 1024 * 1024))
+        >>> api = falcon.API(middleware=[MyAuthentication(spec), OpenApiRequestValidation(spec), cache])
+
+    ``principal_key`` maps ``req.context["principal"]`` to something hashable that is stable across requests.
+    The default uses the value's ``id`` when it has one, such as a model, and otherwise the value itself.
+    Handlers that also (or only) have ``@tag(cache_control=...)`` get that Cache-Control header.
+    """
+    def __init__(
+            self, spec: Specification,
+            backend: Optional[CacheBackend]=None,
+            principal_key: Callable[[dict], Hashable]=_principal_key,
+            headers: Iterable[str]=()) -> None:
+        self.spec = spec
+        self.backend = backend or MemoryCache()
+        self.principal_key = principal_key
+        # extra response headers to keep with each entry; ETag and Content-Type are always kept
+        self.headers = tuple(headers)
+        self._policies = {}  # type: Dict[Tuple[type, str], Optional[CachePolicy]]
+
+    def policy(self, resource, method: str) -> Optional[CachePolicy]:
+        # warm-up passes the spec's verb and requests falcon's method; both share one entry
+        method = method.upper()
+        key = type(resource), method
+        try:
+            return self._policies[key]
+        except KeyError:
+            policy = self._policies[key] = CachePolicy.from_tag(get_tag("cache", resource, method))
+            return policy
+
+    def warm_up(self, operation: Operation, resource) -> None:
+        if resource is not None:
+            self.policy(resource, operation.verb.upper())
+
+    def key(self, req: falcon.Request, policy: CachePolicy, params: dict) -> Hashable:
+        operation = self.spec.operations.resolve(req)
+        principal = req.context.get("principal") if policy.principal else None
+        return self._key(operation.id, params, principal)
+
+    def _key(self, operation_id: str, params: dict, principal: Optional[dict]) -> Hashable:
+        if principal is not None:
+            principal = self.principal_key(principal)
+        return operation_id, json.dumps(params, sort_keys=True, default=str), principal
+
+    def process_resource(self, req: falcon.Request, resp: falcon.Response, resource, params: dict) -> None:
+        if req.method != "GET" or resource is None or not in_spec(resource) or is_warmup(req):
+            return
+        if req.context.get("fields"):
+            # sparse fieldsets would need an entry per selection, which invalidate can't reach
+            return
+        policy = self.policy(resource, "get")
+        if policy is None:
+            return
+        key = self.key(req, policy, params)
+        req.context["cache"] = policy, key
+        snapshot = self.backend.get(key)
+        if snapshot is None:
+            return
+        req.context["cache"] = policy, None
+        if etag_matches(req.get_header("If-None-Match"), snapshot.etag):
+            resp.status = falcon.HTTP_304
+            resp.etag = snapshot.etag
+        else:
+            snapshot.apply(resp)
+        resp.complete = True
+
+    def process_response(self, req, resp, resource, req_succeeded: bool, **__) -> None:
+        cached = req.context.get("cache")
+        if cached is None:
+            cache_control = resource is not None and get_tag("cache_control", resource, req.method)
+            if cache_control:
+                resp.cache_control = [cache_control]
+            return
+        policy, key = cached
+        if policy.cache_control:
+            resp.cache_control = [policy.cache_control]
+        # key is None for responses served from the cache
+        if key is None or not req_succeeded or resp.status != falcon.HTTP_200:
+            return
+        snapshot = ResponseSnapshot.capture(resp, self.headers)
+        if snapshot is None:
+            return
+        snapshot.etag = resp.etag = resp.etag or strong_etag(snapshot.data)
+        self.backend.set(key, snapshot, policy.ttl)
+        if etag_matches(req.get_header("If-None-Match"), snapshot.etag):
+            resp.status = falcon.HTTP_304
+            resp.data = resp.body = resp.media = None
+
+    def invalidate(self, operation_id: str, params: dict, principal: Optional[dict]=None) -> None:
+        """Drops the entry that a GET of ``operation_id`` with these params would be served from.
+
+        Call it from the handlers that change the resource; other entries expire with their ttl.
+        """
+        self.backend.delete(self._key(operation_id, params, principal))
@@ -0,0 +1,171 @@
+import json
+import logging
+import threading
+from typing import Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+import falcon
+
+from ..openapi import Operation, Specification
+from ..resources import get_tag, in_spec
+from .cache import ResponseSnapshot, _principal_key
+
+
+__all__ = ["Coalescing", "SingleFlight"]
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT = frozenset(("GET", "HEAD"))
+
+
+class _Flight:
+    __slots__ = ("done", "result", "followers")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """At most one in-flight execution per key; everyone else who asks for the same key waits for its result.
+
+    .. code-block:: python
+
+        >>> flights = SingleFlight()
+        >>> leader, flight = flights.join(key)
+        >>> if leader:
+        ...     try:
+        ...         result = compute()
+        ...     finally:
+        ...         flights.finish(key, flight, result)
+        ... else:
+        ...     result = flights.wait(flight, timeout=1.0)  # None if the leader failed or took too long
+    """
+    def __init__(self) -> None:
+        self._flights = {}  # type: Dict[Hashable, _Flight]
+        self._lock = threading.Lock()
+
+    def join(self, key: Hashable) -> Tuple[bool, _Flight]:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                return True, flight
+            flight.followers += 1
+            return False, flight
+
+    def finish(self, key: Hashable, flight: _Flight, result=None) -> int:
+        """Publishes the leader's result and returns how many followers waited for it.
+
+        A result of None tells the followers to do the work themselves.
+        """
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.result = result
+        flight.done.set()
+        return flight.followers
+
+    @staticmethod
+    def wait(flight: _Flight, timeout: float):
+        if flight.done.wait(timeout):
+            return flight.result
+        return None
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+
+class Coalescing:
+    """Runs identical concurrent requests once and hands every caller the same response.
+
+    Requests are identical when they have the same operation id, validated params and principal.  GET and HEAD
+    handlers coalesce unless tagged ``@tag(coalesce=False)``; other handlers opt in with ``@tag(coalesce=True)``.
+    ``@tag(coalesce={"principal": False})`` also shares responses between principals, for handlers whose body
+    doesn't depend on the caller.
+
+    Put this after validation, and after a :class:`~scaffolding.middleware.ResponseCache` if there is one, so the
+    leader's response fills the cache.  A follower waits at most ``timeout`` seconds; if the leader is slower, or
+    fails, the follower runs the handler itself.  ``stats()`` counts leaders, coalesced followers and fallbacks.
+    """
+    def __init__(
+            self, spec: Specification,
+            timeout: float=5.0,
+            principal_key: Callable[[dict], Hashable]=_principal_key,
+            headers: Iterable[str]=()) -> None:
+        self.spec = spec
+        self.timeout = timeout
+        self.principal_key = principal_key
+        # extra response headers to copy to followers; ETag and Content-Type are always copied
+        self.headers = tuple(headers)
+        self.flights = SingleFlight()
+        self._policies = {}  # type: Dict[Tuple[type, str], Optional[dict]]
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "coalesced": 0, "fallbacks": 0}
+
+    def policy(self, resource, method: str) -> Optional[dict]:
+        key = type(resource), method
+        try:
+            return self._policies[key]
+        except KeyError:
+            pass
+        value = get_tag("coalesce", resource, method)
+        if value is None:
+            value = method in IDEMPOTENT
+        if value is True:
+            value = {}
+        elif value is False:
+            value = None
+        policy = self._policies[key] = value
+        return policy
+
+    def warm_up(self, operation: Operation, resource) -> None:
+        if resource is not None:
+            self.policy(resource, operation.verb.upper())
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self.flights))
+
+    def _count(self, name: str, n: int=1) -> None:
+        with self._lock:
+            self._stats[name] += n
+
+    def process_resource(self, req: falcon.Request, resp: falcon.Response, resource, params: dict) -> None:
+        if resource is None or not in_spec(resource):
+            return
+        policy = self.policy(resource, req.method)
+        if policy is None:
+            return
+        try:
+            operation = self.spec.operations.resolve(req)
+        except KeyError:
+            return
+        principal = None
+        if policy.get("principal", True):
+            principal = req.context.get("principal")
+            principal = principal and self.principal_key(principal)
+        params_key = json.dumps(params, sort_keys=True, default=str)
+        key = operation.id, req.method, params_key, req.context.get("fields"), principal
+        leader, flight = self.flights.join(key)
+        if leader:
+            req.context["coalesce"] = key, flight
+            return
+        snapshot = self.flights.wait(flight, self.timeout)  # type: Optional[ResponseSnapshot]
+        if snapshot is None:
+            self._count("fallbacks")
+            logger.debug("coalesced %s fell back to running its handler", operation.id)
+            return
+        snapshot.apply(resp)
+        resp.complete = True
+        self._count("coalesced")
+
+    def process_response(self, req, resp, resource, req_succeeded: bool, **__) -> None:
+        leading = req.context.pop("coalesce", None)
+        if leading is None:
+            return
+        key, flight = leading
+        snapshot = None
+        if req_succeeded and not resp.status.startswith("5"):
+            snapshot = ResponseSnapshot.capture(resp, self.headers)
+        self.flights.finish(key, flight, snapshot)
+        self._count("leaders")
@@ -0,0 +1,174 @@
+import gzip
+import hashlib
+import logging
+import zlib
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import falcon
+
+from ..openapi import Operation
+from ..resources import get_tag
+from .cache import CacheBackend, MemoryCache, ResponseSnapshot
+
+
+__all__ = ["Compression", "negotiate_encoding"]
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+# preferred first, when the client accepts several equally
+ENCODINGS = ("gzip", "deflate")
+STREAM_CHUNK_SIZE = 64 * 1024
+# compressed variants of a body don't change, so they're kept until evicted
+VARIANT_TTL = 24 * 60 * 60
+
+
+def negotiate_encoding(accept_encoding: Optional[str], supported: Iterable[str]=ENCODINGS) -> Optional[str]:
+    """The supported encoding the client prefers, or None for identity"""
+    if not accept_encoding:
+        return None
+    weights = {}  # type: Dict[str, float]
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in supported:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def _compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "gzip":
+        # mtime=0 so identical bodies compress to identical bytes
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    return zlib.compress(data, level)
+
+
+def _compress_stream(stream, encoding: str, level: int) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31 if encoding == "gzip" else 15)
+    read = getattr(stream, "read", None)
+    chunks = iter(lambda: read(STREAM_CHUNK_SIZE), b"") if read else stream
+    try:
+        for chunk in chunks:
+            out = compressor.compress(chunk)
+            if out:
+                yield out
+        yield compressor.flush()
+    finally:
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+
+
+class Compression:
+    """Compresses response bodies the client accepts in a compressed encoding.
+
+    Bodies are compressed when their content type is compressible and they are at least ``min_size`` bytes.
+    Streamed bodies are compressed chunk by chunk unless their Content-Length is below ``min_size``.  The level is
+    ``level``, or the handler's ``@tag(compression=...)``: a level from 1 to 9, or False to never compress it.
+
+    Compressed copies of responses with an ETag, such as those from
+    :class:`~scaffolding.middleware.ResponseCache`, are kept in ``cache`` by a digest of the body, so a hot body
+    is only compressed once.  Their ETag is sent weak, since the bytes differ from the identity body.
+
+    Put this first in the middleware list, so it sees the body after every other middleware has run.
+    """
+    def __init__(
+            self,
+            min_size: int=1024,
+            level: int=6,
+            types: Tuple[str, ...]=COMPRESSIBLE,
+            cache: Optional[CacheBackend]=None) -> None:
+        self.min_size = min_size
+        self.level = level
+        self.types = types
+        self.cache = cache if cache is not None else MemoryCache(max_entries=4096, max_bytes=32 * 1024 * 1024)
+        self._levels = {}  # type: Dict[Tuple[type, str], Optional[int]]
+
+    def level_for(self, resource, method: str) -> Optional[int]:
+        if resource is None:
+            return self.level
+        key = type(resource), method
+        try:
+            return self._levels[key]
+        except KeyError:
+            value = get_tag("compression", resource, method)
+            if value is None or value is True:
+                value = self.level
+            level = self._levels[key] = value or None
+            return level
+
+    def warm_up(self, operation: Operation, resource) -> None:
+        if resource is not None:
+            self.level_for(resource, operation.verb.upper())
+
+    def process_response(self, req, resp, resource, req_succeeded: bool, **__) -> None:
+        content_type = resp.content_type or ""
+        if not content_type.startswith(self.types):
+            return
+        _vary(resp)
+        if req.method == "HEAD" or resp.status[:3] in ("204", "304") or resp.get_header("Content-Encoding"):
+            return
+        encoding = negotiate_encoding(req.get_header("Accept-Encoding"))
+        if encoding is None:
+            return
+        level = self.level_for(resource, req.method)
+        if level is None:
+            return
+
+        if resp.stream is not None:
+            length = resp.content_length
+            if length is not None and int(length) < self.min_size:
+                return
+            resp.stream = _compress_stream(resp.stream, encoding, level)
+            resp.content_length = None
+            resp.set_header("Content-Encoding", encoding)
+            return
+
+        data = resp.body.encode() if resp.body is not None else resp.data
+        if not data or len(data) < self.min_size:
+            return
+        etag = resp.etag
+        if etag:
+            if etag.startswith("W/"):
+                etag = etag[2:]
+            # ETags are only unique per URL, so the variant is keyed by the body itself
+            key = hashlib.blake2b(data, digest_size=16).digest(), encoding, level
+            variant = self.cache.get(key)
+            if variant is None:
+                variant = ResponseSnapshot(resp.status, content_type, _compress(data, encoding, level))
+                self.cache.set(key, variant, VARIANT_TTL)
+            compressed = variant.data
+            resp.etag = f"W/{etag}"
+        else:
+            compressed = _compress(data, encoding, level)
+        if len(compressed) >= len(data):
+            # incompressible; the tag and cache entry are still correct for the identity body
+            if etag:
+                resp.etag = etag
+            return
+        resp.body = None
+        resp.data = compressed
+        resp.set_header("Content-Encoding", encoding)
+
+
+def _vary(resp: falcon.Response) -> None:
+    vary = resp.get_header("Vary")
+    if not vary:
+        resp.set_header("Vary", "Accept-Encoding")
+    elif "accept-encoding" not in vary.lower():
+        resp.set_header("Vary", f"{vary}, Accept-Encoding")
@@ -0,0 +1,172 @@
+import logging
+import re
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+
+import falcon
+
+from ..openapi import Specification
+
+
+__all__ = ["Cors"]
+logger = logging.getLogger(__name__)
+
+ANY_ORIGIN = "*"
+# sent by browsers without being listed; safelisted request headers never need to be allowed
+SAFELISTED = frozenset(("accept", "accept-language", "content-language"))
+Headers = Tuple[Tuple[str, str], ...]
+
+
+def _route_headers(spec: Specification, path: str) -> Tuple[List[str], List[str]]:
+    """The methods and request headers a path's operations accept"""
+    methods, headers = [], []
+
+    def allow(name: str) -> None:
+        if name.lower() not in SAFELISTED and name.lower() not in (h.lower() for h in headers):
+            headers.append(name)
+
+    for operation in spec.operations.with_path(path):
+        methods.append(operation.verb.upper())
+        if operation.verb.upper() == "GET":
+            methods.append("HEAD")
+        if "requestBody" in operation.raw:
+            allow("Content-Type")
+        for param in operation.raw.get("parameters", ()):
+            if param["in"] == "header":
+                allow(param["name"])
+        for schema in operation.security_schemas:
+            if not schema:
+                continue
+            if schema["type"] == "apiKey":
+                if schema.get("in", schema.get("loc")) == "header":
+                    allow(schema["name"])
+            else:
+                allow("Authorization")
+    order = ("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE")
+    methods = sorted(set(methods), key=lambda m: order.index(m) if m in order else len(order))
+    return methods + ["OPTIONS"], headers
+
+
+def _bucket(path: str) -> Tuple[int, Optional[str]]:
+    segments = path.split("/")
+    first = segments[1] if len(segments) > 1 else ""
+    return len(segments), None if "{" in first else first
+
+
+def _template_pattern(path: str) -> str:
+    return re.sub(r"\\{[^/]+?\\}", "[^/]+", re.escape(path))
+
+
+class Cors:
+    """Answers CORS preflights from a table built from the spec, and marks cross-origin responses.
+
+    At startup each spec path gets its allowed methods, and the request headers its operations read: header
+    parameters, Authorization or an apiKey header for secured operations, and Content-Type when there's a body.
+    Preflights (OPTIONS with Origin and Access-Control-Request-Method) for a spec path are answered from that
+    table with a 204 and ``Access-Control-Max-Age``, before routing; no other middleware or handler runs.
+    Preflights from origins that aren't allowed get a 204 without CORS headers, so the browser refuses.
+
+    ``origins`` lists the allowed origins, or ``"*"`` for any.  ``headers`` are allowed on every route in
+    addition to the spec's, and ``expose_headers`` are readable by scripts on every response.
+
+    .. code-block:: python
+
+        >>> cors = Cors(spec, origins=["https://app.example.com"], credentials=True, headers=["X-Request-Id"])
+        >>> api = falcon.API(middleware=[cors, MyAuthentication(spec), OpenApiRequestValidation(spec)])
+
+    Put this first in the middleware list so preflights skip every other middleware's ``process_request``.
+    """
+    def __init__(
+            self, spec: Specification, *,
+            origins: Iterable[str]=(ANY_ORIGIN,),
+            headers: Iterable[str]=(),
+            expose_headers: Iterable[str]=(),
+            credentials: bool=False,
+            max_age: int=86400) -> None:
+        self.spec = spec
+        self.origins = frozenset(origins)
+        self.any_origin = ANY_ORIGIN in self.origins
+        self.credentials = credentials
+        self.max_age = max_age
+        extra = list(headers)
+
+        # per-route preflight headers, ready to copy onto the response
+        self._preflights = {}  # type: Dict[str, Headers]
+        common = [("Access-Control-Max-Age", str(max_age))]
+        if credentials:
+            common.append(("Access-Control-Allow-Credentials", "true"))
+        for path in sorted(spec.paths):
+            methods, allowed = _route_headers(spec, path)
+            allowed += [h for h in extra if h.lower() not in (a.lower() for a in allowed)]
+            route = [("Access-Control-Allow-Methods", ", ".join(methods))]
+            if allowed:
+                route.append(("Access-Control-Allow-Headers", ", ".join(allowed)))
+            self._preflights[path] = tuple(route + common)
+
+        # static paths are a dict lookup.  templated paths are bucketed by segment count and first segment, and
+        # each bucket's templates share one regex that tells them apart by group name
+        self._static = {p: h for p, h in self._preflights.items() if "{" not in p}
+        buckets = {}  # type: Dict[Tuple[int, Optional[str]], List[str]]
+        for path in self._preflights:
+            if "{" in path:
+                buckets.setdefault(_bucket(path), []).append(path)
+        self._templated = {}  # type: Dict[Tuple[int, Optional[str]], Tuple[Pattern, Dict[str, Headers]]]
+        for key, paths in buckets.items():
+            alternatives = "|".join(f"(?P<r{i}>{_template_pattern(p)})" for i, p in enumerate(paths))
+            groups = {f"r{i}": self._preflights[p] for i, p in enumerate(paths)}
+            self._templated[key] = re.compile(f"(?:{alternatives})\\Z"), groups
+
+        self._exposed = ", ".join(expose_headers)
+
+    def preflight_headers(self, path: str) -> Optional[Headers]:
+        headers = self._static.get(path)
+        if headers is not None or not self._templated:
+            return headers
+        count, first = _bucket(path)
+        for key in ((count, first), (count, None)):
+            bucket = self._templated.get(key)
+            if bucket is not None:
+                match = bucket[0].match(path)
+                if match:
+                    return bucket[1][match.lastgroup]
+        return None
+
+    def allow_origin(self, origin: str) -> Optional[str]:
+        """The Access-Control-Allow-Origin value for a request's Origin, or None if it isn't allowed"""
+        if origin in self.origins:
+            return origin
+        if self.any_origin:
+            # credentialed responses can't use the wildcard
+            return origin if self.credentials else ANY_ORIGIN
+        return None
+
+    def process_request(self, req: falcon.Request, resp: falcon.Response) -> None:
+        if req.method != "OPTIONS":
+            return
+        origin = req.get_header("Origin")
+        if not origin or not req.get_header("Access-Control-Request-Method"):
+            return
+        headers = self.preflight_headers(req.path)
+        if headers is None:
+            return
+        resp.status = falcon.HTTP_204
+        resp.complete = True
+        if self.allow_origin(origin) is None:
+            logger.debug("refused preflight from origin %r", origin)
+            return
+        for name, value in headers:
+            resp.set_header(name, value)
+
+    def process_response(self, req, resp, resource, req_succeeded: bool, **__) -> None:
+        origin = req.get_header("Origin")
+        if not origin:
+            return
+        allowed = self.allow_origin(origin)
+        if allowed is None:
+            return
+        resp.set_header("Access-Control-Allow-Origin", allowed)
+        if allowed != ANY_ORIGIN:
+            resp.append_header("Vary", "Origin")
+        if self.credentials:
+            resp.set_header("Access-Control-Allow-Credentials", "true")
+        if self._exposed and req.method != "OPTIONS":
+            resp.set_header("Access-Control-Expose-Headers", self._exposed)
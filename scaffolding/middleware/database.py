@@ -1,7 +1,23 @@
+import contextlib
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+import falcon
 import sqlalchemy
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import scoped_session, sessionmaker
 
+from .. import hooks
+from ..openapi import Specification
+from .loader import Loaders
+
+
+__all__ = ["Database", "DatabaseMiddleware", "QueryInstrumentation", "QueryStats"]
+logger = logging.getLogger(__name__)
+
 
 # noinspection PyShadowingNames
 class Database:
@@ -10,28 +26,211 @@ class Database:
         self.engine = None
         self.session = scoped_session(sessionmaker())
         self.autocommit = autocommit
+        self.instrumentation = None  # type: Optional[QueryInstrumentation]
+        self.loaders = {}  # type: Dict[str, Callable[[List[Hashable]], Dict[Hashable, Any]]]
 
-    def init(self, connection_url: str, echo=True, create_tables=True) -> None:
+    def init(self, connection_url: str, echo=True, create_tables=True, instrument=False) -> None:
         self.engine = sqlalchemy.create_engine(connection_url, echo=echo)
         self.base.metadata.bind = self.engine
         self.session.configure(bind=self.engine)
+        if instrument:
+            self.instrument()
         if create_tables:
             self.base.metadata.create_all(self.engine)
 
-    def create_middleware(self) -> "DatabaseMiddleware":
-        return DatabaseMiddleware(self)
+    def instrument(
+            self,
+            hook: Optional[Callable[["QueryStats"], None]]=None,
+            n_plus_one_threshold: int=5,
+            debug_header: bool=False) -> "QueryInstrumentation":
+        """Record statement count, db time and repeated statements for each request.
+
+        Must be called after ``init``.  See :class:`QueryInstrumentation` for the arguments.
+        """
+        if self.engine is None:
+            raise RuntimeError("must call Database.init before instrumenting the engine")
+        if self.instrumentation is None:
+            self.instrumentation = QueryInstrumentation(
+                self.engine, hook=hook,
+                n_plus_one_threshold=n_plus_one_threshold,
+                debug_header=debug_header)
+        return self.instrumentation
+
+    def warm_pool(self, connections: Optional[int]=None) -> int:
+        """Connect ``connections`` pooled connections up front, by default the pool's size.  Returns the count."""
+        if self.engine is None:
+            raise RuntimeError("must call Database.init before warming the pool")
+        if connections is None:
+            size = getattr(self.engine.pool, "size", 1)
+            connections = size() if callable(size) else size
+        # hold them all at once so the pool has to open each one
+        opened = [self.engine.connect() for _ in range(connections)]
+        for connection in opened:
+            connection.close()
+        return len(opened)
+
+    @contextlib.contextmanager
+    def session_scope(self):
+        """A session of its own for work outside a request, such as background tasks.  Commits unless the block
+        raises, then closes."""
+        session = self.session.session_factory()
+        try:
+            yield session
+            session.commit()
+        except BaseException:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def register_loader(self, name: str, batch_fn: Callable[[List[Hashable]], Dict[Hashable, Any]]) -> None:
+        """Make a batch function available to each request as ``req.context["loaders"][name]``"""
+        self.loaders[name] = batch_fn
+
+    def create_middleware(self, spec: Optional[Specification]=None) -> "DatabaseMiddleware":
+        return DatabaseMiddleware(self, spec)
+
+
+class QueryStats:
+    """Statements issued while handling a single request.
+
+    Statement text is recorded before parameters are bound, so two lookups that
+    only differ by id share the same shape.
+    """
+    def __init__(self, operation_id: Optional[str]=None) -> None:
+        self.operation_id = operation_id
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()  # type: Counter
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.shapes[statement] += 1
+
+    def repeated(self, threshold: int=2) -> Dict[str, int]:
+        return {statement: n for statement, n in self.shapes.items() if n >= threshold}
+
+    def summary(self, threshold: int=2) -> str:
+        return f"count={self.count}; dur={self.duration * 1000:.2f}; repeated={len(self.repeated(threshold))}"
+
+
+class QueryInstrumentation:
+    """Per-request statement counters driven by the engine's cursor events.
+
+    * ``hook`` is called with the finished :class:`QueryStats` of every request
+    * any statement shape issued at least ``n_plus_one_threshold`` times in one request
+      is logged as a probable N+1
+    * when ``debug_header`` is set, a summary is returned in the ``X-Query-Stats`` response header
+
+    Stats are tracked per thread, matching the thread-local ``Database.session``.
+    """
+    header = "X-Query-Stats"
+
+    def __init__(
+            self, engine,
+            hook: Optional[Callable[[QueryStats], None]]=None,
+            n_plus_one_threshold: int=5,
+            debug_header: bool=False) -> None:
+        self.hook = hook
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.debug_header = debug_header
+        self._local = threading.local()
+        sqlalchemy.event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        sqlalchemy.event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    @property
+    def current(self) -> Optional[QueryStats]:
+        return getattr(self._local, "stats", None)
+
+    def begin(self, operation_id: Optional[str]=None) -> QueryStats:
+        stats = self._local.stats = QueryStats(operation_id)
+        return stats
+
+    def finish(self) -> Optional[QueryStats]:
+        stats = self.current
+        if stats is None:
+            return None
+        self._local.stats = None
+        suspects = stats.repeated(self.n_plus_one_threshold)
+        for statement, n in suspects.items():
+            logger.warning(
+                "probable N+1 in %s: statement issued %d times: %s",
+                stats.operation_id, n, " ".join(statement.split()))
+        if self.hook:
+            self.hook(stats)
+        return stats
+
+    # noinspection PyUnusedLocal
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if self.current is not None:
+            self._local.started = time.perf_counter()
+
+    # noinspection PyUnusedLocal
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        stats = self.current
+        if stats is not None:
+            stats.record(statement, time.perf_counter() - self._local.started)
 
 
 class DatabaseMiddleware:
-    def __init__(self, db: Database) -> None:
+    """Commits or rolls back the request's session and attaches ``req.context["loaders"]``.
+
+    Callbacks appended to ``req.context["on_commit"]`` are called with whether the session committed, once it's
+    finished, so later middleware can act on the outcome of the commit rather than of the handler.
+
+    Place this before AuthenticationMiddleware so principal lookups can use the request's loaders.
+    """
+    def __init__(self, db: Database, spec: Optional[Specification]=None) -> None:
         self.db = db
+        self.spec = spec
+
+    def operation_id(self, req: falcon.Request) -> str:
+        if self.spec:
+            try:
+                return self.spec.operations.resolve(req).id
+            except KeyError:
+                pass
+        return f"{req.method} {req.uri_template}"
+
+    def process_request(self, req: falcon.Request, resp: falcon.Response) -> None:
+        req.context["loaders"] = Loaders(self.db)
+        req.context["on_commit"] = []
+        if self.db.instrumentation:
+            self.db.instrumentation.begin()
+
+    def process_resource(self, req: falcon.Request, resp: falcon.Response, resource, params: dict) -> None:
+        if self.db.instrumentation:
+            stats = self.db.instrumentation.current
+            if stats is not None:
+                stats.operation_id = self.operation_id(req)
 
     def process_response(self, req, resp, resource, req_succeeded: bool, **__) -> None:
+        committed = False
         try:
             if self.db.autocommit:
+                start = time.perf_counter() if hooks.commit_done.enabled else 0
                 if req_succeeded:
                     self.db.session.commit()
                 else:
                     self.db.session.rollback()
+                if start:
+                    hooks.commit_done.emit(req, time.perf_counter() - start)
+            committed = req_succeeded
         finally:
+            # memoized rows belong to the session that's about to be removed
+            loaders = req.context.pop("loaders", None)
+            if loaders is not None:
+                loaders.clear()
             self.db.session.remove()
+            instrumentation = self.db.instrumentation
+            if instrumentation:
+                stats = instrumentation.finish()
+                if stats is not None and instrumentation.debug_header:
+                    resp.set_header(instrumentation.header, stats.summary(instrumentation.n_plus_one_threshold))
+            for fn in req.context.pop("on_commit", ()):
+                # noinspection PyBroadException
+                try:
+                    fn(committed)
+                except Exception:
+                    logger.exception("on_commit callback %r failed", fn)
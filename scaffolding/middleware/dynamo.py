@@ -0,0 +1,215 @@
+import json
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import bloop
+import boto3
+import falcon
+from bloop.engine import dump_key
+from bloop.exceptions import MissingObjects
+from botocore.config import Config
+
+
+__all__ = ["DynamoDatabase", "DynamoMiddleware", "UnitOfWork"]
+logger = logging.getLogger(__name__)
+# DynamoDB limits
+BATCH_WRITE_SIZE = 25
+
+
+# BatchWriteItem needs each item's table name and wire format, which bloop 2.4 only computes privately.  Its
+# internals are used here and nowhere else, and requirements.txt pins bloop to 2.4.x so they can't move.
+def _table_name(engine: bloop.Engine, model) -> str:
+    return engine._compute_table_name(model)
+
+
+def _item(engine: bloop.Engine, obj) -> dict:
+    return engine._dump(obj.__class__, obj)
+
+
+# noinspection PyShadowingNames
+class DynamoDatabase:
+    """bloop counterpart to :class:`~scaffolding.middleware.Database`.
+
+    One engine and one pooled dynamodb client are shared by every request in the process.
+    Call ``init`` after forking; clients and their connection pools must not cross process boundaries.
+
+    .. code-block:: python
+
+        >>> db = DynamoDatabase()
+        >>> db.init(region="us-west-2", base=MyBaseModel)
+        >>> # against DynamoDB Local
+        >>> db.init(region="us-west-2", endpoint_url="http://localhost:8000", base=MyBaseModel)
+    """
+    def __init__(self, autocommit=True) -> None:
+        self.engine = None  # type: Optional[bloop.Engine]
+        self.client = None
+        self.autocommit = autocommit
+
+    def init(
+            self, *,
+            region: Optional[str]=None,
+            endpoint_url: Optional[str]=None,
+            base=bloop.BaseModel,
+            table_name_template: str="{table_name}",
+            max_pool_connections: int=50,
+            skip_table_setup: bool=False) -> None:
+        session = boto3.session.Session(region_name=region)
+        config = Config(max_pool_connections=max_pool_connections)
+        self.client = session.client("dynamodb", endpoint_url=endpoint_url, config=config)
+        streams = session.client("dynamodbstreams", endpoint_url=endpoint_url, config=config)
+        self.engine = bloop.Engine(
+            dynamodb=self.client, dynamodbstreams=streams,
+            table_name_template=table_name_template)
+        self.engine.bind(base, skip_table_setup=skip_table_setup)
+
+    def unit_of_work(self) -> "UnitOfWork":
+        return UnitOfWork(self)
+
+    def create_middleware(self) -> "DynamoMiddleware":
+        return DynamoMiddleware(self)
+
+
+class UnitOfWork:
+    """Coalesces the reads and writes of a single request.
+
+    * ``get`` returns an identity-mapped object whose load is deferred until ``flush_loads``,
+      so every pending object is read with as few BatchGetItem calls as possible
+    * ``save`` and ``delete`` are queued and sent with BatchWriteItem on ``commit``
+
+    Batched writes are unconditional and don't fire bloop's ``object_saved`` or ``object_deleted`` signals;
+    use ``db.engine.save`` directly when you need a condition.
+    """
+    def __init__(self, db: DynamoDatabase) -> None:
+        self.db = db
+        self.objects = {}  # type: Dict[Tuple[type, str], object]
+        self.missing = set()  # type: set
+        self.pending_loads = []  # type: List[object]
+        self.pending_writes = {}  # type: Dict[Tuple[str, str], Tuple[str, object]]
+
+    def _key(self, model, obj) -> Tuple[type, str]:
+        return model, json.dumps(dump_key(self.db.engine, obj), sort_keys=True)
+
+    def get(self, model, **key):
+        """Returns the object for ``key``, queueing a load if this request hasn't seen it yet"""
+        obj = model(**key)
+        identity = self._key(model, obj)
+        try:
+            return self.objects[identity]
+        except KeyError:
+            self.objects[identity] = obj
+            self.pending_loads.append(obj)
+            return obj
+
+    def fetch(self, model, **key):
+        """Like ``get`` but loads immediately, along with anything else pending.  Returns None if missing."""
+        obj = self.get(model, **key)
+        self.flush_loads()
+        if id(obj) in self.missing:
+            return None
+        return obj
+
+    def is_missing(self, obj) -> bool:
+        self.flush_loads()
+        return id(obj) in self.missing
+
+    def flush_loads(self, consistent: bool=False) -> None:
+        if not self.pending_loads:
+            return
+        objs, self.pending_loads = self.pending_loads, []
+        try:
+            self.db.engine.load(*objs, consistent=consistent)
+        except MissingObjects as e:
+            self.missing.update(id(obj) for obj in e.objects)
+
+    def save(self, *objs) -> None:
+        for obj in objs:
+            self._queue_write("PutRequest", obj)
+
+    def delete(self, *objs) -> None:
+        for obj in objs:
+            self._queue_write("DeleteRequest", obj)
+
+    def _queue_write(self, action: str, obj) -> None:
+        engine = self.db.engine
+        model = obj.__class__
+        # a later write replaces an earlier one; BatchWriteItem rejects duplicate keys in one call
+        table = _table_name(engine, model)
+        key = json.dumps(dump_key(engine, obj), sort_keys=True)
+        self.pending_writes[table, key] = action, obj
+
+    def commit(self, max_attempts: int=5) -> None:
+        engine = self.db.engine
+        requests = []
+        for (table, _), (action, obj) in self.pending_writes.items():
+            if action == "PutRequest":
+                request = {"PutRequest": {"Item": _item(engine, obj)}}
+            else:
+                request = {"DeleteRequest": {"Key": dump_key(engine, obj)}}
+            requests.append((table, request))
+        self.pending_writes.clear()
+        for i in range(0, len(requests), BATCH_WRITE_SIZE):
+            items = {}
+            for table, request in requests[i:i + BATCH_WRITE_SIZE]:
+                items.setdefault(table, []).append(request)
+            self._batch_write(items, max_attempts)
+
+    def _batch_write(self, items: dict, max_attempts: int) -> None:
+        for attempt in range(max_attempts):
+            response = self.db.client.batch_write_item(RequestItems=items)
+            items = response.get("UnprocessedItems")
+            if not items:
+                return
+            time.sleep(0.05 * 2 ** attempt)
+        remaining = sum(len(v) for v in items.values())
+        raise RuntimeError(f"failed to write {remaining} items after {max_attempts} attempts")
+
+    def begin_nested(self) -> "Savepoint":
+        """Marks the queued writes, so the ones queued after can be dropped without the rest"""
+        return Savepoint(self)
+
+    def rollback(self) -> None:
+        self.pending_loads.clear()
+        self.pending_writes.clear()
+
+    def clear(self) -> None:
+        self.rollback()
+        self.objects.clear()
+        self.missing.clear()
+
+
+class Savepoint:
+    """The writes a :class:`UnitOfWork` had queued when it was taken; like a SQLAlchemy nested transaction"""
+    def __init__(self, uow: UnitOfWork) -> None:
+        self.uow = uow
+        self.writes = dict(uow.pending_writes)
+
+    def commit(self) -> None:
+        # writes are only sent when the unit of work commits
+        pass
+
+    def rollback(self) -> None:
+        self.uow.pending_writes.clear()
+        self.uow.pending_writes.update(self.writes)
+
+
+class DynamoMiddleware:
+    """Attaches a :class:`UnitOfWork` as ``req.context["dynamo"]`` and commits its writes after the request"""
+    def __init__(self, db: DynamoDatabase) -> None:
+        self.db = db
+
+    def process_request(self, req: falcon.Request, resp: falcon.Response) -> None:
+        req.context["dynamo"] = self.db.unit_of_work()
+
+    def process_response(self, req, resp, resource, req_succeeded: bool, **__) -> None:
+        uow = req.context.pop("dynamo", None)
+        if uow is None:
+            return
+        try:
+            if self.db.autocommit:
+                if req_succeeded:
+                    uow.commit()
+                else:
+                    uow.rollback()
+        finally:
+            uow.clear()
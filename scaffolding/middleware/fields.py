@@ -0,0 +1,93 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import falcon
+import sqlalchemy.orm
+
+from ..exc import Exceptions
+from ..openapi import Operation, Specification
+from ..openapi.fields import parse_fields, projection, selectable_fields
+from ..openapi.serialization import _attr
+from ..resources import in_spec
+
+
+__all__ = ["SparseFieldsets", "load_only"]
+logger = logging.getLogger(__name__)
+
+
+class SparseFieldsets:
+    """Validates a ``fields=a,b`` query parameter against the operation's response schema.
+
+    The selection is stored as a tuple in schema order in ``req.context["fields"]``; it's absent when the request
+    doesn't ask for one.  Names are properties of the objects the response lists (the items of an array
+    response, or of an envelope's only array of objects; ``x-fields-envelope`` names the envelope when there are
+    several) or else of the response object itself.  Unknown names are rejected with ``invalid_parameter``.
+
+    :class:`SchemaSerialization` renders only the selected properties, and :func:`load_only` loads only their
+    columns:
+
+    .. code-block:: python
+
+        >>> def on_get(self, req, resp, **params):
+        ...     query = load_only(db.session.query(User), User, req.context.get("fields"))
+        ...     resp.media = {"users": query.limit(params["limit"]).all()}
+
+    Put this after validation and before :class:`ResponseCache` and :class:`Coalescing`.  Operations that declare
+    their own ``fields`` parameter are left alone.
+    """
+    def __init__(self, spec: Specification, param: str="fields") -> None:
+        self.spec = spec
+        self.param = param
+        self._allowed = {}  # type: Dict[str, Tuple[str, ...]]
+
+    def allowed(self, operation: Operation) -> Tuple[str, ...]:
+        try:
+            return self._allowed[operation.id]
+        except KeyError:
+            pass
+        allowed = ()  # type: Tuple[str, ...]
+        if not self._declared(operation):
+            allowed = selectable_fields(*projection(operation.raw))
+        self._allowed[operation.id] = allowed
+        return allowed
+
+    def _declared(self, operation: Operation) -> bool:
+        return any(param["name"] == self.param for param in operation.raw.get("parameters", ()))
+
+    def warm_up(self, operation: Operation, resource) -> None:
+        self.allowed(operation)
+
+    def process_resource(self, req: falcon.Request, resp: falcon.Response, resource, params: dict) -> None:
+        value = req.get_param(self.param)
+        if value is None or resource is None or not in_spec(resource):
+            return
+        try:
+            operation = self.spec.operations.resolve(req)
+        except KeyError:
+            return
+        allowed = self.allowed(operation)
+        if not allowed:
+            if self._declared(operation):
+                return
+            raise Exceptions.unknown_parameter(self.param)
+        req.context["fields"] = parse_fields(value, allowed, self.param)
+
+
+def load_only(query: sqlalchemy.orm.Query, model, fields: Optional[Iterable[str]]):
+    """Limits ``query`` to the columns behind ``fields``; every column when ``fields`` is None.
+
+    A field maps to the model attribute a generated model gives it (see ``codegen.models``).  Fields that
+    aren't plain columns, such as relationships or properties, are ignored here; primary keys always load.
+    """
+    if not fields:
+        return query
+    mapper = sqlalchemy.inspect(model)
+    columns = []  # type: List[str]
+    for name in fields:
+        attr = _attr(name)
+        if attr in mapper.column_attrs:
+            columns.append(attr)
+    if not columns:
+        # load_only needs at least one column; the primary key is loaded regardless
+        columns = [mapper.get_property_by_column(mapper.primary_key[0]).key]
+    return query.options(sqlalchemy.orm.load_only(*columns))
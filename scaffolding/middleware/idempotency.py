@@ -0,0 +1,350 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+import falcon
+import sqlalchemy
+from sqlalchemy.exc import IntegrityError
+
+from ..exc import Exceptions
+from ..openapi import Operation, Specification
+from ..resources import get_tag, in_spec
+from .cache import CacheBackend, MemoryCache, ResponseSnapshot, _principal_key
+from .coalesce import SingleFlight
+from .database import Database
+
+
+__all__ = ["Idempotency", "IdempotencyPolicy", "IdempotentResponse", "SqlIdempotencyStore"]
+logger = logging.getLogger(__name__)
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+class IdempotentResponse(ResponseSnapshot):
+    """A stored response, and a fingerprint of the request that produced it"""
+    __slots__ = ("fingerprint",)
+
+    def __init__(self, *args, fingerprint: str="", **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.fingerprint = fingerprint
+
+
+class IdempotencyPolicy:
+    """How one operation honors Idempotency-Key.  Built from ``@tag(idempotency=...)`` or ``x-idempotency``:
+
+    * True uses the defaults
+    * a number is the ttl in seconds
+    * a dict holds the arguments below, eg. ``{"ttl": 3600, "required": True}``
+
+    With ``required``, requests without the header are rejected instead of running unprotected.
+    """
+    __slots__ = ("ttl", "required")
+
+    def __init__(self, ttl: float=24 * 60 * 60, required: bool=False) -> None:
+        self.ttl = ttl
+        self.required = required
+
+    @classmethod
+    def parse(cls, value) -> Optional["IdempotencyPolicy"]:
+        if value is None or value is False:
+            return None
+        if isinstance(value, IdempotencyPolicy):
+            return value
+        if value is True:
+            return cls()
+        if isinstance(value, (int, float)):
+            return cls(ttl=value)
+        if isinstance(value, dict):
+            return cls(**value)
+        raise RuntimeError(f"unexpected idempotency policy {value!r}")
+
+
+class SqlIdempotencyStore(CacheBackend):
+    """Responses stored in a table, shared by every process using the database.
+
+    Besides the :class:`CacheBackend` methods, ``claim`` inserts a placeholder row so only one process runs a key
+    at a time; the others see no response yet and wait.  Claims expire after ``claim_ttl`` seconds in case their
+    process dies.  Writes use their own connection, not the request's session, so a stored response doesn't
+    depend on the handler's transaction.  Expired rows are removed as they're read; ``purge`` removes the rest.
+
+    The table is added to ``db.base.metadata``, so ``Database.init`` creates it; it's also created on first use.
+    """
+    def __init__(self, db: Database, table_name: str="scaffolding_idempotency", claim_ttl: float=60.0) -> None:
+        self.db = db
+        self.claim_ttl = claim_ttl
+        self.table = db.base.metadata.tables.get(table_name)
+        if self.table is None:
+            self.table = sqlalchemy.Table(
+                table_name, db.base.metadata,
+                sqlalchemy.Column("key", sqlalchemy.String(64), primary_key=True),
+                sqlalchemy.Column("expires", sqlalchemy.Float, nullable=False),
+                # null while claimed
+                sqlalchemy.Column("status", sqlalchemy.String(64), nullable=True),
+                sqlalchemy.Column("content_type", sqlalchemy.String(255), nullable=True),
+                sqlalchemy.Column("headers", sqlalchemy.Text, nullable=True),
+                sqlalchemy.Column("etag", sqlalchemy.String(255), nullable=True),
+                sqlalchemy.Column("fingerprint", sqlalchemy.String(64), nullable=True),
+                sqlalchemy.Column("data", sqlalchemy.LargeBinary, nullable=True),
+            )
+        self._created = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(key: Hashable) -> str:
+        return hashlib.sha256(repr(key).encode()).hexdigest()
+
+    @property
+    def engine(self):
+        if self.db.engine is None:
+            raise RuntimeError("must call Database.init before using SqlIdempotencyStore")
+        if not self._created:
+            with self._lock:
+                if not self._created:
+                    self.table.create(self.db.engine, checkfirst=True)
+                    self._created = True
+        return self.db.engine
+
+    def get(self, key: Hashable) -> Optional[IdempotentResponse]:
+        t = self.table
+        digest = self.digest(key)
+        with self.engine.connect() as conn:
+            row = conn.execute(sqlalchemy.select([t]).where(t.c.key == digest)).first()
+            if row is None:
+                return None
+            if row[t.c.expires] < time.time():
+                conn.execute(t.delete().where(t.c.key == digest).where(t.c.expires == row[t.c.expires]))
+                return None
+        if row[t.c.status] is None:
+            return None
+        return IdempotentResponse(
+            row[t.c.status], row[t.c.content_type], row[t.c.data] or b"",
+            json.loads(row[t.c.headers] or "{}"), row[t.c.etag], fingerprint=row[t.c.fingerprint] or "")
+
+    def claim(self, key: Hashable) -> bool:
+        """True if this process should run the request; False if another holds the key or already answered it"""
+        t = self.table
+        digest = self.digest(key)
+        now = time.time()
+        with self.engine.begin() as conn:
+            # an expired claim or response is fair game
+            conn.execute(t.delete().where(t.c.key == digest).where(t.c.expires < now))
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(t.insert().values(key=digest, expires=now + self.claim_ttl))
+        except IntegrityError:
+            return False
+        return True
+
+    def release(self, key: Hashable) -> None:
+        """Drops this process's claim without storing a response, so a retry runs again"""
+        t = self.table
+        with self.engine.begin() as conn:
+            conn.execute(t.delete().where(t.c.key == self.digest(key)).where(t.c.status.is_(None)))
+
+    def set(self, key: Hashable, snapshot: ResponseSnapshot, ttl: float) -> None:
+        t = self.table
+        digest = self.digest(key)
+        values = {
+            "key": digest,
+            "expires": time.time() + ttl,
+            "status": snapshot.status,
+            "content_type": snapshot.content_type,
+            "headers": json.dumps(snapshot.headers),
+            "etag": snapshot.etag,
+            "fingerprint": getattr(snapshot, "fingerprint", None),
+            "data": snapshot.data,
+        }
+        with self.engine.begin() as conn:
+            conn.execute(t.delete().where(t.c.key == digest))
+            conn.execute(t.insert().values(**values))
+
+    def delete(self, key: Hashable) -> None:
+        t = self.table
+        with self.engine.begin() as conn:
+            conn.execute(t.delete().where(t.c.key == self.digest(key)))
+
+    def clear(self) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(self.table.delete())
+
+    def purge(self) -> int:
+        """Deletes expired rows and returns how many there were"""
+        t = self.table
+        with self.engine.begin() as conn:
+            return conn.execute(t.delete().where(t.c.expires < time.time())).rowcount
+
+
+def _fingerprint(req: falcon.Request, params: dict) -> str:
+    body = req.media if req.content_length else None
+    payload = json.dumps([req.method, params, body], sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+class Idempotency:
+    """Runs each ``Idempotency-Key`` once per principal and operation, and replays the first response to retries.
+
+    Operations opt in with ``@tag(idempotency=...)`` on the handler or an ``x-idempotency`` extension; see
+    :class:`IdempotencyPolicy`.  The first response that isn't a 5xx (or a 409/429, which a retry should redo) is
+    stored for the policy's ttl, and retries get it back with ``Idempotent-Replayed: true`` without running the
+    handler.  Reusing a key with different params or body is rejected.  A retry that arrives while the first
+    request is still running waits up to ``timeout`` seconds for its response, then gets a 409.
+
+    .. code-block:: python
+
+        >>> class OrdersResource:
+        ...     @tag(idempotency={"ttl": 3600, "required": True})
+        ...     def on_post(self, req, resp): ...
+        >>> idempotency = Idempotency(spec, SqlIdempotencyStore(db))
+        >>> api = falcon.API(middleware=[db_middleware, MyAuthentication(spec), OpenApiRequestValidation(spec),
+        ...                              idempotency])
+
+    The default store is a bounded in-process :class:`~scaffolding.middleware.MemoryCache`; with pre-forked
+    workers use :class:`SqlIdempotencyStore` so a retry that lands on another worker still finds the response.
+    Put this after authentication and validation, so keys include the principal and rejected requests never
+    claim a key.  ``principal_key`` maps ``req.context["principal"]`` to something that's the same for each of the
+    principal's requests; the default uses the value's ``id``, as :class:`~scaffolding.middleware.ResponseCache`
+    does.  Behind :class:`~scaffolding.middleware.DatabaseMiddleware` the response is only stored once the
+    request's session has committed; if the commit fails the key is released and a retry runs again.
+    """
+    def __init__(
+            self, spec: Specification,
+            store: Optional[CacheBackend]=None,
+            timeout: float=10.0,
+            poll_interval: float=0.05,
+            principal_key: Callable[[dict], Hashable]=_principal_key,
+            headers: Iterable[str]=()) -> None:
+        self.spec = spec
+        self.store = store or MemoryCache(max_entries=10000, max_bytes=64 * 1024 * 1024)
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.principal_key = principal_key
+        # extra response headers to replay; ETag and Content-Type are always kept
+        self.headers = tuple(headers)
+        self.flights = SingleFlight()
+        self._policies = {}  # type: Dict[Tuple[type, str], Optional[IdempotencyPolicy]]
+
+    def policy(self, resource, method: str, operation: Operation) -> Optional[IdempotencyPolicy]:
+        key = type(resource), method
+        try:
+            return self._policies[key]
+        except KeyError:
+            pass
+        value = get_tag("idempotency", resource, method)
+        if value is None:
+            value = operation.raw.get("x-idempotency")
+        policy = self._policies[key] = IdempotencyPolicy.parse(value)
+        return policy
+
+    def warm_up(self, operation: Operation, resource) -> None:
+        if resource is not None:
+            self.policy(resource, operation.verb.upper(), operation)
+
+    def process_resource(self, req: falcon.Request, resp: falcon.Response, resource, params: dict) -> None:
+        if resource is None or not in_spec(resource):
+            return
+        try:
+            operation = self.spec.operations.resolve(req)
+        except KeyError:
+            return
+        policy = self.policy(resource, req.method, operation)
+        if policy is None:
+            return
+        idempotency_key = req.get_header(HEADER)
+        if idempotency_key is None:
+            if policy.required:
+                raise Exceptions.missing_parameter(HEADER)
+            return
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            raise Exceptions.invalid_parameter(HEADER, idempotency_key, constraint=f"be 1-{MAX_KEY_LENGTH} characters")
+        principal = req.context.get("principal")
+        key = operation.id, principal and self.principal_key(principal), idempotency_key
+        fingerprint = _fingerprint(req, params)
+
+        # one request per key runs in this process; the rest wait for its response
+        deadline = time.monotonic() + self.timeout
+        while True:
+            leader, flight = self.flights.join(key)
+            if leader:
+                break
+            stored = self.flights.wait(flight, max(0.0, deadline - time.monotonic()))
+            if stored is not None:
+                self._replay(stored, idempotency_key, fingerprint, resp)
+                return
+            if time.monotonic() >= deadline:
+                raise Exceptions.request_in_progress()
+            # the leader failed without a response; take its place
+
+        try:
+            stored = self._stored_or_claim(key, deadline)
+        except Exception:
+            self.flights.finish(key, flight, None)
+            raise
+        if stored is not None:
+            self.flights.finish(key, flight, stored)
+            self._replay(stored, idempotency_key, fingerprint, resp)
+            return
+        req.context["idempotency"] = key, flight, fingerprint, policy
+
+    def _stored_or_claim(self, key: Hashable, deadline: float) -> Optional[IdempotentResponse]:
+        """The stored response, or None once this process holds the key"""
+        claim = getattr(self.store, "claim", None)
+        while True:
+            stored = self.store.get(key)
+            if stored is not None:
+                return stored
+            if claim is None or claim(key):
+                return None
+            # another process is running it
+            if time.monotonic() >= deadline:
+                raise Exceptions.request_in_progress()
+            time.sleep(self.poll_interval)
+
+    @staticmethod
+    def _replay(stored: IdempotentResponse, idempotency_key: str, fingerprint: str, resp: falcon.Response) -> None:
+        if stored.fingerprint != fingerprint:
+            raise Exceptions.invalid_parameter(HEADER, idempotency_key, constraint="not be reused for another request")
+        stored.apply(resp)
+        resp.set_header(REPLAYED_HEADER, "true")
+        resp.complete = True
+
+    def process_response(self, req, resp, resource, req_succeeded: bool, **__) -> None:
+        running = req.context.pop("idempotency", None)
+        if running is None:
+            return
+        key, flight, fingerprint, policy = running
+        response = None
+        try:
+            status = resp.status[:3]
+            if req_succeeded and status[0] != "5" and status not in ("409", "429"):
+                snapshot = ResponseSnapshot.capture(resp, self.headers)
+                if snapshot is not None:
+                    response = IdempotentResponse(
+                        snapshot.status, snapshot.content_type, snapshot.data, snapshot.headers, snapshot.etag,
+                        fingerprint=fingerprint)
+        finally:
+            on_commit = req.context.get("on_commit")
+            if on_commit is None:
+                self._finish(key, flight, response, policy)
+            else:
+                # DatabaseMiddleware hasn't committed yet; a response whose writes roll back must not be replayed
+                on_commit.append(lambda committed: self._finish(key, flight, response if committed else None, policy))
+
+    def _finish(
+            self, key: Hashable, flight, response: Optional[IdempotentResponse],
+            policy: IdempotencyPolicy) -> None:
+        stored = None
+        try:
+            if response is not None:
+                self.store.set(key, response, policy.ttl)
+                stored = response
+            else:
+                release = getattr(self.store, "release", None)
+                if release:
+                    release(key)
+        finally:
+            self.flights.finish(key, flight, stored)
@@ -0,0 +1,123 @@
+from typing import Any, Callable, Dict, Hashable, Iterable, List
+
+
+__all__ = ["BatchLoader", "Deferred", "Loaders", "model_batch_fn"]
+BatchFn = Callable[[List[Hashable]], Dict[Hashable, Any]]
+
+
+class Deferred:
+    """A key that has been requested but not necessarily loaded yet.
+
+    Reading ``value`` loads every key that is pending on the same loader in one batch.
+    """
+    __slots__ = ("loader", "key")
+
+    def __init__(self, loader: "BatchLoader", key: Hashable) -> None:
+        self.loader = loader
+        self.key = key
+
+    @property
+    def value(self) -> Any:
+        return self.loader.get(self.key)
+
+
+class BatchLoader:
+    """Request-scoped DataLoader.
+
+    Keys requested with ``defer`` are collected until a value is read, then ``batch_fn`` is called
+    once with every pending key.  ``batch_fn`` returns a dict of the keys it found; missing keys load as None.
+    Results are memoized until ``clear``.
+
+    .. code-block:: python
+
+        >>> loader = req.context["loaders"].model(User)
+        >>> owners = [loader.defer(widget.owner_id) for widget in widgets]
+        >>> [o.value for o in owners]  # one SELECT ... WHERE id IN (...)
+    """
+    def __init__(self, batch_fn: BatchFn) -> None:
+        self.batch_fn = batch_fn
+        self.cache = {}  # type: Dict[Hashable, Any]
+        self.pending = {}  # type: Dict[Hashable, None]
+
+    def defer(self, key: Hashable) -> Deferred:
+        if key not in self.cache:
+            self.pending[key] = None
+        return Deferred(self, key)
+
+    def get(self, key: Hashable) -> Any:
+        try:
+            return self.cache[key]
+        except KeyError:
+            self.pending[key] = None
+            self.dispatch()
+            return self.cache[key]
+
+    def load(self, key: Hashable) -> Any:
+        return self.get(key)
+
+    def load_many(self, keys: Iterable[Hashable]) -> List[Any]:
+        keys = list(keys)
+        for key in keys:
+            if key not in self.cache:
+                self.pending[key] = None
+        self.dispatch()
+        return [self.cache[key] for key in keys]
+
+    def prime(self, key: Hashable, value: Any) -> None:
+        self.pending.pop(key, None)
+        self.cache[key] = value
+
+    def dispatch(self) -> None:
+        if not self.pending:
+            return
+        keys = list(self.pending)
+        self.pending.clear()
+        found = self.batch_fn(keys)
+        for key in keys:
+            self.cache[key] = found.get(key)
+
+    def clear(self) -> None:
+        self.cache.clear()
+        self.pending.clear()
+
+
+def model_batch_fn(db, model, column: str="id") -> BatchFn:
+    """Loads rows of ``model`` with a single ``column IN (...)`` query through ``db.session``"""
+    attr = getattr(model, column)
+
+    def load(keys: List[Hashable]) -> Dict[Hashable, Any]:
+        rows = db.session.query(model).filter(attr.in_(keys)).all()
+        return {getattr(row, column): row for row in rows}
+    return load
+
+
+class Loaders:
+    """The loaders for a single request, available as ``req.context["loaders"]``.
+
+    Named loaders come from ``Database.register_loader``; model loaders are created on first use.
+    """
+    def __init__(self, db) -> None:
+        self.db = db
+        self._loaders = {}  # type: Dict[Hashable, BatchLoader]
+
+    def get(self, name: str) -> BatchLoader:
+        try:
+            return self._loaders[name]
+        except KeyError:
+            loader = self._loaders[name] = BatchLoader(self.db.loaders[name])
+            return loader
+
+    __getitem__ = get
+
+    def model(self, model, column: str="id") -> BatchLoader:
+        key = model, column
+        try:
+            return self._loaders[key]
+        except KeyError:
+            loader = self._loaders[key] = BatchLoader(model_batch_fn(self.db, model, column))
+            return loader
+
+    def clear(self) -> None:
+        for loader in self._loaders.values():
+            loader.clear()
+        self._loaders.clear()
@@ -0,0 +1,341 @@
+import bisect
+import contextlib
+import fcntl
+import glob
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import falcon
+
+from .. import hooks
+from ..resources import in_spec, tag
+from ..warmup import is_warmup
+
+
+__all__ = ["Metrics", "MetricsResource"]
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SHARDS = 16
+UNKNOWN = "unknown"
+# exited workers' counters, summed
+RETIRED = "metrics-retired.json"
+
+
+class _Shard:
+    """Counters for the threads given this shard; the lock is almost never contended"""
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self) -> None:
+        self.requests = {}  # type: Dict[Tuple[str, str], int]
+        self.principals = {}  # type: Dict[Tuple[str, str], int]
+        self.errors = {}  # type: Dict[str, int]
+        # (operation, stage) -> [bucket counts..., +Inf count, sum]
+        self.durations = {}  # type: Dict[Tuple[str, str], List[float]]
+
+
+class Metrics:
+    """Per-operation request counters and fixed-bucket latency histograms.
+
+    Put this first in the middleware list so ``total`` covers every other middleware, then expose the
+    Prometheus text format with ``install``::
+
+        >>> metrics = Metrics(directory="/run/my-service/metrics")
+        >>> api = falcon.API(middleware=[metrics, db_middleware, MyAuthentication(spec), ...])
+        >>> metrics.install(api, "/metrics")
+
+    Stages are ``total``, ``auth`` and ``validation`` (from the auth_done and validation_done hooks) and
+    ``handler``, which runs from the end of validation until this middleware's process_response.
+
+    With a ``directory``, each process periodically writes its counters to ``metrics-<pid>.json`` and a scrape
+    sums every file, so pre-forked workers report as one service.  Add ``metrics.retire`` to
+    ``PreforkServer.on_worker_exit``: an exiting worker's counts are part of the service's cumulative totals, so
+    they're added to ``metrics-retired.json`` and its own file is removed.  A worker that was killed before it
+    could retire leaves its file; it's counted until a new worker gets the same pid and retires it.  Clear the
+    directory when the service starts.
+    """
+    def __init__(
+            self,
+            directory: Optional[str]=None,
+            buckets: Sequence[float]=BUCKETS,
+            flush_interval: float=5.0) -> None:
+        self.directory = directory
+        self.buckets = tuple(sorted(buckets))
+        self.flush_interval = flush_interval
+        self._shards = [_Shard() for _ in range(SHARDS)]
+        # thread idents are aligned addresses, so each thread is handed the next shard instead
+        self._local = threading.local()
+        self._next_shard = itertools.count()
+        self._pid = None  # type: Optional[int]
+        self._pid_lock = threading.Lock()
+        self._flusher = None  # type: Optional[threading.Thread]
+        self._flush_lock = threading.Lock()
+        self._retired = False
+        hooks.auth_done.subscribe(self._on_auth_done)
+        hooks.validation_done.subscribe(self._on_validation_done)
+        hooks.error_raised.subscribe(self._on_error_raised)
+
+    def install(self, api: falcon.API, route: str="/metrics") -> None:
+        api.add_route(route, MetricsResource(self))
+
+    # middleware ======================================================================================================
+
+    def process_request(self, req: falcon.Request, resp: falcon.Response) -> None:
+        if not is_warmup(req):
+            req.context["metrics"] = {"start": time.perf_counter()}
+
+    def process_response(self, req, resp, resource, req_succeeded: bool, **__) -> None:
+        ctx = req.context.get("metrics")
+        if ctx is None or (resource is not None and not in_spec(resource)):
+            return
+        now = time.perf_counter()
+        operation = req.context.get("operation")
+        operation_id = operation.id if operation else UNKNOWN
+        principal = req.context.get("principal")
+        shard = self._shard()
+        with shard.lock:
+            key = operation_id, resp.status[:3]
+            shard.requests[key] = shard.requests.get(key, 0) + 1
+            if principal:
+                key = operation_id, principal["type"]
+                shard.principals[key] = shard.principals.get(key, 0) + 1
+            self._observe(shard, operation_id, "total", now - ctx["start"])
+            if "auth" in ctx:
+                self._observe(shard, operation_id, "auth", ctx["auth"])
+            if "validated" in ctx:
+                self._observe(shard, operation_id, "validation", ctx["validation"])
+                self._observe(shard, operation_id, "handler", now - ctx["validated"])
+
+    # noinspection PyUnusedLocal
+    def _on_auth_done(self, req, principal, elapsed) -> None:
+        ctx = req.context.get("metrics")
+        if ctx is not None:
+            ctx["auth"] = elapsed
+
+    # noinspection PyUnusedLocal
+    def _on_validation_done(self, req, operation, elapsed) -> None:
+        ctx = req.context.get("metrics")
+        if ctx is not None:
+            ctx["validation"] = elapsed
+            ctx["validated"] = time.perf_counter()
+
+    # noinspection PyUnusedLocal
+    def _on_error_raised(self, req, error) -> None:
+        if "metrics" not in req.context:
+            return
+        shard = self._shard()
+        with shard.lock:
+            shard.errors[error.code.id] = shard.errors.get(error.code.id, 0) + 1
+
+    # storage =========================================================================================================
+
+    def _shard(self) -> _Shard:
+        pid = os.getpid()
+        if pid != self._pid:
+            self._after_fork(pid)
+        try:
+            return self._shards[self._local.shard]
+        except AttributeError:
+            index = self._local.shard = next(self._next_shard) % SHARDS
+            return self._shards[index]
+
+    def _after_fork(self, pid: int) -> None:
+        with self._pid_lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+        # counts inherited from the parent belong to the parent's file
+        for shard in self._shards:
+            shard.clear()
+        self._retired = False
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            # left by an earlier process with this pid that didn't retire; keep its counts before replacing it
+            stale = self._path(pid)
+            if os.path.exists(stale):
+                with self._locked(fcntl.LOCK_EX):
+                    self._fold(_read(stale), stale)
+            self._flusher = threading.Thread(target=self._flush_forever, name="scaffolding-metrics", daemon=True)
+            self._flusher.start()
+
+    def _observe(self, shard: _Shard, operation_id: str, stage: str, value: float) -> None:
+        key = operation_id, stage
+        histogram = shard.durations.get(key)
+        if histogram is None:
+            histogram = shard.durations[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        histogram[bisect.bisect_left(self.buckets, value)] += 1
+        histogram[-1] += value
+
+    def snapshot(self) -> dict:
+        """This process's counters, merged across shards"""
+        requests, principals, errors, durations = {}, {}, {}, {}
+        for shard in self._shards:
+            with shard.lock:
+                _merge(requests, shard.requests)
+                _merge(principals, shard.principals)
+                _merge(errors, shard.errors)
+                for key, histogram in shard.durations.items():
+                    _merge_histogram(durations, key, histogram)
+        return _pack(requests, principals, errors, durations)
+
+    def flush(self) -> None:
+        if not self.directory or self._pid != os.getpid():
+            return
+        with self._flush_lock:
+            if not self._retired:
+                _write(self._path(self._pid), self.snapshot())
+
+    def retire(self) -> None:
+        """Adds this process's counters to the retired totals and removes its file.  Call as a worker exits."""
+        if not self.directory or self._pid != os.getpid():
+            return
+        with self._flush_lock:
+            self._retired = True
+            with self._locked(fcntl.LOCK_EX):
+                self._fold(self.snapshot(), self._path(self._pid))
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"metrics-{pid}.json")
+
+    @contextlib.contextmanager
+    def _locked(self, operation: int):
+        # shared by scrapes, exclusive while a file moves into the retired totals so it's never counted twice
+        with open(os.path.join(self.directory, "metrics.lock"), "a") as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _fold(self, data: Optional[dict], path: str) -> None:
+        retired = os.path.join(self.directory, RETIRED)
+        totals = {}, {}, {}, {}
+        for counts in (_read(retired), data):
+            if counts:
+                _unpack(counts, *totals)
+        _write(retired, _pack(*totals))
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+    def _flush_forever(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            # noinspection PyBroadException
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("failed to flush metrics")
+
+    def collect(self) -> dict:
+        """Counters for every process sharing ``directory``, or just this one"""
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        totals = {}, {}, {}, {}
+        with self._locked(fcntl.LOCK_SH):
+            for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+                data = _read(path)
+                if data is not None:
+                    _unpack(data, *totals)
+        return _pack(*totals)
+
+    def render(self) -> str:
+        data = self.collect()
+        lines = [
+            "# HELP scaffolding_requests_total Requests by operation and status code.",
+            "# TYPE scaffolding_requests_total counter",
+        ]
+        for operation_id, status, n in sorted(data["requests"]):
+            lines.append(f'scaffolding_requests_total{{operation="{operation_id}",status="{status}"}} {n}')
+        lines += [
+            "# HELP scaffolding_principals_total Authenticated requests by operation and principal type.",
+            "# TYPE scaffolding_principals_total counter",
+        ]
+        for operation_id, principal, n in sorted(data["principals"]):
+            lines.append(f'scaffolding_principals_total{{operation="{operation_id}",principal="{principal}"}} {n}')
+        lines += [
+            "# HELP scaffolding_errors_total Structured errors by code.",
+            "# TYPE scaffolding_errors_total counter",
+        ]
+        for code, n in sorted(data["errors"]):
+            lines.append(f'scaffolding_errors_total{{code="{code}"}} {n}')
+        lines += [
+            "# HELP scaffolding_request_duration_seconds Request latency by operation and stage.",
+            "# TYPE scaffolding_request_duration_seconds histogram",
+        ]
+        name = "scaffolding_request_duration_seconds"
+        for operation_id, stage, histogram in sorted(data["durations"]):
+            labels = f'operation="{operation_id}",stage="{stage}"'
+            cumulative = 0
+            for le, n in zip((*self.buckets, "+Inf"), histogram[:-1]):
+                cumulative += n
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram[-1]}")
+            lines.append(f"{name}_count{{{labels}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _pack(requests: dict, principals: dict, errors: dict, durations: dict) -> dict:
+    return {
+        "requests": [[*k, v] for k, v in requests.items()],
+        "principals": [[*k, v] for k, v in principals.items()],
+        "errors": [[k, v] for k, v in errors.items()],
+        "durations": [[*k, v] for k, v in durations.items()],
+    }
+
+
+def _unpack(data: dict, requests: dict, principals: dict, errors: dict, durations: dict) -> None:
+    _merge(requests, {(o, s): v for o, s, v in data["requests"]})
+    _merge(principals, {(o, p): v for o, p, v in data["principals"]})
+    _merge(errors, {c: v for c, v in data["errors"]})
+    for o, s, histogram in data["durations"]:
+        _merge_histogram(durations, (o, s), histogram)
+
+
+def _read(path: str) -> Optional[dict]:
+    try:
+        with open(path, "rt") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        logger.warning("skipping unreadable metrics file %s", path)
+        return None
+
+
+def _write(path: str, data: dict) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "wt") as out:
+        json.dump(data, out)
+    os.replace(tmp, path)
+
+
+def _merge(into: dict, counts: dict) -> None:
+    for key, n in counts.items():
+        into[key] = into.get(key, 0) + n
+
+
+def _merge_histogram(into: dict, key: tuple, histogram: list) -> None:
+    existing = into.get(key)
+    if existing is None:
+        into[key] = list(histogram)
+    else:
+        for i, n in enumerate(histogram):
+            existing[i] += n
+
+
+@tag(openapi=False)
+class MetricsResource:
+    def __init__(self, metrics: Metrics) -> None:
+        self.metrics = metrics
+
+    def on_get(self, req: falcon.Request, resp: falcon.Response) -> None:
+        resp.content_type = "text/plain; version=0.0.4"
+        resp.body = self.metrics.render()
@@ -0,0 +1,167 @@
+import hashlib
+import logging
+import mmap
+import multiprocessing
+import struct
+import time
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import falcon
+
+from ..exc import Exceptions
+from ..openapi import Specification
+from ..resources import get_tag, in_spec
+from ..warmup import is_warmup
+from .cache import _stable_id
+
+
+__all__ = ["RateLimit", "RateLimiter", "SharedBuckets"]
+logger = logging.getLogger(__name__)
+
+# key hash, tokens, last refill (monotonic seconds)
+SLOT = struct.Struct("=Qdd")
+PROBES = 4
+ANY_PRINCIPAL = "*"
+
+
+class RateLimit:
+    """A token bucket: ``rate`` requests per second on average, with bursts of up to ``burst`` requests"""
+    __slots__ = ("rate", "burst")
+
+    def __init__(self, rate: float, burst: Optional[float]=None) -> None:
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+
+    def __repr__(self) -> str:
+        return f"RateLimit(rate={self.rate}, burst={self.burst})"
+
+
+def _parse(value, principal_type: str) -> Optional[RateLimit]:
+    if value is None:
+        return None
+    if isinstance(value, RateLimit):
+        return value
+    if "rate" not in value:
+        value = value.get(principal_type, value.get(ANY_PRINCIPAL))
+        if value is None or isinstance(value, RateLimit):
+            return value
+    return RateLimit(value["rate"], value.get("burst"))
+
+
+class SharedBuckets:
+    """Token buckets in shared memory, seen by every process forked after they're created.
+
+    A key hashes to one of ``slots`` fixed-size slots (probing a few neighbours on collision) and each slot is
+    guarded by one of ``stripes`` process-shared locks, so two requests only wait on each other when their keys
+    land on the same stripe.  When every probed slot is taken, the least recently used one is reset; a reset bucket
+    starts full, so a crowded table errs toward letting requests through.
+    """
+    def __init__(self, slots: int=65536, stripes: int=64) -> None:
+        if slots % stripes:
+            raise RuntimeError("slots must be a multiple of stripes")
+        self.slots = slots
+        self.stripes = stripes
+        self._mem = mmap.mmap(-1, slots * SLOT.size, flags=mmap.MAP_SHARED)
+        self._locks = [multiprocessing.Lock() for _ in range(stripes)]
+
+    def take(self, key: bytes, limit: RateLimit, now: Optional[float]=None) -> float:
+        """Takes a token.  Returns 0 on success, otherwise the seconds until a token is available."""
+        if now is None:
+            now = time.monotonic()
+        h = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+        first = h % self.slots
+        mem = self._mem
+        with self._locks[first % self.stripes]:
+            # probed slots stay on the first slot's stripe so they're covered by its lock
+            offset, tokens = None, limit.burst
+            oldest, oldest_last = None, None
+            for i in range(PROBES):
+                index = (first + i * self.stripes) % self.slots
+                o = index * SLOT.size
+                slot_key, slot_tokens, slot_last = SLOT.unpack_from(mem, o)
+                if slot_key == h:
+                    offset = o
+                    tokens = min(limit.burst, slot_tokens + (now - slot_last) * limit.rate)
+                    break
+                if slot_key == 0:
+                    offset = o
+                    break
+                if oldest is None or slot_last < oldest_last:
+                    oldest, oldest_last = o, slot_last
+            if offset is None:
+                offset = oldest
+            if tokens >= 1.0:
+                SLOT.pack_into(mem, offset, h, tokens - 1.0, now)
+                return 0.0
+            SLOT.pack_into(mem, offset, h, tokens, now)
+            return (1.0 - tokens) / limit.rate
+
+
+def _principal_id(req: falcon.Request, principal: Optional[dict]) -> Tuple[str, Hashable]:
+    if not principal or principal["value"] is None:
+        # anonymous callers share nothing but their address
+        return "none", req.remote_addr
+    return principal["type"], principal["value"]
+
+
+class RateLimiter:
+    """Limits how often each principal can call each operation.
+
+    Limits come from ``@tag(rate_limit=...)`` on the handler, then the operation's ``x-rate-limit`` extension, then
+    ``default``.  Each is either one limit for every principal, ``{"rate": 5, "burst": 20}``, or limits by
+    principal type with ``"*"`` for the types that aren't listed, ``{"user": {"rate": 5}, "*": {"rate": 1}}``.
+
+    Put this after authentication so ``req.context["principal"]`` is set, and create it before ``PreforkServer``
+    forks so the workers share one set of buckets:
+
+    .. code-block:: python
+
+        >>> limiter = RateLimiter(spec, default={"user": {"rate": 20, "burst": 40}, "*": {"rate": 5}})
+        >>> api = falcon.API(middleware=[MyAuthentication(spec), limiter, OpenApiRequestValidation(spec)])
+
+    ``principal_key`` maps a principal's value to an id that's the same for each of its requests; the default uses
+    the value's ``id``, such as a model's primary key, or the value itself when it's a string or number.
+    Rejected requests get a 429 with Retry-After.
+    """
+    def __init__(
+            self, spec: Specification, *,
+            default=None,
+            buckets: Optional[SharedBuckets]=None,
+            principal_key: Callable[[Hashable], Hashable]=_stable_id) -> None:
+        self.spec = spec
+        self.default = default
+        self.buckets = buckets or SharedBuckets()
+        self.principal_key = principal_key
+        self._limits = {}  # type: Dict[Tuple[type, str, str], Optional[RateLimit]]
+
+    def limit(self, resource, method: str, operation_raw: dict, principal_type: str) -> Optional[RateLimit]:
+        key = type(resource), method, principal_type
+        try:
+            return self._limits[key]
+        except KeyError:
+            pass
+        limit = None
+        for value in (get_tag("rate_limit", resource, method), operation_raw.get("x-rate-limit"), self.default):
+            limit = _parse(value, principal_type)
+            if limit is not None:
+                break
+        self._limits[key] = limit
+        return limit
+
+    def process_resource(self, req: falcon.Request, resp: falcon.Response, resource, params: dict) -> None:
+        if resource is None or not in_spec(resource) or is_warmup(req):
+            return
+        try:
+            operation = self.spec.operations.resolve(req)
+        except KeyError:
+            return
+        principal_type, value = _principal_id(req, req.context.get("principal"))
+        limit = self.limit(resource, req.method, operation.raw, principal_type)
+        if limit is None:
+            return
+        if principal_type != "none":
+            value = self.principal_key(value)
+        key = f"{operation.id}\0{principal_type}\0{value!r}".encode()
+        retry_after = self.buckets.take(key, limit)
+        if retry_after:
+            raise Exceptions.too_many_requests(retry_after)
@@ -0,0 +1,96 @@
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+import falcon
+import falcon.media
+
+from ..openapi import Operation, Specification
+from ..openapi.fields import project_schema, projection, selectable_fields
+from ..openapi.serialization import Serializer, compile_serializer, dumps, response_schema
+from ..resources import in_spec
+
+
+__all__ = ["SchemaSerialization"]
+logger = logging.getLogger(__name__)
+
+
+class SchemaSerialization(falcon.media.BaseHandler):
+    """JSON media handler that renders ``resp.media`` with a serializer compiled from the operation's response schema.
+
+    falcon only passes the media to a handler, so this is also a middleware that remembers which operation and
+    response the current thread is serializing.  Install both halves:
+
+    .. code-block:: python
+
+        >>> serialization = SchemaSerialization(spec)
+        >>> api = falcon.API(middleware=[MyAuthentication(spec), OpenApiRequestValidation(spec), serialization])
+        >>> serialization.install(api)
+
+    Handlers can set ``resp.media`` to dicts, rows or slotted objects; see
+    :func:`~scaffolding.openapi.serialization.compile_serializer`.  Responses without a schema, and routes outside
+    the spec, use a compact ``json.dumps``.
+
+    Encoding itself is the C encoder's either way, so the saving is in what handlers no longer do: returning rows
+    directly is a few percent faster than building dicts for ``json.dumps``.  Handlers that already build dicts pay
+    a few percent over falcon's handler for the filtering to the schema, so install this for the schema-shaped
+    output and sparse fieldsets, not as a speed-up on its own.
+    """
+    def __init__(self, spec: Specification) -> None:
+        self.spec = spec
+        self._serializers = {}  # type: Dict[Tuple[str, int, Optional[Tuple[str, ...]]], Serializer]
+        self._local = threading.local()
+        self._json = falcon.media.JSONHandler()
+
+    def install(self, api: falcon.API) -> None:
+        api.resp_options.media_handlers[falcon.MEDIA_JSON] = self
+
+    def serializer(self, operation_id: str, status: int, fields: Optional[Tuple[str, ...]]=None) -> Serializer:
+        """With ``fields`` (see :class:`~scaffolding.middleware.SparseFieldsets`) a 2xx serializer only renders
+        those properties of the selected objects, and never reads the others"""
+        key = operation_id, status, fields
+        try:
+            return self._serializers[key]
+        except KeyError:
+            pass
+        operation = self.spec.operations.by_id(operation_id)
+        schema = response_schema(operation.raw, status)
+        if fields and 200 <= status < 300:
+            schema, path = projection(operation.raw, status)
+            if path is not None and set(fields) <= set(selectable_fields(schema, path)):
+                schema = project_schema(schema, path, fields)
+        serializer = self._serializers[key] = compile_serializer(schema)
+        return serializer
+
+    def warm_up(self, operation: Operation, resource) -> None:
+        for status in operation.raw.get("responses", {}):
+            if status.isdigit():
+                self.serializer(operation.id, int(status))
+
+    # middleware ======================================================================================================
+
+    def process_request(self, req: falcon.Request, resp: falcon.Response) -> None:
+        self._local.current = None
+
+    def process_resource(self, req: falcon.Request, resp: falcon.Response, resource, params: dict) -> None:
+        if resource is None or not in_spec(resource):
+            return
+        try:
+            operation = self.spec.operations.resolve(req)
+        except KeyError:
+            return
+        self._local.current = operation.id, resp, req
+
+    # media handler ===================================================================================================
+
+    def serialize(self, media, content_type: str) -> bytes:
+        current = getattr(self._local, "current", None)  # type: Optional[Tuple[str, falcon.Response, falcon.Request]]
+        if current is None:
+            return dumps(media).encode()
+        operation_id, resp, req = current
+        # falcon serializes lazily, after the handler has set the status and every middleware has run
+        status = int(resp.status[:3])
+        return self.serializer(operation_id, status, req.context.get("fields"))(media).encode()
+
+    def deserialize(self, stream, content_type: str, content_length: int):
+        return self._json.deserialize(stream, content_type, content_length)
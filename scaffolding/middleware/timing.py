@@ -0,0 +1,121 @@
+import logging
+import random
+import time
+from typing import Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+import falcon
+
+from .. import hooks
+
+
+__all__ = ["ServerTiming"]
+logger = logging.getLogger(__name__)
+
+Sink = Callable[[Optional[str], Dict[str, float]], None]
+
+
+class ServerTiming:
+    """Times each scaffolding stage of a request and reports it in a ``Server-Timing`` header.
+
+    Stages are ``auth`` and ``validation`` (from the auth_done and validation_done hooks), ``handler`` from the
+    end of validation until the session is finished, ``commit`` for :class:`DatabaseMiddleware`'s commit or
+    rollback (the commit_done hook), and ``total``.  Only stages that ran are reported.
+
+    A request is timed when it's sampled, with probability ``sample_rate``, or when its principal is in
+    ``principals`` as a ``(type, principal_key(value))`` pair.  Timed requests get the header, if ``header`` is set,
+    and are passed to ``sink`` as ``sink(operation_id, {stage: seconds})`` for aggregation.
+
+    .. code-block:: python
+
+        >>> timing = ServerTiming(sample_rate=0.01, principals=[("user", "alice")], sink=stats.record)
+        >>> api = falcon.API(middleware=[timing, db.create_middleware(spec), MyAuthentication(spec), ...])
+
+    Put this first in the middleware list so ``total`` covers every other middleware.  Without an instance the
+    hooks have no subscribers and nothing is measured; untimed requests cost one dict lookup per stage.
+    Cross-origin pages only see the header if it's in Cors's ``expose_headers``.
+    """
+    header_name = "Server-Timing"
+
+    def __init__(
+            self, *,
+            sample_rate: float=0.0,
+            principals: Iterable[Tuple[str, Hashable]]=(),
+            principal_key: Callable[[Hashable], Hashable]=lambda value: value,
+            sink: Optional[Sink]=None,
+            header: bool=True) -> None:
+        self.sample_rate = sample_rate
+        self.principals = frozenset(principals)
+        self.principal_key = principal_key
+        self.sink = sink
+        self.header = header
+        hooks.auth_done.subscribe(self._on_auth_done)
+        hooks.validation_done.subscribe(self._on_validation_done)
+        hooks.commit_done.subscribe(self._on_commit_done)
+
+    def close(self) -> None:
+        """Unsubscribes from the hooks, so call sites stop measuring if nothing else listens"""
+        hooks.auth_done.unsubscribe(self._on_auth_done)
+        hooks.validation_done.unsubscribe(self._on_validation_done)
+        hooks.commit_done.unsubscribe(self._on_commit_done)
+
+    def allowed(self, principal: Optional[dict]) -> bool:
+        if not principal or principal["value"] is None:
+            return False
+        return (principal["type"], self.principal_key(principal["value"])) in self.principals
+
+    # middleware ======================================================================================================
+
+    def process_request(self, req: falcon.Request, resp: falcon.Response) -> None:
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if sampled or self.principals:
+            # allow-listed principals are only known after auth, so keep the start until then
+            req.context["timing"] = {"start": time.perf_counter(), "sampled": sampled}
+
+    def process_response(self, req, resp, resource, req_succeeded: bool, **__) -> None:
+        ctx = req.context.pop("timing", None)
+        if ctx is None:
+            return
+        if not ctx["sampled"] and not ctx.get("allowed"):
+            return
+        now = time.perf_counter()
+        durations = {}  # type: Dict[str, float]
+        for stage in ("auth", "validation"):
+            if stage in ctx:
+                durations[stage] = ctx[stage]
+        if "validated" in ctx:
+            # the handler ends when the session starts finishing, or now without a database
+            durations["handler"] = ctx.get("committing", now) - ctx["validated"]
+        if "commit" in ctx:
+            durations["commit"] = ctx["commit"]
+        durations["total"] = now - ctx["start"]
+        if self.header:
+            resp.set_header(self.header_name, ", ".join(
+                f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in durations.items()))
+        if self.sink:
+            operation = req.context.get("operation")
+            # noinspection PyBroadException
+            try:
+                self.sink(operation.id if operation else None, durations)
+            except Exception:
+                logger.exception("server timing sink %r failed", self.sink)
+
+    # noinspection PyUnusedLocal
+    def _on_auth_done(self, req, principal, elapsed) -> None:
+        ctx = req.context.get("timing")
+        if ctx is not None:
+            ctx["auth"] = elapsed
+            if not ctx["sampled"] and self.principals:
+                ctx["allowed"] = self.allowed(principal)
+
+    # noinspection PyUnusedLocal
+    def _on_validation_done(self, req, operation, elapsed) -> None:
+        ctx = req.context.get("timing")
+        if ctx is not None:
+            ctx["validation"] = elapsed
+            ctx["validated"] = time.perf_counter()
+
+    def _on_commit_done(self, req, elapsed) -> None:
+        ctx = req.context.get("timing")
+        if ctx is not None:
+            ctx["commit"] = elapsed
+            ctx["committing"] = time.perf_counter() - elapsed
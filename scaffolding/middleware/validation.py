@@ -1,10 +1,13 @@
 import logging
+import time
 
 import falcon
 import marshmallow as ma
 
+from .. import hooks
 from ..exc import Exceptions
 from ..openapi import Operation, Specification
+from ..resources import in_spec
 
 
 logger = logging.getLogger(__name__)
@@ -20,20 +23,25 @@ class OpenApiRequestValidation:
     def process_resource(self, req: falcon.Request, resp: falcon.Response, resource, params: dict) -> None:
         if req.method.lower() == "options" and self.skip_options:
             return
+        if not in_spec(resource):
+            return
         try:
-            operation = self.spec.operations.by_req(req)
+            operation = self.spec.operations.resolve(req)
         except KeyError:
-            logger.warning(f"no operation found for {req.method.upper()} {req.uri_template}")
+            logger.warning("no operation found for %s %s", req.method, req.uri_template)
             raise Exceptions.not_found()
+        self.validate(operation, req, params)
+
+    def validate(self, operation: Operation, req: falcon.Request, params: dict) -> None:
+        """Collects the operation's params from the request into ``params`` and validates them and the body"""
+        start = time.perf_counter() if hooks.validation_done.enabled else 0
         self.collect_params(operation, req, params)
         if operation.has_params:
             operation.validate_params(params)
-        else:
-            logger.debug(f"{operation.id} has no params, skipping validation")
         if operation.has_body:
             operation.validate_body(req.media)
-        else:
-            logger.debug(f"{operation.id} has no body, skipping validation")
+        if hooks.validation_done.enabled:
+            hooks.validation_done.emit(req, operation, time.perf_counter() - start)
 
     @staticmethod
     def collect_params(operation: Operation, req: falcon.Request, params: dict) -> None:
@@ -1,13 +1,17 @@
 import functools
 import os
+import typing
+import weakref
 
-import jinja2
+if typing.TYPE_CHECKING:
+    import jinja2
 
 __all__ = ["Missing", "Sentinel", "Template"]
 
 
+# jinja2 is imported on first use so that compiled services can import scaffolding.exc without it
 class Template:
-    def __init__(self, tpl: jinja2.Template) -> None:
+    def __init__(self, tpl: "jinja2.Template") -> None:
         self.tpl = tpl
 
     def render_block(self, __name: str, **kwargs) -> str:
@@ -19,6 +23,7 @@ class Template:
 
     @classmethod
     def from_file(cls, path: str) -> "Template":
+        import jinja2
         with open(path, "r") as stream:
             tpl = jinja2.Template(stream.read())
         return cls(tpl)
@@ -31,11 +36,23 @@ class Template:
 
     @classmethod
     def from_pkg(cls, tpl_name, *, pkg_name="scaffolding", pkg_path="templates") -> "Template":
-        env = jinja2.Environment(loader=jinja2.PackageLoader(pkg_name, pkg_path))
-        tpl = env.get_template(tpl_name)
+        tpl = _package_env(pkg_name, pkg_path).get_template(tpl_name)
         return cls(tpl)
 
 
+@functools.lru_cache(maxsize=None)
+def _package_env(pkg_name: str, pkg_path: str) -> "jinja2.Environment":
+    """One environment per package, so each template is compiled once per process.
+
+    Compiled templates are also kept in a bytecode cache under the system temp dir, which
+    later processes (and codegen workers) load instead of compiling the source again.
+    """
+    import jinja2
+    return jinja2.Environment(
+        loader=jinja2.PackageLoader(pkg_name, pkg_path),
+        bytecode_cache=jinja2.FileSystemBytecodeCache())
+
+
 def singleton(func):
     instances = {}
 
@@ -49,6 +66,23 @@ def singleton(func):
     return get
 
 
+def after_fork_in_child(obj, method: str) -> None:
+    """Calls ``obj.<method>()`` in each forked child before it runs anything else.
+
+    At that point the child only has the forking thread, so the method can replace locks that another thread
+    of the parent may have been holding.  The object is held weakly.
+    """
+    if not hasattr(os, "register_at_fork"):
+        return
+    ref = weakref.ref(obj)
+
+    def after_in_child() -> None:
+        instance = ref()
+        if instance is not None:
+            getattr(instance, method)()
+    os.register_at_fork(after_in_child=after_in_child)
+
+
 @singleton
 class Sentinel:
     """Singleton object with a templated representation"""
@@ -1,6 +1,8 @@
 import logging
 from ..spec import Specification
 from ...misc import Template
+from .aot import generate_aot
+from .incremental import generate_package
 from .models import ModelBackend
 
 logger = logging.getLogger(__name__)
@@ -10,14 +12,13 @@ def generate_resources(spec: Specification, out_path: str) -> None:
     tpl = Template.from_pkg("falcon.tpl")
     resources = []
     classes = []
-    tags = spec.operations.tags
-    if not tags:
+    by_tag = spec.operations.by_tag()
+    if not by_tag:
         logging.warning("no tags found in spec, nothing to render")
     header = tpl.block("header")
-    for tag in tags:
+    for tag, operations in by_tag.items():
         resource_cls = f"{tag[0].upper()}{tag[1:]}Resource"
         classes.append(resource_cls)
-        operations = spec.operations.with_tag(tag)
         verbs = [o.verb for o in operations]
         path = next(iter(operations)).path
         resources.append(tpl.block("resource", resource=resource_cls, verbs=verbs, operations=operations, path=path))
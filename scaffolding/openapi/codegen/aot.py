@@ -0,0 +1,149 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+from ..parsing import walk_path
+from ..spec import Operation, Specification
+from ...misc import Template
+
+
+__all__ = ["generate_aot", "render_aot"]
+CONVERTERS = {
+    "boolean": "_boolean",
+    "integer": "_integer",
+    "number": "_number",
+    "string": "_string",
+}
+
+
+def _ident(s: str) -> str:
+    return re.sub(r"\W", "_", s)
+
+
+def _mechanism(schema: Optional[dict]) -> str:
+    # mirrors OpenApiAuthentication.translate_schema_mechanism
+    if not schema:
+        return '("none", _no_auth)'
+    t = schema["type"]
+    if t == "http":
+        s = schema["scheme"]
+        if s == "basic":
+            return '("basic", _basic)'
+        elif s == "bearer":
+            return '("token", _bearer)'
+        raise RuntimeError(f"unexpected schema {s!r} for type 'http'")
+    elif t == "apiKey":
+        return f'("token", _api_key({schema["name"]!r}, {schema.get("in", schema.get("loc"))!r}))'
+    raise RuntimeError("only basic and bearer schemas are supported")
+
+
+def _field(lines: List[str], target: str, name: str, read: str, t: str, required: bool, default) -> None:
+    """Appends the statements that load one field into ``target[name]``, as marshmallow would"""
+    lines.append(f"    value = {read}")
+    lines.append("    if value is None:")
+    if default is not None:
+        lines.append(f"        {target}[{name!r}] = {default!r}")
+    elif required:
+        lines.append(f"        raise Exceptions.missing_parameter({name!r})")
+    else:
+        lines.append(f"        {target}.pop({name!r}, None)")
+    lines.append("    else:")
+    lines.append(f"        {target}[{name!r}] = {CONVERTERS[t]}({name!r}, value)")
+
+
+def _literal(value, indent: str="") -> str:
+    """``value`` as Python source, one item per line so nested specs stay within the line limit"""
+    inner = indent + "    "
+    if isinstance(value, dict) and value:
+        items = "".join(f"{inner}{k!r}: {_literal(v, inner)},\n" for k, v in value.items())
+        return f"{{\n{items}{indent}}}"
+    if isinstance(value, (list, tuple)) and value:
+        items = "".join(f"{inner}{_literal(v, inner)},\n" for v in value)
+        return f"[\n{items}{indent}]" if isinstance(value, list) else f"(\n{items}{indent})"
+    return repr(value)
+
+
+def _compile_validator(operation: Operation) -> Tuple[str, List[str]]:
+    raw = operation.raw
+    name = f"_validate_{_ident(operation.id)}"
+    constants = []
+    lines = []
+    if any(p["in"] == "cookie" for p in raw["parameters"]):
+        lines.append("    cookies = req.cookies")
+    for param in raw["parameters"]:
+        p, loc = param["name"], param["in"]
+        read = {
+            "query": f"req.get_param({p!r})",
+            "header": f"req.get_header({p!r})",
+            "path": f"params.get({p!r})",
+            "cookie": f"cookies.get({p!r})",
+        }[loc]
+        _field(
+            lines, "params", p, read, param["schema"]["type"],
+            param.get("required", True), param.get("default"))
+
+    body = walk_path(raw, "requestBody", "content", "application/json", "schema", default=None)
+    if body and body.get("properties"):
+        if body["type"] != "object":
+            raise RuntimeError("requestBody must be an object or empty")
+        fields = f"_FIELDS_{_ident(operation.id)}"
+        constants.append(f"{fields} = frozenset({tuple(body['properties'])!r})")
+        lines.append(f"    body = _body(req, {fields})")
+        for p, prop in body["properties"].items():
+            _field(
+                lines, "body", p, f"body.get({p!r})", prop["type"],
+                p in body.get("required", []), prop.get("default"))
+
+    if not lines:
+        lines.append("    pass")
+    # the operation's spec object, for middleware that reads extensions or response schemas
+    constants.append(f"_RAW_{_ident(operation.id)} = {_literal(raw)}")
+    constants += ["", ""]
+    return name, [*constants, f"def {name}(req, params):", *lines]
+
+
+def render_aot(spec: Specification) -> str:
+    tpl = Template.from_pkg("aot.tpl")
+    operations = sorted(spec.operations, key=lambda o: o.id)
+
+    compiled = []
+    table = ["_OPERATIONS = {"]
+    for o in operations:
+        validator, source = _compile_validator(o)
+        compiled.append("\n".join(source))
+        mechanisms = "".join(f"{_mechanism(s)}, " for s in o.security_schemas)
+        table.append(
+            f"    ({o.path!r}, {o.verb.upper()!r}): _Operation(\n"
+            f"        {o.id!r}, {o.path!r}, {o.verb!r}, {o.tags!r},\n"
+            f"        _RAW_{_ident(o.id)}, {o.has_params!r}, {o.has_body!r},\n"
+            f"        ({mechanisms}),\n"
+            f"        {validator}),")
+    table.append("}")
+    compiled.append("\n".join(table))
+
+    # one resource per path; falcon routes by path, not by tag
+    by_path = {}  # type: Dict[str, List[Operation]]
+    for o in operations:
+        by_path.setdefault(o.path, []).append(o)
+    resources, routes, seen = [], [], set()
+    for path, path_operations in sorted(by_path.items()):
+        tags = path_operations[0].tags
+        base = _ident(tags[0] if tags else path).strip("_") or "root"
+        cls = f"{base[0].upper()}{base[1:]}Resource"
+        while cls in seen:
+            cls = f"_{cls}"
+        seen.add(cls)
+        resources.append(tpl.block("resource", resource=cls, operations=path_operations))
+        routes.append(f"api.add_route({path!r}, {cls}())")
+
+    return "".join([
+        tpl.block("header", spec_path=spec.source_filename),
+        tpl.block("operations", compiled="\n\n\n".join(compiled)),
+        *resources,
+        tpl.block("footer", routes="\n".join(routes)),
+    ])
+
+
+def generate_aot(spec: Specification, out_path: str) -> None:
+    data = render_aot(spec)
+    with open(out_path, "wt") as out:
+        out.write(data)
@@ -0,0 +1,135 @@
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import pkgutil
+import re
+from typing import List, Optional, Tuple
+
+from ..spec import Specification
+from ...misc import Template
+
+
+__all__ = ["generate_package"]
+logger = logging.getLogger(__name__)
+
+MANIFEST = ".scaffold-manifest.json"
+TEMPLATES = ("falcon.tpl", "package.tpl")
+# below this many stale modules, starting worker processes costs more than rendering inline
+PARALLEL_THRESHOLD = 32
+
+# (filename, tag, resource class, path, ((operation id, verb), ...))
+_Job = Tuple[str, str, str, str, Tuple[Tuple[str, str], ...]]
+
+
+def _module_name(tag: str) -> str:
+    name = re.sub(r"\W", "_", tag).strip("_").lower() or "untagged"
+    return f"_{name}" if name[0].isdigit() else name
+
+
+def _template_digest() -> str:
+    h = hashlib.sha256()
+    for name in TEMPLATES:
+        h.update(pkgutil.get_data("scaffolding", f"templates/{name}"))
+    return h.hexdigest()
+
+
+def _digest(template_digest: str, job: _Job) -> str:
+    data = json.dumps([template_digest, *job], sort_keys=True)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def _render(job: _Job) -> Tuple[str, str]:
+    filename, tag, resource, path, operations = job
+    # from_pkg keeps one environment per process, so each worker compiles the templates once
+    operations = [{"id": id, "verb": verb} for id, verb in operations]
+    data = "".join([
+        Template.from_pkg("package.tpl").block("module", tag=tag),
+        Template.from_pkg("falcon.tpl").block("resource", resource=resource, operations=operations, path=path),
+    ])
+    return filename, data
+
+
+def _render_all(jobs: List[_Job], workers: Optional[int]) -> List[Tuple[str, str]]:
+    if workers == 1 or len(jobs) < PARALLEL_THRESHOLD:
+        return [_render(job) for job in jobs]
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_render, jobs, chunksize=chunksize))
+
+
+def _write_if_changed(path: str, data: str) -> bool:
+    try:
+        with open(path, "rt") as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path, "wt") as out:
+        out.write(data)
+    return True
+
+
+def generate_package(
+        spec: Specification, out_dir: str, *,
+        workers: Optional[int]=None, force: bool=False) -> List[str]:
+    """Renders one module per tag under ``out_dir/resources`` and an ``app.py`` that serves them.
+
+    A manifest in ``out_dir`` records a content hash of each module's inputs; modules whose hash hasn't changed
+    (and still exist) are skipped, and modules of removed tags are deleted.  Returns the paths that were written.
+    """
+    resources_dir = os.path.join(out_dir, "resources")
+    os.makedirs(resources_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    previous = {}
+    if not force:
+        try:
+            with open(manifest_path, "rt") as f:
+                previous = json.load(f)["modules"]
+        except (OSError, ValueError, KeyError):
+            logger.info("no usable manifest at %s, regenerating everything", manifest_path)
+
+    template_digest = _template_digest()
+    modules, jobs, names = {}, [], []
+    by_tag = spec.operations.by_tag()
+    if not by_tag:
+        logger.warning("no tags found in spec, nothing to render")
+    for tag, operations in by_tag.items():
+        module = _module_name(tag)
+        while f"{module}.py" in modules:
+            module = f"{module}_"
+        filename = f"{module}.py"
+        resource = f"{tag[0].upper()}{tag[1:]}Resource"
+        job = (
+            filename, tag, resource, operations[0].path,
+            tuple((o.id, o.verb) for o in operations))  # type: _Job
+        digest = modules[filename] = _digest(template_digest, job)
+        names.append((module, resource))
+        if previous.get(filename) != digest or not os.path.exists(os.path.join(resources_dir, filename)):
+            jobs.append(job)
+
+    written = []
+    for filename, data in _render_all(jobs, workers):
+        path = os.path.join(resources_dir, filename)
+        with open(path, "wt") as out:
+            out.write(data)
+        written.append(path)
+    for filename in previous.keys() - modules.keys():
+        path = os.path.join(resources_dir, filename)
+        if os.path.exists(path):
+            os.remove(path)
+            logger.info("removed %s", path)
+
+    app = Template.from_pkg("package.tpl").block("app", resources=names, spec_path=spec.source_filename)
+    for path, data in ((os.path.join(out_dir, "app.py"), app), (os.path.join(resources_dir, "__init__.py"), "")):
+        if _write_if_changed(path, data):
+            written.append(path)
+
+    tmp = f"{manifest_path}.tmp"
+    with open(tmp, "wt") as out:
+        json.dump({"modules": modules}, out, indent=2, sort_keys=True)
+    os.replace(tmp, manifest_path)
+    logger.info("regenerated %d of %d tag modules", len(jobs), len(modules))
+    return written
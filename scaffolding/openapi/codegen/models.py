@@ -0,0 +1,239 @@
+import keyword
+import logging
+import re
+from typing import Dict, List, Optional, Type
+
+from ..spec import Specification
+from ...misc import Template
+
+
+__all__ = ["ModelBackend", "DtoBackend", "SqlAlchemyBackend"]
+logger = logging.getLogger(__name__)
+
+PY_TYPES = {
+    "boolean": "bool",
+    "integer": "int",
+    "number": "float",
+    "string": "str",
+    "array": "list",
+    "object": "dict",
+}
+COLUMN_TYPES = {
+    "boolean": "sqlalchemy.Boolean",
+    "integer": "sqlalchemy.Integer",
+    "number": "sqlalchemy.Float",
+    "string": "sqlalchemy.String",
+    "array": "sqlalchemy.JSON",
+    "object": "sqlalchemy.JSON",
+}
+
+
+def _snake(name: str) -> str:
+    name = re.sub(r"\W", "_", name)
+    return re.sub(r"(?<=[a-z0-9])([A-Z])", r"_\1", name).lower()
+
+
+def _attr(name: str) -> str:
+    attr = re.sub(r"\W", "_", name)
+    if attr[0].isdigit() or keyword.iskeyword(attr):
+        attr = f"{attr}_"
+    return attr
+
+
+class Field:
+    __slots__ = ("key", "attr", "type", "required", "default", "model", "many")
+
+    def __init__(self, key: str, schema: dict, required: bool, models: Dict[int, str]) -> None:
+        self.key = key
+        self.attr = _attr(key)
+        self.type = schema.get("type", "object")
+        self.required = required
+        self.default = schema.get("default")
+        # refs are resolved in place by flatten_spec, so a nested model is the same dict as its component
+        self.many = self.type == "array" and id(schema.get("items")) in models
+        self.model = models.get(id(schema["items"] if self.many else schema))
+
+    @property
+    def annotation(self) -> str:
+        if self.model:
+            t = f'List["{self.model}"]' if self.many else f'"{self.model}"'
+        else:
+            t = PY_TYPES.get(self.type, "object")
+        return t if self.required else f"Optional[{t}]"
+
+
+class Model:
+    def __init__(self, name: str, schema: dict, models: Dict[int, str]) -> None:
+        self.name = name
+        self.schema = schema
+        self.snake = _snake(name)
+        required = set(schema.get("required", []))
+        self.fields = [
+            Field(key, prop, key in required, models)
+            for key, prop in schema.get("properties", {}).items()
+        ]
+
+
+class ModelBackend:
+    """Renders ``components/schemas`` into a python module.
+
+    Every object schema becomes a class plus module-level ``<name>_to_dict`` and ``<name>_from_dict`` functions
+    with each field written out, so converting a row doesn't reflect over ``__dict__``.  The functions are also
+    attached to the class as ``to_dict`` and ``from_dict``.
+
+    Register a new backend with::
+
+        >>> @ModelBackend.register
+        ... class MyBackend(ModelBackend):
+        ...     name = "mine"
+        ...     def render_model(self, model): ...
+    """
+    name = None  # type: str
+    # models nested in another model are serialized with that model's functions
+    nested = True
+    _backends = {}  # type: Dict[str, Type[ModelBackend]]
+
+    @classmethod
+    def register(cls, backend: Type["ModelBackend"]) -> Type["ModelBackend"]:
+        cls._backends[backend.name] = backend
+        return backend
+
+    @classmethod
+    def get_backend(cls, name: str) -> "ModelBackend":
+        try:
+            return cls._backends[name]()
+        except KeyError:
+            raise RuntimeError(f"unknown model backend {name!r}, expected one of {sorted(cls._backends)}") from None
+
+    @classmethod
+    def backends(cls) -> List[str]:
+        return sorted(cls._backends)
+
+    def models(self, spec: Specification) -> List[Model]:
+        schemas = spec.raw.get("components", {}).get("schemas", {})
+        names = {id(schema): name for name, schema in schemas.items() if "properties" in schema}
+        models = []
+        for name, schema in schemas.items():
+            if "properties" not in schema:
+                logger.info("skipping schema %s without properties", name)
+                continue
+            models.append(Model(name, schema, names))
+        return models
+
+    def render_spec(self, spec: Specification) -> str:
+        tpl = Template.from_pkg("models.tpl")
+        chunks = []
+        for model in self.models(spec):
+            chunks.append(self.render_model(model))
+            chunks.append(self.render_serializers(model))
+        return "".join([
+            tpl.block(self.name, spec_path=spec.source_filename),
+            "\n\n\n".join(chunks),
+            "\n",
+        ])
+
+    def render_model(self, model: Model) -> str:
+        raise NotImplementedError
+
+    def render_serializers(self, model: Model) -> str:
+        lines = [f"def {model.snake}_to_dict(o) -> dict:", "    return {"]
+        for f in model.fields:
+            value = f"o.{f.attr}"
+            if f.model and self.nested:
+                fn = f"{_snake(f.model)}_to_dict"
+                if f.many:
+                    value = f"[{fn}(x) for x in {value}]"
+                else:
+                    value = f"{fn}({value})"
+                if not f.required:
+                    value = f"None if o.{f.attr} is None else {value}"
+            lines.append(f"        {f.key!r}: {value},")
+        lines.append("    }")
+        lines += ["", ""]
+
+        lines.append(f'def {model.snake}_from_dict(d: dict) -> "{model.name}":')
+        args = []
+        for f in model.fields:
+            if f.required:
+                value = f"d[{f.key!r}]"
+            elif f.default is not None:
+                value = f"d.get({f.key!r}, {f.default!r})"
+            else:
+                value = f"d.get({f.key!r})"
+            if f.model and self.nested:
+                fn = f"{_snake(f.model)}_from_dict"
+                if f.many:
+                    convert = f"[{fn}(x) for x in {f.attr}]"
+                else:
+                    convert = f"{fn}({f.attr})"
+                if not f.required:
+                    convert = f"None if {f.attr} is None else {convert}"
+                lines.append(f"    {f.attr} = {value}")
+                value = convert
+            args.append(f"        {f.attr}={value},")
+        lines += [f"    return {model.name}(", *args, "    )", "", ""]
+
+        lines.append(f"{model.name}.to_dict = {model.snake}_to_dict")
+        lines.append(f"{model.name}.from_dict = staticmethod({model.snake}_from_dict)")
+        return "\n".join(lines)
+
+
+@ModelBackend.register
+class DtoBackend(ModelBackend):
+    """Plain ``__slots__`` classes"""
+    name = "dto"
+
+    def render_model(self, model: Model) -> str:
+        slots = "".join(f"{f.attr!r}, " for f in model.fields)
+        lines = [f"class {model.name}:", f"    __slots__ = ({slots})", ""]
+        if not model.fields:
+            lines[-1:] = []
+            return "\n".join(lines)
+        params = []
+        for f in model.fields:
+            if f.required:
+                params.append(f"{f.attr}: {f.annotation}")
+            else:
+                # a mutable default would be shared between instances
+                default = None if isinstance(f.default, (list, dict)) else f.default
+                params.append(f"{f.attr}: {f.annotation}={default!r}")
+        lines.append("    def __init__(")
+        lines.append("            self, *,")
+        lines += [f"            {p}," for p in params[:-1]]
+        lines.append(f"            {params[-1]}) -> None:")
+        for f in model.fields:
+            lines.append(f"        self.{f.attr} = {f.attr}")
+        return "\n".join(lines)
+
+
+@ModelBackend.register
+class SqlAlchemyBackend(ModelBackend):
+    """Declarative models on a module-level :class:`~scaffolding.middleware.Database`'s ``base``.
+
+    Nested objects and arrays are stored in JSON columns, so ``to_dict`` emits them as stored.  The primary key is
+    the ``x-primary-key`` list of the schema, or its ``id`` property.
+    """
+    name = "sqlalchemy"
+    nested = False
+
+    def render_model(self, model: Model) -> str:
+        keys = model.schema.get("x-primary-key")
+        if keys is None:
+            keys = ["id"] if any(f.key == "id" for f in model.fields) else []
+        if not keys:
+            raise RuntimeError(f"schema {model.name!r} needs an 'id' property or an 'x-primary-key' list")
+        lines = [f"class {model.name}(db.base):", f"    __tablename__ = {model.snake!r}", ""]
+        for f in model.fields:
+            args = [COLUMN_TYPES.get(f.type, "sqlalchemy.JSON")]
+            if f.attr != f.key:
+                args.insert(0, repr(f.key))
+            if f.key in keys:
+                args.append("primary_key=True")
+            elif f.required:
+                args.append("nullable=False")
+            if isinstance(f.default, (list, dict)):
+                args.append(f"default=lambda: {f.default!r}")
+            elif f.default is not None:
+                args.append(f"default={f.default!r}")
+            lines.append(f"    {f.attr} = sqlalchemy.Column({', '.join(args)})")
+        return "\n".join(lines)
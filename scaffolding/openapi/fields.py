@@ -0,0 +1,81 @@
+from typing import Iterable, List, Optional, Tuple
+
+from ..exc import Exceptions
+from .serialization import response_schema
+
+
+__all__ = ["parse_fields", "project_schema", "projection", "projection_path", "selectable_fields"]
+
+# a step into an array's items
+ITEMS = "[]"
+
+
+def _is_object(schema: Optional[dict]) -> bool:
+    return bool(schema) and schema.get("type") == "object" and bool(schema.get("properties"))
+
+
+def projection_path(schema: Optional[dict], envelope: Optional[str]=None) -> Optional[List[str]]:
+    """Steps from a response schema to the objects that ``fields`` selects from, or None if there aren't any.
+
+    That's the items of an array response, the items of an object's only array-of-objects property (a list
+    envelope such as ``{"users": [...], "continuationToken": ...}``), or else the object itself.  ``envelope``
+    names the property to use when an object has several such lists.
+    """
+    if not schema:
+        return None
+    if schema.get("type") == "array":
+        inner = projection_path(schema.get("items"))
+        return None if inner is None else [ITEMS, *inner]
+    if not _is_object(schema):
+        return None
+    properties = schema["properties"]
+    lists = [
+        name for name, prop in properties.items()
+        if prop.get("type") == "array" and _is_object(prop.get("items")) and envelope in (None, name)
+    ]
+    if len(lists) == 1:
+        return [lists[0], ITEMS]
+    return []
+
+
+def projection(operation_raw: dict, status: int=200) -> Tuple[Optional[dict], Optional[List[str]]]:
+    """The response schema for ``status`` and its projection path; ``x-fields-envelope`` picks the envelope"""
+    schema = response_schema(operation_raw, status)
+    return schema, projection_path(schema, operation_raw.get("x-fields-envelope"))
+
+
+def _walk(schema: dict, path: List[str]) -> dict:
+    for step in path:
+        schema = schema["items"] if step == ITEMS else schema["properties"][step]
+    return schema
+
+
+def selectable_fields(schema: Optional[dict], path: Optional[List[str]]) -> Tuple[str, ...]:
+    if path is None:
+        return ()
+    return tuple(_walk(schema, path)["properties"])
+
+
+def parse_fields(value: str, allowed: Iterable[str], param: str="fields") -> Tuple[str, ...]:
+    """``fields=a,b`` as a tuple in schema order, so equal selections compare equal"""
+    allowed = tuple(allowed)
+    requested = {name.strip() for name in value.split(",") if name.strip()}
+    if not requested:
+        raise Exceptions.invalid_parameter(param, value, constraint="name at least one field")
+    for name in sorted(requested):
+        if name not in allowed:
+            raise Exceptions.invalid_parameter(param, name, constraint=f"be one of {', '.join(allowed)}")
+    return tuple(name for name in allowed if name in requested)
+
+
+def project_schema(schema: dict, path: List[str], fields: Iterable[str]) -> dict:
+    """A copy of ``schema`` whose selected objects only have ``fields``; unchanged parts are shared"""
+    if not path:
+        keep = set(fields)
+        return {**schema, "properties": {k: v for k, v in schema["properties"].items() if k in keep}}
+    step, rest = path[0], path[1:]
+    if step == ITEMS:
+        return {**schema, "items": project_schema(schema["items"], rest, fields)}
+    properties = dict(schema["properties"])
+    properties[step] = project_schema(properties[step], rest, fields)
+    return {**schema, "properties": properties}
@@ -0,0 +1,225 @@
+import json
+import json.encoder
+import keyword
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .parsing import walk_path
+
+
+__all__ = ["compile_serializer", "dumps", "response_schema"]
+
+Serializer = Callable[[Any], str]
+
+
+def _default(o: Any) -> Any:
+    raise TypeError(f"Object of type {o.__class__.__name__} is not JSON serializable")
+
+
+def _make_dumps() -> Serializer:
+    # compact, and as strict as json.dumps: unknown types raise TypeError and cycles raise ValueError.  Calling the
+    # C encoder directly skips JSONEncoder's per-call setup.  It's made for each call because its markers (the
+    # containers being encoded, for the cycle check) can't be shared between threads, or kept after an error
+    make_encoder = getattr(json.encoder, "c_make_encoder", None)
+    if make_encoder is None:
+        return json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    encode_basestring = json.encoder.encode_basestring
+
+    def dumps(o: Any) -> str:
+        return "".join(make_encoder({}, _default, encode_basestring, None, ":", ",", False, False, True)(o, 0))
+    return dumps
+
+
+dumps = _make_dumps()
+
+
+def _attr(name: str) -> str:
+    # the attribute a generated DTO uses for this property; see codegen.models
+    attr = re.sub(r"\W", "_", name)
+    if attr[0].isdigit() or keyword.iskeyword(attr):
+        attr = f"{attr}_"
+    return attr
+
+
+def response_schema(operation_raw: dict, status: int) -> Optional[dict]:
+    """The application/json schema for a status code, falling back to its ``2XX`` range and then ``default``"""
+    responses = operation_raw.get("responses", {})
+    for key in (str(status), f"{str(status)[0]}XX", "default"):
+        schema = walk_path(responses, key, "content", "application/json", "schema", default=None)
+        if schema is not None:
+            return schema
+    return None
+
+
+def _scalars_only(schema: dict) -> bool:
+    return not any(
+        (prop or {}).get("type") in ("object", "array") or not (prop or {}).get("type")
+        for prop in schema["properties"].values())
+
+
+class _Compiler:
+    """Generates functions that turn a value into the dicts and lists its schema describes.
+
+    The result goes through the C encoder in one call; that's where the time goes, so the generated code only
+    copies what the encoder can't take as-is.
+    """
+    def __init__(self) -> None:
+        self.lines = []  # type: List[str]
+        self.names = {}  # type: Dict[int, str]
+        self.constants = {}  # type: Dict[str, Any]
+
+    def expression(self, schema: Optional[dict], v: str) -> Optional[str]:
+        """An expression converting ``v``, or None if the encoder can take ``v`` unchanged"""
+        if not schema:
+            return None
+        t = schema.get("type")
+        if t == "object" and schema.get("properties") and not schema.get("additionalProperties"):
+            return f"{self.function(schema)}({v})"
+        if t == "array" and schema.get("items"):
+            return f"{self.function(schema)}({v})"
+        return None
+
+    def function(self, schema: dict) -> str:
+        # refs were resolved in place, so a shared schema is the same dict; a recursive one contains itself
+        name = self.names.get(id(schema))
+        if name is not None:
+            return name
+        name = self.names[id(schema)] = f"_s{len(self.names)}"
+        if schema["type"] == "array":
+            self._array(name, schema)
+        else:
+            self._object(name, schema)
+        return name
+
+    def _keys(self, name: str, schema: Optional[dict]) -> Optional[str]:
+        """The name of a constant holding the keys of a flat object schema, whose matching dicts pass through"""
+        if not schema or schema.get("type") != "object" or not schema.get("properties"):
+            return None
+        if schema.get("additionalProperties") or not _scalars_only(schema):
+            return None
+        constant = f"_k{name[2:]}"
+        self.constants[constant] = frozenset(schema["properties"])
+        return constant
+
+    def _fields(self, schema: dict) -> List[Tuple[str, str, Callable[[str], str]]]:
+        """(key, attribute, conversion of an expression) for each property"""
+        fields = []
+        for key, prop in schema["properties"].items():
+            fields.append((key, _attr(key), lambda v, prop=prop: self.expression(prop, v) or v))
+        return fields
+
+    @staticmethod
+    def _display(fields, read: Callable[[str, str], str]) -> str:
+        return "{" + ", ".join(f"{key!r}: {convert(read(key, attr))}" for key, attr, convert in fields) + "}"
+
+    def _array(self, name: str, schema: dict) -> None:
+        items = schema["items"]
+        item = self.expression(items, "x")
+        lines = [
+            f"def {name}(v):",
+            "    if v is None:",
+            "        return None",
+        ]
+        if item is None:
+            self.lines += [*lines, "    return v if v.__class__ is list else list(v)", ""]
+            return
+        if items.get("type") != "object":
+            self.lines += [*lines, f"    return [{item} for x in v]", ""]
+            return
+        # lists of objects are what list endpoints spend their time on, so the item's dict display is inlined
+        fields = self._fields(items)
+        keys = self._keys(name, items)
+        lines += [
+            "    if v.__class__ is not list:",
+            "        v = list(v)",
+            "    if not v:",
+            "        return v",
+            "    if isinstance(v[0], dict):",
+        ]
+        if keys:
+            # already shaped like the schema: no copies at all
+            lines += [
+                f"        if all(x.__class__ is dict and x.keys() == {keys} for x in v):",
+                "            return v",
+            ]
+        lines += [
+            "        try:",
+            f"            return [{self._display(fields, lambda key, attr: f'x[{key!r}]')} for x in v]",
+            "        except (KeyError, TypeError):",
+            "            pass",
+            "    else:",
+            "        try:",
+            f"            return [{self._display(fields, lambda key, attr: f'x.{attr}')} for x in v]",
+            "        except AttributeError:",
+            "            pass",
+            # some item is missing a property, or they're mixed; convert them one at a time
+            f"    return [{item} for x in v]",
+            "",
+        ]
+        self.lines += lines
+
+    def _object(self, name: str, schema: dict) -> None:
+        # build the body first; it may define functions for nested schemas
+        fields = self._fields(schema)
+        keys = self._keys(name, schema)
+        lines = [
+            f"def {name}(v):",
+            "    if v is None:",
+            "        return None",
+            "    if isinstance(v, dict):",
+        ]
+        if keys:
+            lines += [f"        if v.keys() == {keys}:", "            return v"]
+        # every property present is the fast path; otherwise only copy the ones that are
+        lines += [
+            "        try:",
+            f"            return {self._display(fields, lambda key, attr: f'v[{key!r}]')}",
+            "        except KeyError:",
+            "            pass",
+            "        out = {}",
+        ]
+        for key, attr, convert in fields:
+            lines += [
+                f"        f = v.get({key!r}, _missing)",
+                "        if f is not _missing:",
+                f"            out[{key!r}] = {convert('f')}",
+            ]
+        lines += [
+            "        return out",
+            "    try:",
+            f"        return {self._display(fields, lambda key, attr: f'v.{attr}')}",
+            "    except AttributeError:",
+            "        pass",
+            "    out = {}",
+        ]
+        for key, attr, convert in fields:
+            lines += [
+                f"    f = getattr(v, {attr!r}, _missing)",
+                "    if f is not _missing:",
+                f"        out[{key!r}] = {convert('f')}",
+            ]
+        lines += ["    return out", ""]
+        self.lines += lines
+
+
+def compile_serializer(schema: Optional[dict]) -> Serializer:
+    """Returns a function that renders a value matching ``schema`` as compact JSON.
+
+    The function is generated python that copies the value into the dicts and lists the schema describes, then
+    encodes them with one call to the C encoder.  Objects may be dicts, or rows and slotted objects whose
+    attributes are named like their properties.  Properties not in the schema are skipped, as are properties
+    the value doesn't have.  Dicts that already have exactly the properties of a flat schema aren't copied.
+    Anything the schema doesn't describe (no type, ``additionalProperties``) is encoded as it is.
+    """
+    compiler = _Compiler()
+    expression = compiler.expression(schema, "v")
+    if expression is None:
+        return dumps
+    source = "\n".join([*compiler.lines, "def serialize(v):", f"    return _dumps({expression})"])
+    namespace = {
+        "_dumps": dumps,
+        "_missing": object(),
+        **compiler.constants,
+    }
+    exec(compile(source, "<scaffolding serializer>", "exec"), namespace)
+    return namespace["serialize"]
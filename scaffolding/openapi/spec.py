@@ -1,10 +1,11 @@
 import logging
-from typing import Any, Callable, List, Optional, Set
+from typing import Any, Callable, Dict, List, Optional, Set
 
 import falcon
 import yaml
 
 from . import parsing, validation
+from .. import hooks
 
 
 __all__ = ["Specification", "Operation"]
@@ -95,12 +96,15 @@ class Operations:
 
         self._by_id = {}
         self._by_key = {}
+        self._by_tag = {}  # type: Dict[str, List[Operation]]
         for _, verb, raw_operation in parsing.iter_operations(spec.raw):
             id = parsing.get_id(raw_operation)
             route = parsing.get_route(raw_operation)
             operation = Operation(raw_operation, spec)
             self._by_id[id] = operation
             self._by_key[route] = operation
+            for tag in operation.tags:
+                self._by_tag.setdefault(tag, []).append(operation)
 
     def by_id(self, operation_id: str) -> Operation:
         return self._by_id[operation_id]
@@ -111,11 +115,28 @@ class Operations:
     def by_req(self, req: falcon.Request) -> Operation:
         return self.by_route(req.uri_template, req.method.lower())
 
+    def resolve(self, req: falcon.Request) -> Operation:
+        """Like by_req, but only looks the operation up once per request.
+
+        The operation is stored in ``req.context["operation"]`` and ``hooks.operation_resolved`` fires.
+        """
+        try:
+            return req.context["operation"]
+        except KeyError:
+            operation = req.context["operation"] = self.by_req(req)
+            if hooks.operation_resolved.enabled:
+                hooks.operation_resolved.emit(req, operation)
+            return operation
+
     def with_path(self, path: str) -> Set[Operation]:
         return {op for op in self if op.path == path}
 
     def with_tag(self, tag: str) -> Set[Operation]:
-        return {op for op in self if tag in op.tags}
+        return set(self._by_tag.get(tag, ()))
+
+    def by_tag(self) -> Dict[str, List[Operation]]:
+        """Operations grouped by tag, in spec order; tags are ordered by first appearance"""
+        return {tag: list(operations) for tag, operations in self._by_tag.items()}
 
     @property
     def ids(self) -> Set[str]:
@@ -123,14 +144,7 @@ class Operations:
 
     @property
     def tags(self) -> List[str]:
-        seen = set()
-        uniq_tags = []
-        for op in self:
-            for tag in op.tags:
-                if tag not in seen:
-                    uniq_tags.append(tag)
-                    seen.add(tag)
-        return uniq_tags
+        return list(self._by_tag.keys())
 
     def __iter__(self):
         return iter(list(self._by_id.values()))
@@ -79,17 +79,15 @@ def validate_body(schema: ma.Schema, body: dict) -> None:
 
 
 def _validate(schema: ma.Schema, blob: dict) -> None:
-    sn = schema.__class__.__name__
-    logger.debug(f"{sn} started validation")
     try:
         loaded_blob = schema.load(blob)
     except ma.ValidationError as e:
-        logger.debug(f"{sn} failed validation")
+        logger.debug("%s failed validation", schema.__class__.__name__)
         errors = e.messages
         # TODO for now just send back the first error
         name, error = next(iter(errors.items()))
         if len(error) > 1:
-            logger.info(f"multiple errors for param {name} but only returning first {error}")
+            logger.info("multiple errors for param %s but only returning first %s", name, error)
         error = error[0]
         if error == "type":
             raise Exceptions.invalid_parameter(name, blob[name], type=schema.fields[name].type_name)
@@ -102,9 +100,8 @@ def _validate(schema: ma.Schema, blob: dict) -> None:
             if error == "Unknown field.":
                 raise Exceptions.unknown_parameter(name)
         else:
-            logger.warning(f"unexpected error message during validation: {name} {error}")
+            logger.warning("unexpected error message during validation: %s %s", name, error)
             raise Exceptions.internal_error()
     else:
-        logger.debug(f"{sn} succeeded validation")
         blob.clear()
         blob.update(loaded_blob)
@@ -0,0 +1,191 @@
+"""
+Low-overhead statistical profiler, aggregated per operation.
+
+A background thread samples the stacks of request threads every ``interval`` seconds
+while the profiler is running; when it's stopped the only cost is the WSGI wrapper
+marking which threads are serving requests.  Output is in collapsed-stack format, one
+``operationId;frame;frame count`` line per unique stack, ready for flamegraph.pl or speedscope.
+
+    >>> profiler = SamplingProfiler()
+    >>> app = profiler.wrap(api)
+    >>> api.add_route("/_admin/profile", ProfilerResource(profiler))
+    >>> profiler.install_signals()  # SIGUSR1 toggles, SIGUSR2 dumps to a file
+
+    $ curl "localhost:8080/_admin/profile?seconds=30" > out.folded
+"""
+import logging
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+import falcon
+
+from . import hooks
+from .exc import Exceptions
+from .resources import tag
+
+
+__all__ = ["ProfilerResource", "SamplingProfiler"]
+logger = logging.getLogger(__name__)
+UNRESOLVED = "<unresolved>"
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float=0.005, max_depth: int=128) -> None:
+        self.interval = interval
+        self.max_depth = max_depth
+        self.running = False
+        self.samples = Counter()  # type: Counter
+        # thread ident -> operation id, for threads currently inside the wrapped app
+        self._active = {}  # type: Dict[int, str]
+        self._thread = None  # type: Optional[threading.Thread]
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self.running:
+                return
+            self.running = True
+            hooks.operation_resolved.subscribe(self._on_operation_resolved)
+            self._thread = threading.Thread(target=self._sample, name="scaffolding-profiler", daemon=True)
+            self._thread.start()
+        logger.info("sampling profiler started")
+
+    def stop(self) -> None:
+        with self._lock:
+            if not self.running:
+                return
+            self.running = False
+            hooks.operation_resolved.unsubscribe(self._on_operation_resolved)
+            thread, self._thread = self._thread, None
+        thread.join()
+        self._active.clear()
+        logger.info("sampling profiler stopped")
+
+    def toggle(self) -> None:
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def reset(self) -> None:
+        self.samples = Counter()
+
+    def record(self, seconds: float) -> str:
+        """Profile for a window of ``seconds`` and return only the samples from that window"""
+        was_running = self.running
+        previous, self.samples = self.samples, Counter()
+        self.start()
+        try:
+            time.sleep(seconds)
+        finally:
+            if not was_running:
+                self.stop()
+            window, self.samples = self.samples, previous
+            self.samples.update(window)
+        return self.collapsed(window)
+
+    def collapsed(self, samples: Optional[Counter]=None, operation: Optional[str]=None) -> str:
+        samples = self.samples if samples is None else samples
+        lines = [
+            f"{operation_id};{stack} {count}"
+            for (operation_id, stack), count in samples.most_common()
+            if operation is None or operation_id == operation
+        ]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def dump(self, directory: Optional[str]=None) -> str:
+        directory = directory or tempfile.gettempdir()
+        path = os.path.join(directory, f"scaffolding-{os.getpid()}-{int(time.time())}.folded")
+        with open(path, "wt") as out:
+            out.write(self.collapsed())
+        logger.info("wrote %d stacks to %s", len(self.samples), path)
+        return path
+
+    def install_signals(self, toggle=signal.SIGUSR1, dump=signal.SIGUSR2, directory: Optional[str]=None) -> None:
+        # start/stop join the sampler thread, so don't run them inside the signal handler's frame
+        signal.signal(toggle, lambda *_: threading.Thread(target=self.toggle, daemon=True).start())
+        signal.signal(dump, lambda *_: self.dump(directory))
+
+    def wrap(self, app):
+        """WSGI wrapper that limits sampling to threads serving a request"""
+        active = self._active
+
+        def profiled(environ, start_response):
+            if not self.running:
+                return app(environ, start_response)
+            ident = threading.get_ident()
+            active[ident] = UNRESOLVED
+            try:
+                return app(environ, start_response)
+            finally:
+                active.pop(ident, None)
+        return profiled
+
+    # noinspection PyUnusedLocal
+    def _on_operation_resolved(self, req, operation) -> None:
+        ident = threading.get_ident()
+        if ident in self._active:
+            self._active[ident] = operation.id
+
+    def _sample(self) -> None:
+        interval = self.interval
+        own = threading.get_ident()
+        while self.running:
+            active = self._active
+            if active:
+                samples = self.samples
+                for ident, frame in sys._current_frames().items():
+                    operation_id = active.get(ident)
+                    if operation_id is None or ident == own:
+                        continue
+                    samples[operation_id, self._collapse(frame)] += 1
+            time.sleep(interval)
+
+    def _collapse(self, frame) -> str:
+        stack = []
+        depth = self.max_depth
+        while frame is not None and depth:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+            frame = frame.f_back
+            depth -= 1
+        stack.reverse()
+        return ";".join(stack)
+
+
+@tag(openapi=False)
+class ProfilerResource:
+    """Collapsed stacks over HTTP; only answers requests made directly from the local machine.
+
+    * ``?seconds=N`` profiles a new window of N seconds, up to ``max_seconds``
+    * otherwise returns everything collected so far, optionally filtered with ``?operation=``
+
+    Requests carrying forwarding headers are refused, since behind a reverse proxy on the same host every
+    request arrives from localhost.
+    """
+    local_addrs = {"127.0.0.1", "::1"}
+    forwarding_headers = ("FORWARDED", "X-FORWARDED-FOR", "X-REAL-IP")
+
+    def __init__(self, profiler: SamplingProfiler, max_seconds: float=60.0) -> None:
+        self.profiler = profiler
+        self.max_seconds = max_seconds
+
+    def on_get(self, req: falcon.Request, resp: falcon.Response) -> None:
+        if req.remote_addr not in self.local_addrs or any(req.get_header(h) for h in self.forwarding_headers):
+            raise Exceptions.not_found()
+        seconds = req.get_param_as_float("seconds")
+        if seconds is not None:
+            if not 0 < seconds <= self.max_seconds:
+                raise Exceptions.invalid_parameter(
+                    "seconds", seconds, constraint=f"be between 0 and {self.max_seconds:g}")
+            body = self.profiler.record(seconds)
+        else:
+            body = self.profiler.collapsed(operation=req.get_param("operation"))
+        resp.content_type = falcon.MEDIA_TEXT
+        resp.body = body
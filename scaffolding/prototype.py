@@ -1,13 +1,20 @@
+import atexit
 import logging
-from typing import Optional
+import os
+from typing import Callable, List, Optional
 
 import falcon
 import falcon_cors
-from werkzeug.contrib.profiler import ProfilerMiddleware
 from werkzeug.serving import run_simple
 
+from . import hooks
+from .logs import BufferedLog
 from .openapi import Specification
+from .profiling import ProfilerResource, SamplingProfiler
 from .resources import autowire_resources
+from .server import PreforkServer
+from .tasks import TaskQueue
+from .warmup import ReadinessResource, Warmup
 
 
 __all__ = ["global_cors", "serve"]
@@ -27,15 +34,58 @@ def serve(
         autowire_ignore_errors: bool=True,
         port: int=8080, local: bool=True,
         debug: bool=True,
-        profile: bool=True) -> None:
+        profile: Optional[bool]=None,
+        profile_route: Optional[str]=None,
+        production: bool=False,
+        host: Optional[str]=None,
+        workers: Optional[int]=None,
+        max_requests: int=0,
+        graceful_timeout: float=30.0,
+        on_worker_start: Optional[List[Callable[[], None]]]=None,
+        warmup: Optional[Warmup]=None,
+        ready_route: str="/_admin/ready",
+        tasks: Optional[TaskQueue]=None,
+        log: Optional[BufferedLog]=None) -> None:
+    """Serve ``api`` for development, or with ``production=True`` through a pre-forking server.
 
-    logging.basicConfig(level=logging.DEBUG if debug else logging.INFO)
+    Production mode skips the reloader and runs ``workers`` processes (default: one per core)
+    that share a listening socket.  Autowiring happens before forking so the spec, compiled schemas and routes
+    are shared copy-on-write.  See :class:`scaffolding.server.PreforkServer` for draining and recycling.
+    Use ``on_worker_start`` for per-process setup such as ``Database.init``.
+
+    With a :class:`~scaffolding.warmup.Warmup`, per-operation state is prepared before forking and each worker
+    warms up after ``on_worker_start``, before it accepts connections.  In development warm-up runs in the
+    background.  Either way ``ready_route`` answers 503 until it's done.
+
+    With a :class:`~scaffolding.tasks.TaskQueue`, queued background tasks are run before a worker exits, for up
+    to ``graceful_timeout`` seconds.
+
+    With a :class:`~scaffolding.logs.BufferedLog`, logging goes through its background writer instead of
+    writing to stderr on the calling thread, and what's buffered is flushed when a worker exits.
+
+    ``profile`` installs an idle :class:`~scaffolding.profiling.SamplingProfiler`, by default only in development;
+    toggle it with SIGUSR1 (SIGUSR2 dumps).  With a ``profile_route`` it can also record a window over HTTP, from
+    localhost only.
+    """
+    logging.basicConfig(level=logging.INFO, handlers=[log.handler()] if log else None)
+    if log:
+        # registered first so it runs last, after anything else that logs at exit
+        atexit.register(log.close)
+    if debug:
+        # only scaffolding's loggers; leave sqlalchemy, werkzeug etc. at INFO
+        logging.getLogger("scaffolding").setLevel(logging.DEBUG)
+        hooks.enable_debug_logging()
     if autowire:
         if not spec or not resources:
             raise RuntimeError("must provide spec and resources when autowiring")
         autowire_resources(api, spec, resources, ignore_errors=autowire_ignore_errors)
 
-    host = "localhost" if local else "127.0.0.1"
+    if warmup:
+        api.add_route(ready_route, ReadinessResource(warmup))
+        warmup.prepare()
+
+    if host is None:
+        host = "localhost" if local else "127.0.0.1"
     if spec:
         has_handler = False
         for o in spec.operations:
@@ -44,8 +94,34 @@ def serve(
                 print(f"  {o.id} {o.verb.upper()} {o.path}")
         if has_handler:
             print()
+    app = api
+    if profile is None:
+        profile = not production
     if profile:
-        # limit output to top 10% of calls
-        api = ProfilerMiddleware(api, restrictions=(0.1,))
+        profiler = SamplingProfiler()
+        profiler.install_signals()
+        if profile_route:
+            api.add_route(profile_route, ProfilerResource(profiler))
+        app = profiler.wrap(api)
+    if production:
+        server = PreforkServer(
+            app, host, port,
+            workers=workers, max_requests=max_requests, graceful_timeout=graceful_timeout)
+        server.on_worker_start.extend(on_worker_start or [])
+        if warmup:
+            server.on_worker_start.append(warmup.run)
+        if tasks:
+            server.on_worker_exit.append(lambda: tasks.shutdown(graceful_timeout))
+        if log:
+            # after the tasks, which may log
+            server.on_worker_exit.append(log.close)
+        server.run()
+        return
+    # with the reloader, only the child process serves
+    if warmup and os.environ.get("WERKZEUG_RUN_MAIN"):
+        warmup.start()
+    if tasks:
+        atexit.register(tasks.shutdown, graceful_timeout)
     print(f"serving on {host}:{port}")
-    run_simple(host, port, api, use_reloader=True)
+    # threaded, so a profiling window doesn't hold up the requests it's meant to sample
+    run_simple(host, port, app, use_reloader=True, threaded=True)
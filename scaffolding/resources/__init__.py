@@ -5,10 +5,10 @@ import falcon
 
 from ..openapi import Operation, Specification
 from .pagination import Pagination
-from .tags import get_tag, get_tags, tag
+from .tags import get_tag, get_tags, in_spec, tag
 
 
-__all__ = ["Pagination", "tag", "get_tags", "get_tag", "autowire_resources"]
+__all__ = ["Pagination", "tag", "get_tags", "get_tag", "in_spec", "autowire_resources"]
 logger = logging.getLogger(__name__)
 
 
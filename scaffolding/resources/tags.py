@@ -1,7 +1,7 @@
 from typing import Any, Optional
 
 
-__all__ = ["tag", "get_tag", "get_tags"]
+__all__ = ["tag", "get_tag", "get_tags", "in_spec"]
 
 
 def tag(**tags):
@@ -93,3 +93,11 @@ def get_tag(key: str, resource, verb: str=None) -> Optional[Any]:
         {"path": "/users/{userId}/widgets"}
     """
     return get_tags(resource, verb).get(key)
+
+
+def in_spec(resource) -> bool:
+    """False for resources tagged ``@tag(openapi=False)``, such as admin and metrics routes.
+
+    Spec-driven middleware skips these instead of failing to resolve an operation.
+    """
+    return get_tags(resource).get("openapi", True) is not False
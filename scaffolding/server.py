@@ -0,0 +1,188 @@
+"""
+Pre-forking WSGI server for running scaffolding services under load.
+
+The parent binds one listening socket (SO_REUSEADDR and SO_REUSEPORT, so a new
+deploy can bind next to a draining one), finishes all per-process setup, then
+forks workers that inherit the socket and accept from it directly.
+
+    >>> server = PreforkServer(api, "0.0.0.0", 8080, workers=8, max_requests=10000)
+    >>> server.on_worker_start.append(lambda: db.init(DB_URL))
+    >>> server.run()
+
+* SIGTERM or SIGINT on the parent drains: workers stop accepting, finish in-flight
+  requests and exit; stragglers are killed after ``graceful_timeout`` seconds
+* a worker that has served ``max_requests`` drains itself and is replaced
+"""
+import gc
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from werkzeug.serving import make_server
+
+
+__all__ = ["PreforkServer", "listen"]
+logger = logging.getLogger(__name__)
+
+
+def listen(host: str, port: int, backlog: int=2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class PreforkServer:
+    def __init__(
+            self, app, host: str, port: int, *,
+            workers: Optional[int]=None,
+            max_requests: int=0,
+            graceful_timeout: float=30.0) -> None:
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        # called in each worker after fork, before it accepts connections
+        self.on_worker_start = []  # type: List[Callable[[], None]]
+        # called in each worker after it has drained
+        self.on_worker_exit = []  # type: List[Callable[[], None]]
+        self.children = {}  # type: Dict[int, int]
+        self.socket = None  # type: Optional[socket.socket]
+        self.stopping = False
+
+    # parent ==========================================================================================================
+
+    def run(self) -> None:
+        self.socket = listen(self.host, self.port)
+        # everything allocated so far (spec, compiled schemas, routes) is shared copy-on-write;
+        # keep the collector from touching those pages in each worker
+        gc.collect()
+        if hasattr(gc, "freeze"):
+            gc.freeze()
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        logger.info("serving on %s:%d with %d workers", self.host, self.port, self.workers)
+        for index in range(self.workers):
+            self._spawn(index)
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            index = self.children.pop(pid, None)
+            if index is None:
+                continue
+            if not self.stopping:
+                logger.info("worker %d exited with status %d, replacing", pid, status)
+                self._spawn(index)
+        self.socket.close()
+
+    def _spawn(self, index: int) -> None:
+        pid = os.fork()
+        if pid:
+            self.children[pid] = index
+            return
+        status = 0
+        # noinspection PyBroadException
+        try:
+            self._work()
+        except Exception:
+            logger.exception("worker %d failed", os.getpid())
+            status = 1
+        finally:
+            os._exit(status)
+
+    # noinspection PyUnusedLocal
+    def _stop(self, signum, frame) -> None:
+        if self.stopping:
+            return
+        self.stopping = True
+        logger.info("draining %d workers", len(self.children))
+        for pid in list(self.children):
+            _signal(pid, signal.SIGTERM)
+        threading.Thread(target=self._kill_stragglers, daemon=True).start()
+
+    def _kill_stragglers(self) -> None:
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.children and time.monotonic() < deadline:
+            time.sleep(0.1)
+        for pid in list(self.children):
+            logger.warning("worker %d did not drain within %.1fs, killing", pid, self.graceful_timeout)
+            _signal(pid, signal.SIGKILL)
+
+    # worker ==========================================================================================================
+
+    def _work(self) -> None:
+        self._server = None
+        self._draining = False
+        signal.signal(signal.SIGTERM, lambda *_: self._drain())
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            for fn in self.on_worker_start:
+                fn()
+            if self._draining:
+                return
+            server = make_server(self.host, self.port, self._counted(), threaded=True, fd=self.socket.fileno())
+            # join in-flight request threads in server_close instead of abandoning them
+            server.daemon_threads = False
+            server.block_on_close = True
+            self._server = server
+            # a SIGTERM from before the server was set had nothing to shut down; one from after shuts it down
+            # even if serve_forever hasn't started yet
+            if not self._draining:
+                server.serve_forever()
+            server.server_close()
+        finally:
+            for fn in self.on_worker_exit:
+                # noinspection PyBroadException
+                try:
+                    fn()
+                except Exception:
+                    logger.exception("on_worker_exit callback %r failed", fn)
+
+    def _drain(self) -> None:
+        if self._draining:
+            return
+        self._draining = True
+        if self._server is None:
+            return
+        # shutdown blocks until serve_forever returns, so it can't run on the serving thread
+        threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+    def _counted(self):
+        app = self.app
+        max_requests = self.max_requests
+        if not max_requests:
+            return app
+        lock = threading.Lock()
+        served = [0]
+
+        def counted(environ, start_response):
+            with lock:
+                served[0] += 1
+                recycle = served[0] == max_requests
+            if recycle:
+                logger.info("worker %d served %d requests, recycling", os.getpid(), max_requests)
+                self._drain()
+            return app(environ, start_response)
+        return counted
+
+
+def _signal(pid: int, signum: int) -> None:
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
@@ -0,0 +1,185 @@
+"""
+Background tasks that run after the response, so follow-up work doesn't add to request latency.
+
+A :class:`TaskQueue` is a bounded queue drained by a small per-process thread pool.  Its middleware gives each
+request a :class:`Deferred` in ``req.context["tasks"]``; what's added there is queued once the request is done::
+
+    >>> tasks = TaskQueue(workers=2, max_queued=1000)
+    >>> api = falcon.API(middleware=[tasks.create_middleware(), db.create_middleware(spec), ...])
+
+    >>> def on_post(self, req, resp, **params):
+    ...     result = verify_pw(hash=user.password, password=params["password"])
+    ...     if result["rehash"]:
+    ...         req.context["tasks"].add(rehash, user.id, params["password"])
+
+    >>> def rehash(user_id, password):
+    ...     with db.session_scope() as session:
+    ...         session.query(User).get(user_id).password = hash_pw(password)
+
+Tasks run on other threads, after the request's session is gone: pass ids rather than rows, and use
+:meth:`~scaffolding.middleware.Database.session_scope` for a session of their own.
+
+When the queue is full a task is dropped and counted rather than blocking the request.  Threads start on the
+first task in each process, so a queue can be created before forking.  ``serve(..., tasks=tasks)`` flushes the
+queue when a worker drains; otherwise call :meth:`TaskQueue.shutdown` on the way out.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import falcon
+
+from .misc import after_fork_in_child
+
+
+__all__ = ["Deferred", "TaskMiddleware", "TaskQueue"]
+logger = logging.getLogger(__name__)
+
+Task = Tuple[Callable, tuple, dict]
+_STOP = object()
+
+
+class TaskQueue:
+    def __init__(self, workers: int=2, max_queued: int=1024, name: str="scaffolding-tasks") -> None:
+        self.workers = workers
+        self.max_queued = max_queued
+        self.name = name
+        self.closed = False
+        self._reset()
+        after_fork_in_child(self, "_reset")
+
+    def create_middleware(self) -> "TaskMiddleware":
+        return TaskMiddleware(self)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> bool:
+        """Queue ``fn(*args, **kwargs)``; False if it was dropped because the queue is full or shut down"""
+        if os.getpid() != self._pid:
+            # only without os.register_at_fork
+            self._reset()
+        if self.closed:
+            logger.warning("task queue is shut down, dropping %r", fn)
+            self._count("dropped")
+            return False
+        if not self._threads:
+            self._start()
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+        except queue.Full:
+            logger.warning("task queue is full (%d), dropping %r", self.max_queued, fn)
+            self._count("dropped")
+            return False
+        self._count("submitted")
+        return True
+
+    def shutdown(self, timeout: Optional[float]=None) -> bool:
+        """Stop accepting tasks and run the ones already queued.  False if they didn't finish within ``timeout``."""
+        self.closed = True
+        if self._pid != os.getpid():
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                self._queue.put(_STOP, timeout=_remaining(deadline))
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(_remaining(deadline))
+        finished = not any(thread.is_alive() for thread in self._threads)
+        if not finished:
+            logger.warning("%d background tasks did not finish during shutdown", self._queue.qsize())
+        return finished
+
+    def stats(self) -> dict:
+        """This process's counters: submitted, completed, failed, dropped, running, queued and busy seconds"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    # workers =========================================================================================================
+
+    def _reset(self) -> None:
+        # a fresh lock rather than the parent's, which one of its threads may have held when this process forked
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        # the parent's threads and queued tasks don't exist here
+        self._queue = queue.Queue(self.max_queued)
+        self._threads = []  # type: List[threading.Thread]
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "dropped": 0, "running": 0, "busy": 0.0}
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                # daemon so a stuck task can't hold the process open; shutdown is what waits for them
+                thread = threading.Thread(target=self._work, name=f"{self.name}-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self) -> None:
+        while True:
+            task = self._queue.get()
+            if task is _STOP:
+                return
+            fn, args, kwargs = task
+            self._count("running")
+            start = time.perf_counter()
+            outcome = "completed"
+            # noinspection PyBroadException
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                logger.exception("background task %r failed", fn)
+                outcome = "failed"
+            with self._lock:
+                self._stats["running"] -= 1
+                self._stats[outcome] += 1
+                self._stats["busy"] += time.perf_counter() - start
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+
+class Deferred:
+    """Tasks a request queues when it's done.  ``add`` only runs when the request succeeded, ``add_always``
+    regardless (audit records of failed attempts, for instance)."""
+    def __init__(self) -> None:
+        self.on_success = []  # type: List[Task]
+        self.always = []  # type: List[Task]
+
+    def add(self, fn: Callable, *args, **kwargs) -> None:
+        self.on_success.append((fn, args, kwargs))
+
+    def add_always(self, fn: Callable, *args, **kwargs) -> None:
+        self.always.append((fn, args, kwargs))
+
+
+class TaskMiddleware:
+    """Attaches a :class:`Deferred` to each request and queues its tasks in process_response.
+
+    Place this before DatabaseMiddleware so tasks are queued after the request's session commits.
+    """
+    def __init__(self, tasks: TaskQueue) -> None:
+        self.tasks = tasks
+
+    def process_request(self, req: falcon.Request, resp: falcon.Response) -> None:
+        req.context["tasks"] = Deferred()
+
+    def process_response(self, req, resp, resource, req_succeeded: bool, **__) -> None:
+        deferred = req.context.pop("tasks", None)
+        if deferred is None:
+            return
+        queued = deferred.on_success + deferred.always if req_succeeded else deferred.always
+        for fn, args, kwargs in queued:
+            self.tasks.submit(fn, *args, **kwargs)
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
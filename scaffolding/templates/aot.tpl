@@ -0,0 +1,239 @@
+{% block header %}"""
+Generated by `scaffold generate-stubs --aot` from {{ spec_path }}
+
+Routes, parameter extraction, validation and auth dispatch are compiled into this module,
+so it starts without parsing the spec or building schemas.  Regenerate it when the spec changes.
+"""
+import base64
+import json
+import time
+
+import falcon
+
+import scaffolding
+from scaffolding import hooks
+from scaffolding.exc import Exceptions
+
+
+format = lambda r, p: {"auth": r.context["principal"], "params": p, "body": r.media}
+dump = lambda o: json.dumps(o, indent=2, sort_keys=True)
+
+
+class _Operation:
+    """The parts of scaffolding.openapi.Operation that middleware and hooks read"""
+    __slots__ = ("id", "path", "verb", "tags", "raw", "has_params", "has_body", "mechanisms", "validate")
+
+    def __init__(self, id, path, verb, tags, raw, has_params, has_body, mechanisms, validate):
+        self.id = id
+        self.path = path
+        self.verb = verb
+        self.tags = tags
+        self.raw = raw
+        self.has_params = has_params
+        self.has_body = has_body
+        self.mechanisms = mechanisms
+        self.validate = validate
+
+
+def _resolve(req):
+    operation = req.context.get("operation")
+    if operation is None:
+        operation = _OPERATIONS.get((req.uri_template, req.method))
+        if operation is not None:
+            req.context["operation"] = operation
+            if hooks.operation_resolved.enabled:
+                hooks.operation_resolved.emit(req, operation)
+    return operation
+
+
+def _in_spec(resource):
+    return getattr(resource, "tags", {}).get("openapi", True) is not False
+
+
+# validators raise outside their except blocks so the conversion error isn't chained onto the 400
+def _integer(name, value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    raise Exceptions.invalid_parameter(name, value, type="integer")
+
+
+def _number(name, value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    raise Exceptions.invalid_parameter(name, value, type="number")
+
+
+def _string(name, value):
+    if isinstance(value, str):
+        return value
+    raise Exceptions.invalid_parameter(name, value, type="string")
+
+
+def _boolean(name, value):
+    if value is True or value is False:
+        return value
+    raise Exceptions.invalid_parameter(name, value, type="boolean")
+
+
+def _body(req, fields):
+    body = req.media
+    if not isinstance(body, dict):
+        raise Exceptions.invalid_parameter("body", body, type="object")
+    for name in body:
+        if name not in fields:
+            raise Exceptions.unknown_parameter(name)
+    return body
+
+
+def _basic(req):
+    header = req.auth
+    if not header or not header.startswith("Basic "):
+        return None
+    try:
+        decoded = base64.b64decode(header[6:].encode()).decode()
+    except Exception:
+        decoded = None
+    if decoded is None or ":" not in decoded:
+        raise Exceptions.malformed_authentication()
+    return tuple(decoded.split(":", 1))
+
+
+def _bearer(req):
+    header = req.auth
+    if not header or not header.startswith("Bearer "):
+        return None
+    token = header[7:]
+    if not token:
+        raise Exceptions.malformed_authentication()
+    return token,
+
+
+def _api_key(name, loc):
+    if loc == "cookie":
+        get = lambda req: req.cookies.get(name)
+    elif loc == "header":
+        get = lambda req: req.get_header(name)
+    elif loc == "query":
+        get = lambda req: req.get_param(name)
+    else:
+        raise RuntimeError(f"unknown apiKey location {loc!r}")
+
+    def parse(req):
+        val = get(req)
+        if val is not None:
+            return val,
+        return None
+    return parse
+
+
+def _no_auth(req):
+    return ()
+
+
+class CompiledAuthentication:
+    """
+    You must implement the following methods:
+        get_login_principal
+        get_token_principal
+    """
+    def __init__(self):
+        self.handlers = {
+            "basic": self.get_login_principal,
+            "token": self.get_token_principal,
+            "none": self.get_anonymous_principal,
+        }
+
+    def get_login_principal(self, req, username, password):
+        raise NotImplementedError
+
+    def get_token_principal(self, req, token):
+        raise NotImplementedError
+
+    def get_anonymous_principal(self, req):
+        return "none", None
+
+    def process_resource(self, req, resp, resource, params):
+        if not _in_spec(resource):
+            return
+        operation = _resolve(req)
+        if operation is None:
+            return
+        start = time.perf_counter() if hooks.auth_done.enabled else 0
+        last_exc = None
+        for type, parser in operation.mechanisms:
+            # noinspection PyBroadException
+            try:
+                material = parser(req)
+            except Exception:
+                last_exc = Exceptions.malformed_authentication
+                continue
+            if material is None:
+                last_exc = Exceptions.missing_authentication
+                continue
+            type, value = self.handlers[type](req, *material)
+            principal = req.context["principal"] = {"type": type, "value": value}
+            if hooks.auth_done.enabled:
+                hooks.auth_done.emit(req, principal, time.perf_counter() - start)
+            return
+        if last_exc:
+            raise last_exc()
+        raise RuntimeError("Failed to configure credentials and failed to raise")
+
+
+class CompiledValidation:
+    def process_resource(self, req, resp, resource, params):
+        if req.method == "OPTIONS" or not _in_spec(resource):
+            return
+        start = time.perf_counter() if hooks.validation_done.enabled else 0
+        operation = _resolve(req)
+        if operation is None:
+            raise Exceptions.not_found()
+        operation.validate(req, params)
+        if hooks.validation_done.enabled:
+            hooks.validation_done.emit(req, operation, time.perf_counter() - start)
+{% endblock %}
+{% block operations %}
+
+# compiled operations =================================================================================================
+{{ compiled }}
+
+
+# service =============================================================================================================
+
+
+class MyAuthentication(CompiledAuthentication):
+    def get_login_principal(self, req: falcon.Request, username: str, password: str) -> tuple:
+        # TODO load AccountModel from database, dynamodb..
+        return "user", (username, password)
+
+    def get_token_principal(self, req: falcon.Request, token: str) -> tuple:
+        # TODO load AccountModel from database, dynamodb..
+        return "token", token
+{% endblock %}
+{% block resource %}
+
+class {{ resource }}:{% for op in operations %}
+    def on_{{ op.verb }}(self, req: falcon.Request, resp: falcon.Response, **params) -> None:
+        """{{ op.id }}"""
+        resp.media = ctx = format(req, params)
+        print(dump(ctx))
+{% endfor %}{%  endblock %}
+{% block footer %}
+
+api = falcon.API(
+    middleware=[
+        MyAuthentication(),
+        CompiledValidation(),
+    ],
+)
+api.add_error_handler(scaffolding.error_handler)
+{{ routes }}
+
+if __name__ == "__main__":
+    from scaffolding.server import PreforkServer
+    PreforkServer(api, "127.0.0.1", 8080).run()
+{%  endblock %}
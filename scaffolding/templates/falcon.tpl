@@ -2,9 +2,9 @@
 import json
 import os
 import scaffolding
-from scaffolding.middleware import OpenApiAuthentication, OpenApiRequestValidation
+from scaffolding.middleware import Cors, OpenApiAuthentication, OpenApiRequestValidation
 from scaffolding.openapi import Specification
-from scaffolding.prototype import serve, global_cors
+from scaffolding.prototype import serve
 from scaffolding.resources import tag
 
 HERE = os.path.abspath(os.path.dirname(__file__))
@@ -36,7 +36,7 @@ class {{ resource }}:{% for op in operations %}
 spec = Specification.from_file(f"{HERE}/v1.yaml")
 api = falcon.API(
     middleware=[
-        global_cors,
+        Cors(spec),
         MyAuthentication(spec),
         OpenApiRequestValidation(spec)
     ],
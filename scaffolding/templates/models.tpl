@@ -0,0 +1,21 @@
+{% block dto %}"""
+Generated by `scaffold generate-models --backend dto` from {{ spec_path }}
+"""
+from typing import List, Optional
+
+
+{% endblock %}
+{% block sqlalchemy %}"""
+Generated by `scaffold generate-models --backend sqlalchemy` from {{ spec_path }}
+
+Call db.init(connection_url) before using the models.
+"""
+import sqlalchemy
+
+from scaffolding.middleware import Database
+
+
+db = Database()
+
+
+{% endblock %}
@@ -0,0 +1,53 @@
+{% block module %}"""
+Generated by `scaffold generate-stubs --out-dir` for tag {{ tag }}
+"""
+import json
+
+import falcon
+
+from scaffolding.resources import tag
+
+format = lambda r, p: {"auth": r.context["principal"], "params": p, "body": r.media}
+dump = lambda o: json.dumps(o, indent=2, sort_keys=True)
+{% endblock %}
+{% block app %}"""
+Generated by `scaffold generate-stubs --out-dir` from {{ spec_path }}
+
+Each tag's resource lives in resources/<tag>.py.  Regenerating only rewrites the modules whose operations changed.
+"""
+import falcon
+import os
+import scaffolding
+from scaffolding.middleware import Cors, OpenApiAuthentication, OpenApiRequestValidation
+from scaffolding.openapi import Specification
+from scaffolding.prototype import serve
+{% for module, resource in resources %}from resources.{{ module }} import {{ resource }}
+{% endfor %}
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+
+class MyAuthentication(OpenApiAuthentication):
+    def get_login_principal(self, req: falcon.Request, username: str, password: str) -> tuple:
+        # TODO load AccountModel from database, dynamodb..
+        return "user", (username, password)
+
+    def get_token_principal(self, req: falcon.Request, token: str) -> tuple:
+        # TODO load AccountModel from database, dynamodb..
+        return "token", token
+
+
+spec = Specification.from_file(f"{HERE}/v1.yaml")
+api = falcon.API(
+    middleware=[
+        Cors(spec),
+        MyAuthentication(spec),
+        OpenApiRequestValidation(spec)
+    ],
+)
+api.add_error_handler(scaffolding.error_handler)
+
+resources = [{% for _, resource in resources %}
+    {{ resource }}(),{% endfor %}
+]
+serve(api, spec, resources)
+{%  endblock %}
@@ -0,0 +1,154 @@
+"""
+Warm-up before accepting traffic, so the first requests after a deploy don't pay for lazy setup.
+
+Three phases, each optional:
+
+* ``prepare`` fills every middleware's per-operation state (auth mechanisms, compiled serializers, tag lookups).
+  Middleware opts in with a ``warm_up(operation, resource)`` method.  Run it before forking so the state is
+  shared copy-on-write.
+* ``connect`` opens each database's pool connections; run it in every process, after forking.
+* ``replay`` sends ``requests`` synthetic requests per operation through the in-process app, built by
+  :class:`~scaffolding.bench.RequestFactory`.  Only read-only operations are replayed by default.  Replayed
+  requests are marked in their WSGI environ; :func:`is_warmup` tells middleware to leave them out of metrics,
+  rate limits and the response cache.
+
+    >>> middleware = [db.create_middleware(spec), MyAuthentication(spec), OpenApiRequestValidation(spec)]
+    >>> api = falcon.API(middleware=middleware)
+    >>> warmup = Warmup(api, spec, middleware, databases=[db], requests=2,
+    ...                 factory=RequestFactory(spec, token=WARMUP_TOKEN))
+    >>> api.add_route("/_admin/ready", ReadinessResource(warmup))
+    >>> serve(api, spec, resources, production=True, warmup=warmup)
+
+``serve`` prepares before forking and runs the rest in each worker before it accepts connections.
+:class:`ReadinessResource` answers 503 until warm-up has finished.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Iterable, Optional
+
+import falcon
+
+from .bench import AppTarget, RequestFactory
+from .openapi import Specification
+from .resources import tag
+
+
+__all__ = ["ReadinessResource", "Warmup", "is_warmup"]
+logger = logging.getLogger(__name__)
+
+READ_ONLY = ("GET", "HEAD")
+WARMUP_ENV = "scaffolding.warmup"
+
+
+def is_warmup(req: falcon.Request) -> bool:
+    """Whether ``req`` was sent by :meth:`Warmup.replay` rather than a client"""
+    return bool(req.env.get(WARMUP_ENV))
+
+
+class Warmup:
+    def __init__(
+            self, api: falcon.API, spec: Specification, middleware: Iterable, *,
+            databases: Iterable=(),
+            connections: Optional[int]=None,
+            requests: int=0,
+            methods: Iterable[str]=READ_ONLY,
+            factory: Optional[RequestFactory]=None,
+            app=None) -> None:
+        self.api = api
+        self.spec = spec
+        # the list the api was created with; falcon doesn't expose it
+        self.middleware = list(middleware)
+        self.databases = list(databases)
+        self.connections = connections
+        self.requests = requests
+        self.methods = frozenset(m.upper() for m in methods)
+        self.factory = factory or RequestFactory(spec)
+        # what requests are replayed through; pass the wrapped app if something wraps the api
+        self.app = app or api
+        self.phase = "pending"
+        self._ready = threading.Event()
+        self._prepared = None  # type: Optional[int]
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def prepare(self) -> int:
+        """Calls each middleware's ``warm_up`` for every operation.  Returns the number of operations."""
+        if self._prepared is not None:
+            return self._prepared
+        self.phase = "prepare"
+        hooks = [m.warm_up for m in self.middleware if hasattr(m, "warm_up")]
+        count = 0
+        for operation in self.spec.operations:
+            resource = getattr(operation.handler, "__self__", None)
+            for warm_up in hooks:
+                warm_up(operation, resource)
+            count += 1
+        self._prepared = count
+        return count
+
+    def connect(self) -> int:
+        """Opens each database's pool connections.  Returns the number opened."""
+        self.phase = "connect"
+        return sum(db.warm_pool(self.connections) for db in self.databases)
+
+    def replay(self) -> Counter:
+        """Sends ``requests`` synthetic requests per replayed operation.  Returns a count of response statuses."""
+        self.phase = "replay"
+        statuses = Counter()  # type: Counter
+        if not self.requests:
+            return statuses
+        target = AppTarget(self.app, environ={WARMUP_ENV: True})
+        operations = [o for o in self.spec.operations if o.handler and o.verb.upper() in self.methods]
+        for operation in operations:
+            request = self.factory.build(operation)
+            for _ in range(self.requests):
+                try:
+                    status = target.send(request)
+                except Exception:
+                    logger.exception("warm-up request to %s failed", operation.id)
+                    status = 500
+                statuses[status] += 1
+                if status >= 500:
+                    logger.warning("warm-up request to %s returned %d", operation.id, status)
+        return statuses
+
+    def run(self) -> None:
+        """Runs every phase, then marks the process ready"""
+        start = time.perf_counter()
+        operations = self.prepare()
+        connections = self.connect()
+        statuses = self.replay()
+        self.phase = "ready"
+        self._ready.set()
+        logger.info(
+            "warmed up %d operations, %d connections and %d requests in %.2fs (pid %d)",
+            operations, connections, sum(statuses.values()), time.perf_counter() - start, os.getpid())
+
+    def start(self) -> threading.Thread:
+        """Runs warm-up on a background thread, so the server can accept connections and report not-ready"""
+        thread = threading.Thread(target=self.run, name="scaffolding-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def wait(self, timeout: Optional[float]=None) -> bool:
+        return self._ready.wait(timeout)
+
+
+@tag(openapi=False)
+class ReadinessResource:
+    """200 once warm-up has finished, otherwise 503; for load balancer and orchestrator readiness checks"""
+    def __init__(self, warmup: Warmup) -> None:
+        self.warmup = warmup
+
+    def on_get(self, req: falcon.Request, resp: falcon.Response) -> None:
+        ready = self.warmup.ready
+        resp.status = falcon.HTTP_200 if ready else falcon.HTTP_503
+        resp.cache_control = ["no-store"]
+        resp.media = {"ready": ready, "phase": self.warmup.phase}
+
+    on_head = on_get
@@ -0,0 +1,55 @@
+"""CPU cost of compressing JSON responses against the bytes it saves.
+
+    $ python scripts/compression_bench.py
+
+For each body size and level, prints the CPU time per response, the compression ratio, and the bytes saved per
+millisecond of CPU.  Use it to pick ``Compression(min_size=..., level=...)`` for a deployment.
+"""
+import json
+import time
+
+from scaffolding.middleware.compression import _compress
+
+
+SIZES = (512, 1024, 4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024, 2 * 1024 * 1024)
+LEVELS = (1, 6, 9)
+ENCODINGS = ("gzip", "deflate")
+
+
+def payload(size: int) -> bytes:
+    """A JSON list of rows shaped like a typical list operation's response"""
+    rows, length = [], 2
+    while length < size:
+        i = len(rows)
+        rows.append({"id": i, "name": f"user-{i}", "email": f"user{i}@example.com", "active": i % 3 != 0,
+                     "tags": ["a", "b"][:i % 3], "createdAt": f"2019-01-{i % 28 + 1:02d}T00:00:00Z"})
+        length += len(json.dumps(rows[-1])) + 2
+    return json.dumps(rows).encode()
+
+
+def bench(data: bytes, encoding: str, level: int, budget: float=0.1) -> tuple:
+    n, start = 0, time.process_time()
+    while True:
+        out = _compress(data, encoding, level)
+        n += 1
+        elapsed = time.process_time() - start
+        if elapsed >= budget:
+            return elapsed / n, len(out)
+
+
+def main() -> None:
+    header = ("encoding", "level", "size", "out", "ratio", "us/resp", "MB/s", "saved/ms")
+    print(" ".join(f"{h:>{w}}" for h, w in zip(header, (8, 5, 9, 9, 6, 9, 7, 9))))
+    for encoding in ENCODINGS:
+        for level in LEVELS:
+            for size in SIZES:
+                data = payload(size)
+                seconds, out = bench(data, encoding, level)
+                saved_per_ms = (len(data) - out) / (seconds * 1000)
+                print(
+                    f"{encoding:>8} {level:>5} {len(data):>9} {out:>9} {out / len(data):>6.2f} "
+                    f"{seconds * 1e6:>9.1f} {len(data) / seconds / 1e6:>7.1f} {saved_per_ms:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import falcon
+import falcon.testing
+import pytest
+from sqlalchemy import Column, Integer, String
+
+import scaffolding
+from scaffolding.exc import Exceptions
+from scaffolding.middleware import BatchResource, Database, OpenApiAuthentication, OpenApiRequestValidation
+from scaffolding.openapi import Specification
+from scaffolding.resources import autowire_resources, tag
+
+
+SPEC = {
+    "openapi": "3.0.0",
+    "info": {"title": "batch", "version": "1"},
+    "paths": {
+        "/widgets": {
+            "post": {
+                "operationId": "createWidget",
+                "requestBody": {"content": {"application/json": {"schema": {
+                    "type": "object",
+                    "required": ["name"],
+                    "properties": {"name": {"type": "string"}},
+                }}}},
+                "responses": {"201": {"description": "created"}},
+            },
+        },
+    },
+}
+db = Database()
+
+
+class Widget(db.base):
+    __tablename__ = "widgets"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True)
+
+
+class Authentication(OpenApiAuthentication):
+    pass
+
+
+@tag(path="/widgets")
+class WidgetsResource:
+    def on_post(self, req, resp):
+        name = req.media["name"]
+        db.session.add(Widget(name=name))
+        if name == "invalid":
+            # added, then rejected
+            db.session.flush()
+            raise Exceptions.invalid_parameter("name", name)
+        resp.status = falcon.HTTP_201
+        resp.media = {}
+
+
+@pytest.fixture
+def client():
+    db.init("sqlite://", echo=False)
+    spec = Specification(SPEC)
+    middleware = [db.create_middleware(spec), Authentication(spec), OpenApiRequestValidation(spec)]
+    api = falcon.API(middleware=middleware)
+    api.add_error_handler(scaffolding.error_handler)
+    autowire_resources(api, spec, [WidgetsResource()])
+    BatchResource(spec, middleware[1]).install(api, middleware)
+    yield falcon.testing.TestClient(api)
+    db.session.remove()
+    db.base.metadata.drop_all(db.engine)
+
+
+def names():
+    return sorted(name for name, in db.session.query(Widget.name))
+
+
+def create(name: str) -> dict:
+    return {"operationId": "createWidget", "body": {"name": name}}
+
+
+@pytest.mark.parametrize("failing", ["first", "invalid"])
+def test_failed_write_rolled_back_alone(client, failing):
+    db.session.add(Widget(name="first"))
+    db.session.commit()
+    db.session.remove()
+
+    response = client.simulate_post("/batch", json=[create("second"), create(failing), create("third")])
+    assert response.status == falcon.HTTP_200
+    assert [entry["status"] for entry in response.json] == [201, 500 if failing == "first" else 400, 201]
+    assert names() == ["first", "second", "third"]
@@ -0,0 +1,94 @@
+import bloop
+import pytest
+
+from scaffolding.middleware import DynamoDatabase
+
+
+class Base(bloop.BaseModel):
+    class Meta:
+        abstract = True
+
+
+class Widget(Base):
+    id = bloop.Column(bloop.String, hash_key=True)
+    name = bloop.Column(bloop.String)
+
+
+class StubClient:
+    """Records batch calls and serves items from ``items``, keyed by id"""
+    def __init__(self, items: dict) -> None:
+        self.items = items
+        self.gets = []
+        self.writes = []
+
+    def batch_get_item(self, RequestItems):
+        self.gets.append(RequestItems)
+        responses = {}
+        for table, request in RequestItems.items():
+            found = [self.items[key["id"]["S"]] for key in request["Keys"] if key["id"]["S"] in self.items]
+            responses[table] = found
+        return {"Responses": responses, "UnprocessedKeys": {}}
+
+    def batch_write_item(self, RequestItems):
+        self.writes.append(RequestItems)
+        return {"UnprocessedItems": {}}
+
+
+@pytest.fixture
+def db():
+    client = StubClient({
+        "a": {"id": {"S": "a"}, "name": {"S": "first"}},
+        "b": {"id": {"S": "b"}, "name": {"S": "second"}},
+    })
+    db = DynamoDatabase()
+    db.client = client
+    db.engine = bloop.Engine(dynamodb=client, dynamodbstreams=object())
+    db.engine.bind(Base, skip_table_setup=True)
+    return db
+
+
+def test_loads_batched_and_deduplicated(db):
+    uow = db.unit_of_work()
+    a = uow.get(Widget, id="a")
+    assert uow.get(Widget, id="a") is a
+    b = uow.get(Widget, id="b")
+    missing = uow.get(Widget, id="c")
+    assert not db.client.gets
+
+    assert uow.is_missing(missing)
+    assert (a.name, b.name) == ("first", "second")
+    assert not uow.is_missing(a)
+    assert len(db.client.gets) == 1
+    keys = db.client.gets[0]["Widget"]["Keys"]
+    assert sorted(key["id"]["S"] for key in keys) == ["a", "b", "c"]
+
+    # already loaded this request
+    assert uow.fetch(Widget, id="a") is a
+    assert uow.fetch(Widget, id="c") is None
+    assert len(db.client.gets) == 1
+
+
+def test_writes_coalesced_on_commit(db):
+    uow = db.unit_of_work()
+    uow.save(Widget(id="a", name="old"))
+    uow.save(Widget(id="a", name="new"), Widget(id="b", name="b"))
+    uow.delete(Widget(id="c"))
+    assert not db.client.writes
+
+    uow.commit()
+    assert len(db.client.writes) == 1
+    requests = db.client.writes[0]["Widget"]
+    assert {"PutRequest": {"Item": {"id": {"S": "a"}, "name": {"S": "new"}}}} in requests
+    assert {"DeleteRequest": {"Key": {"id": {"S": "c"}}}} in requests
+    assert len(requests) == 3
+
+
+def test_savepoint_drops_later_writes(db):
+    uow = db.unit_of_work()
+    uow.save(Widget(id="a", name="kept"))
+    savepoint = uow.begin_nested()
+    uow.save(Widget(id="a", name="dropped"), Widget(id="b", name="dropped"))
+    savepoint.rollback()
+
+    uow.commit()
+    assert db.client.writes == [{"Widget": [{"PutRequest": {"Item": {"id": {"S": "a"}, "name": {"S": "kept"}}}}]}]
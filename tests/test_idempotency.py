@@ -0,0 +1,83 @@
+import falcon
+import falcon.testing
+import pytest
+
+import scaffolding
+from scaffolding.middleware import (
+    Database,
+    Idempotency,
+    OpenApiAuthentication,
+    OpenApiRequestValidation,
+    SqlIdempotencyStore,
+)
+from scaffolding.openapi import Specification
+from scaffolding.resources import autowire_resources, tag
+
+
+SPEC = {
+    "openapi": "3.0.0",
+    "info": {"title": "idempotency", "version": "1"},
+    "paths": {
+        "/orders": {
+            "post": {
+                "operationId": "createOrder",
+                "security": [{"bearer": []}],
+                "responses": {"201": {"description": "created"}},
+            },
+        },
+    },
+    "components": {"securitySchemes": {"bearer": {"type": "http", "scheme": "bearer"}}},
+}
+db = Database()
+
+
+class Account:
+    """Like a model: loaded fresh for each request, hashed by identity"""
+    def __init__(self, id: int) -> None:
+        self.id = id
+
+
+class Authentication(OpenApiAuthentication):
+    def get_token_principal(self, req, token):
+        return "account", Account(int(token))
+
+
+@tag(path="/orders")
+class OrdersResource:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    @tag(idempotency={"ttl": 60})
+    def on_post(self, req, resp):
+        self.calls += 1
+        resp.status = falcon.HTTP_201
+        resp.media = {"order": self.calls}
+
+
+@pytest.fixture(params=["memory", "sql"])
+def app(request):
+    db.init("sqlite://", echo=False)
+    spec = Specification(SPEC)
+    store = SqlIdempotencyStore(db) if request.param == "sql" else None
+    api = falcon.API(middleware=[
+        db.create_middleware(spec), Authentication(spec), OpenApiRequestValidation(spec), Idempotency(spec, store)])
+    api.add_error_handler(scaffolding.error_handler)
+    resource = OrdersResource()
+    autowire_resources(api, spec, [resource])
+    yield falcon.testing.TestClient(api), resource
+    db.session.remove()
+    db.base.metadata.drop_all(db.engine)
+
+
+def test_retry_from_same_principal_replayed(app):
+    client, resource = app
+    headers = {"Authorization": "Bearer 1", "Idempotency-Key": "k"}
+    first = client.simulate_post("/orders", headers=headers)
+    retry = client.simulate_post("/orders", headers=headers)
+    assert retry.headers.get("idempotent-replayed") == "true"
+    assert retry.json == first.json == {"order": 1}
+    assert resource.calls == 1
+
+    # the same key from someone else is theirs
+    other = client.simulate_post("/orders", headers={**headers, "Authorization": "Bearer 2"})
+    assert other.json == {"order": 2}
@@ -0,0 +1,63 @@
+import pytest
+import sqlalchemy
+from sqlalchemy import Column, Integer, String
+
+from scaffolding.middleware import Database, Loaders
+
+
+db = Database()
+
+
+class User(db.base):
+    __tablename__ = "users"
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+@pytest.fixture
+def statements():
+    db.init("sqlite://", echo=False)
+    db.session.add_all(User(id=i, name=f"u{i}") for i in range(1, 6))
+    db.session.commit()
+    issued = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        issued.append(statement)
+    sqlalchemy.event.listen(db.engine, "before_cursor_execute", record)
+    yield issued
+    sqlalchemy.event.remove(db.engine, "before_cursor_execute", record)
+    db.session.remove()
+    db.base.metadata.drop_all(db.engine)
+
+
+def test_one_in_query_per_batch(statements):
+    loader = Loaders(db).model(User)
+    deferred = [loader.defer(i) for i in (1, 2, 3, 9)]
+    assert not statements
+
+    assert [d.value and d.value.name for d in deferred] == ["u1", "u2", "u3", None]
+    assert len(statements) == 1
+    assert " IN " in statements[0]
+
+
+def test_memoized_within_request(statements):
+    loaders = Loaders(db)
+    assert loaders.model(User).load_many([1, 2])[1].name == "u2"
+    # the same request's loader, a key it's seen and one it hasn't
+    loader = loaders.model(User)
+    assert loader.load(1).name == "u1"
+    assert len(statements) == 1
+    assert loader.load_many([1, 2, 4])[2].name == "u4"
+    assert len(statements) == 2
+
+    # a new request starts empty
+    assert Loaders(db).model(User).load(1).name == "u1"
+    assert len(statements) == 3
+
+
+def test_clear_forgets_rows(statements):
+    loaders = Loaders(db)
+    loaders.model(User).load(1)
+    loaders.clear()
+    loaders.model(User).load(1)
+    assert len(statements) == 2
@@ -0,0 +1,56 @@
+import json
+import os
+import threading
+
+import falcon
+import falcon.testing
+
+from scaffolding.middleware import Metrics
+
+
+def record(metrics: Metrics) -> None:
+    req, resp = falcon.Request(falcon.testing.create_environ()), falcon.Response()
+    metrics.process_request(req, resp)
+    metrics.process_response(req, resp, None, True)
+
+
+def requests(data: dict) -> int:
+    return sum(n for _, _, n in data["requests"])
+
+
+def test_threads_spread_over_shards():
+    metrics = Metrics()
+    shards = []
+    barrier = threading.Barrier(4)
+
+    def work():
+        # all alive at once, so no ident is reused
+        barrier.wait()
+        shards.append(metrics._shard())
+        barrier.wait()
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    assert len({id(shard) for shard in shards}) == 4
+
+
+def test_exited_workers_counts_kept(tmp_path):
+    # an earlier worker with this pid was killed before it retired
+    stale = Metrics(directory=str(tmp_path))
+    stale._pid = os.getpid()
+    record(stale)
+    stale.flush()
+    stale._pid = None
+
+    metrics = Metrics(directory=str(tmp_path))
+    record(metrics)
+    record(metrics)
+    assert requests(metrics.collect()) == 3
+
+    metrics.retire()
+    assert sorted(os.listdir(tmp_path)) == ["metrics-retired.json", "metrics.lock"]
+    with open(tmp_path / "metrics-retired.json") as f:
+        assert requests(json.load(f)) == 3
+    # a retired worker doesn't write its file again
+    metrics.flush()
+    assert requests(Metrics(directory=str(tmp_path)).collect()) == 3
@@ -0,0 +1,53 @@
+import falcon
+import falcon.testing
+
+import scaffolding
+from scaffolding.middleware import OpenApiAuthentication, OpenApiRequestValidation, RateLimiter
+from scaffolding.openapi import Specification
+from scaffolding.resources import autowire_resources, tag
+
+
+SPEC = {
+    "openapi": "3.0.0",
+    "info": {"title": "ratelimit", "version": "1"},
+    "paths": {
+        "/widgets": {
+            "get": {
+                "operationId": "listWidgets",
+                "security": [{"bearer": []}],
+                "responses": {"200": {"description": "ok"}},
+            },
+        },
+    },
+    "components": {"securitySchemes": {"bearer": {"type": "http", "scheme": "bearer"}}},
+}
+
+
+class Account:
+    """Like a model: loaded fresh for each request, with a repr that includes its address"""
+    def __init__(self, id: int) -> None:
+        self.id = id
+
+
+class Authentication(OpenApiAuthentication):
+    def get_token_principal(self, req, token):
+        return "account", Account(int(token))
+
+
+@tag(path="/widgets")
+class WidgetsResource:
+    def on_get(self, req, resp):
+        resp.media = []
+
+
+def test_model_principals_share_a_bucket():
+    spec = Specification(SPEC)
+    limiter = RateLimiter(spec, default={"rate": 0.001, "burst": 2})
+    api = falcon.API(middleware=[Authentication(spec), OpenApiRequestValidation(spec), limiter])
+    api.add_error_handler(scaffolding.error_handler)
+    autowire_resources(api, spec, [WidgetsResource()])
+    client = falcon.testing.TestClient(api)
+
+    statuses = [client.simulate_get("/widgets", headers={"Authorization": "Bearer 1"}).status for _ in range(3)]
+    assert statuses == [falcon.HTTP_200, falcon.HTTP_200, falcon.HTTP_429]
+    assert client.simulate_get("/widgets", headers={"Authorization": "Bearer 2"}).status == falcon.HTTP_200
@@ -0,0 +1,39 @@
+import decimal
+import json
+
+import pytest
+
+from scaffolding.openapi.serialization import compile_serializer, dumps
+
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "id": {"type": "integer"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+    },
+}
+
+
+def test_matches_json_dumps():
+    value = {"id": 1, "tags": ["a", "é"], "extra": None}
+    assert dumps(value) == json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    assert compile_serializer(SCHEMA)(value) == '{"id":1,"tags":["a","é"]}'
+
+
+@pytest.mark.parametrize("value", [decimal.Decimal("1.5"), {1, 2}, object()])
+def test_unknown_types_raise(value):
+    with pytest.raises(TypeError):
+        dumps({"id": value})
+    with pytest.raises(TypeError):
+        compile_serializer(SCHEMA)({"id": value, "tags": []})
+
+
+def test_cycles_raise():
+    cycle = []
+    cycle.append(cycle)
+    with pytest.raises(ValueError):
+        dumps(cycle)
+    # a failed call leaves nothing behind for the next one
+    shared = [1]
+    assert dumps([shared, shared]) == "[[1],[1]]"
@@ -0,0 +1,54 @@
+import falcon
+import falcon.testing
+
+from scaffolding.middleware import Metrics, OpenApiRequestValidation, RateLimiter, ResponseCache
+from scaffolding.openapi import Specification
+from scaffolding.resources import autowire_resources, tag
+from scaffolding.warmup import Warmup
+
+
+SPEC = {
+    "openapi": "3.0.0",
+    "info": {"title": "warmup", "version": "1"},
+    "paths": {
+        "/widgets": {
+            "get": {
+                "operationId": "listWidgets",
+                "responses": {"200": {"description": "ok"}},
+            },
+        },
+    },
+}
+
+
+@tag(path="/widgets")
+class WidgetsResource:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    @tag(cache={"ttl": 60})
+    def on_get(self, req, resp):
+        self.calls += 1
+        resp.media = []
+
+
+def test_replay_leaves_no_trace():
+    spec = Specification(SPEC)
+    metrics = Metrics()
+    limiter = RateLimiter(spec, default={"rate": 0.001, "burst": 1})
+    cache = ResponseCache(spec)
+    middleware = [metrics, OpenApiRequestValidation(spec), limiter, cache]
+    api = falcon.API(middleware=middleware)
+    resource = WidgetsResource()
+    autowire_resources(api, spec, [resource])
+
+    warmup = Warmup(api, spec, middleware, requests=3)
+    warmup.run()
+    # each replay reached the handler: not rate limited, not served from the cache
+    assert resource.calls == 3
+    assert metrics.snapshot()["requests"] == []
+
+    # the bucket is still full and the cache still empty
+    assert falcon.testing.TestClient(api).simulate_get("/widgets").status == falcon.HTTP_200
+    assert resource.calls == 4
+    assert metrics.snapshot()["requests"] == [["listWidgets", "200", 1]]